@@ -1,3 +1,4 @@
+import asyncio
 import json
 import os
 import requests
@@ -7,7 +8,8 @@ from typing import Type
 from pydantic import BaseModel, Field
 from crewai.tools import BaseTool
 import google.generativeai as genai
-from model_config import get_model_with_retry
+from model_config import get_model_with_retry, run_coroutine
+from deadlines import deadline, EMERGENCY_DEADLINE_SECONDS
 import urllib3
 
 # Disable SSL warnings
@@ -36,23 +38,25 @@ class AIVirtualDoctorTool(BaseTool):
     args_schema: Type[BaseModel] = AIVirtualDoctorInput
 
     def _run(self, patient_info: dict, emergency_type: str, symptoms: str, severity_level: str) -> str:
+        return run_coroutine(self._arun(patient_info, emergency_type, symptoms, severity_level))
+
+    async def _arun(self, patient_info: dict, emergency_type: str, symptoms: str, severity_level: str) -> str:
         try:
             print("🤖 AI VIRTUAL DOCTOR TOOL ACTIVATED")
             
-            # Generate AI doctor profile and avatar
-            doctor_profile = self._generate_ai_doctor_profile(emergency_type, severity_level)
-            
-            # Generate conversation script for the AI doctor
-            conversation_script = self._generate_conversation_script(patient_info, emergency_type, symptoms, severity_level)
-            
-            # Create video call setup with AI doctor
-            video_call_setup = self._create_ai_doctor_video_call(doctor_profile, conversation_script)
-            
-            # Generate real-time conversation responses
-            real_time_responses = self._generate_real_time_responses(patient_info, emergency_type, symptoms)
+            # All AI doctor content shares one time budget; steps that run out of it use their fallbacks
+            with deadline(EMERGENCY_DEADLINE_SECONDS):
+                # Doctor profile, conversation script, real-time responses and the
+                # ambulance decision are independent, so they are generated at once
+                doctor_profile, conversation_script, real_time_responses, ambulance_decision = await asyncio.gather(
+                    self._generate_ai_doctor_profile(emergency_type, severity_level),
+                    self._generate_conversation_script(patient_info, emergency_type, symptoms, severity_level),
+                    self._generate_real_time_responses(patient_info, emergency_type, symptoms),
+                    self._evaluate_ambulance_need(severity_level, emergency_type, symptoms)
+                )
             
-            # Determine if ambulance should be triggered
-            ambulance_decision = self._evaluate_ambulance_need(severity_level, emergency_type, symptoms)
+                # Create video call setup with AI doctor
+                video_call_setup = self._create_ai_doctor_video_call(doctor_profile, conversation_script)
             
             # Initialize AI voice speaker for speaking capability
             voice_speaker = None
@@ -113,10 +117,10 @@ class AIVirtualDoctorTool(BaseTool):
                 "message": "AI doctor setup failed. Please use phone consultation."
             })
 
-    def _generate_ai_doctor_profile(self, emergency_type: str, severity_level: str) -> dict:
+    async def _generate_ai_doctor_profile(self, emergency_type: str, severity_level: str) -> dict:
         """Generate AI doctor profile and avatar details"""
         try:
-            model = get_model_with_retry()
+            model = get_model_with_retry(hedge=True)
             
             prompt = f"""
             Create a professional AI doctor profile for emergency video consultation.
@@ -150,7 +154,7 @@ class AIVirtualDoctorTool(BaseTool):
             }}
             """
             
-            response = model.generate_content(prompt)
+            response = await model.generate_content_async(prompt)
             result_text = response.text.strip()
             
             try:
@@ -162,10 +166,10 @@ class AIVirtualDoctorTool(BaseTool):
             print(f"Error generating AI doctor profile: {e}")
             return self._get_fallback_doctor_profile()
 
-    def _generate_conversation_script(self, patient_info: dict, emergency_type: str, symptoms: str, severity_level: str) -> dict:
+    async def _generate_conversation_script(self, patient_info: dict, emergency_type: str, symptoms: str, severity_level: str) -> dict:
         """Generate AI doctor conversation script for video call"""
         try:
-            model = get_model_with_retry()
+            model = get_model_with_retry(hedge=True)
             
             prompt = f"""
             Create a concise, practical conversation script for an AI doctor in an emergency video consultation.
@@ -212,7 +216,7 @@ class AIVirtualDoctorTool(BaseTool):
             }}
             """
             
-            response = model.generate_content(prompt)
+            response = await model.generate_content_async(prompt)
             result_text = response.text.strip()
             
             print(f"🤖 GEMINI RESPONSE: {result_text[:200]}...")
@@ -266,10 +270,10 @@ class AIVirtualDoctorTool(BaseTool):
                 "error": str(e)
             }
 
-    def _generate_real_time_responses(self, patient_info: dict, emergency_type: str, symptoms: str) -> dict:
+    async def _generate_real_time_responses(self, patient_info: dict, emergency_type: str, symptoms: str) -> dict:
         """Generate real-time AI responses for dynamic conversation"""
         try:
-            model = get_model_with_retry()
+            model = get_model_with_retry(hedge=True)
             
             prompt = f"""
             Generate real-time AI doctor responses for emergency video consultation.
@@ -298,7 +302,7 @@ class AIVirtualDoctorTool(BaseTool):
             }}
             """
             
-            response = model.generate_content(prompt)
+            response = await model.generate_content_async(prompt)
             result_text = response.text.strip()
             
             try:
@@ -310,10 +314,10 @@ class AIVirtualDoctorTool(BaseTool):
             print(f"Error generating real-time responses: {e}")
             return self._get_fallback_responses()
 
-    def _evaluate_ambulance_need(self, severity_level: str, emergency_type: str, symptoms: str) -> dict:
+    async def _evaluate_ambulance_need(self, severity_level: str, emergency_type: str, symptoms: str) -> dict:
         """Evaluate if ambulance should be triggered based on emergency assessment"""
         try:
-            model = get_model_with_retry()
+            model = get_model_with_retry(hedge=True)
             
             prompt = f"""
             Evaluate if an ambulance should be called based on emergency assessment.
@@ -339,7 +343,7 @@ class AIVirtualDoctorTool(BaseTool):
             }}
             """
             
-            response = model.generate_content(prompt)
+            response = await model.generate_content_async(prompt)
             result_text = response.text.strip()
             
             try:
@@ -11,8 +11,8 @@ import asyncio
 import json
 import sys
 import os
-import time
 import urllib3
+import uuid
 from datetime import datetime
 
 # Fix SSL certificate issues
@@ -31,6 +31,18 @@ print("🔧 SSL certificate verification disabled for Windows compatibility.")
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), 'doccrew/research_crew/src/research_crew')))
 
 from crew import PatientCrew, Crew, Process
+from crewai.hooks import HookAborted, register_before_llm_call_hook, register_before_tool_call_hook
+from conversation_channel import ConversationChannel, ConversationClosedError, set_current_channel, current_channel
+from session_store import SessionStore
+from state_backend import create_state_backend
+from crew_executor import crew_executor, CrewQueueFullError
+from booking_jobs import BookingJobs
+from event_loop_monitor import event_loop_monitor, EventLoopMonitorMiddleware
+from model_config import MODEL_POOL
+from llm_cache import LLM_CACHE
+from doctor_repository import DOCTOR_REPOSITORY
+from priority_scheduler import ConversationPriority, set_current_priority, level_for_assessment, llm_gate
+from deadlines import set_deadline, CONVERSATION_DEADLINE_SECONDS
 from doccrew.research_crew.src.research_crew.tools.custom_tool import UserInputTool, SymptomSeverityTool
 from doccrew.research_crew.src.research_crew.tools.notification_tool import PushNotificationTool
 from doccrew.research_crew.src.research_crew.tools.emergency_tool import EmergencyResponseTool
@@ -102,39 +114,89 @@ schedule_existing_appointments()
 
 app = FastAPI()
 
+# Record event loop lag and whatever endpoint was running when the loop stalled
+app.add_middleware(EventLoopMonitorMiddleware, monitor=event_loop_monitor)
+
+@app.on_event("startup")
+async def start_event_loop_monitor():
+    await event_loop_monitor.start()
+
+@app.on_event("startup")
+async def enable_native_async_llm():
+    # Tools and routes await Gemini directly on this loop instead of blocking a thread per call
+    MODEL_POOL.enable_native_async()
+
+@app.on_event("shutdown")
+async def stop_event_loop_monitor():
+    await event_loop_monitor.stop()
+
 # Mount a directory for static files (CSS, JS)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # Mount audio files directory
 app.mount("/audio", StaticFiles(directory="."), name="audio")
 
-# In-memory storage for conversation state and crew results
-conversation_state = {}
-user_responses = {}
+# Conversation state, pending answers and AI doctor scripts live in a backend shared by all
+# workers (STATE_BACKEND=memory|sqlite|redis); entries are bounded and evicted when idle
+state_backend = create_state_backend()
+conversation_state = state_backend.namespace("conversation_state")
 
-# Store the latest AI doctor script per session (in-memory for now)
-ai_doctor_scripts = {}
+# AI doctor script per conversation for TTS
+ai_doctor_scripts = state_backend.namespace("ai_doctor_scripts")
+
+# Notification and reminder jobs started by /book-appointment
+booking_jobs = BookingJobs(state_backend.namespace("booking_jobs"))
+
+# Open question/answer channels for WebSockets held by this worker
+conversation_channels = SessionStore("conversation_channels", on_evict=lambda conversation_id, channel: channel.close())
 
 # Modify the UserInputTool to work with websockets
 class WebSocketUserInputTool(UserInputTool):
-    websocket: WebSocket = None
+    channel: ConversationChannel = None
     conversation_id: str = None
 
     def _run(self, question: str) -> str:
         print(f"[DEBUG] Asking user: {question} (conversation_id={self.conversation_id})")
-        # Send the question to the frontend
-        asyncio.run(self.websocket.send_text(json.dumps({"type": "question", "data": question})))
-        print(f"[DEBUG] Waiting for user response for conversation_id={self.conversation_id}")
-        # Wait for the user's response
-        while self.conversation_id not in user_responses:
-            time.sleep(0.1)  # Use regular sleep instead of async
-        # Retrieve and clear the response
-        response = user_responses.pop(self.conversation_id)
+        try:
+            # Send the question on the event loop and block this crew thread until /respond answers
+            response = self.channel.ask(question)
+        except ConversationClosedError as e:
+            return f"Error getting user input: {str(e)}"
         print(f"[DEBUG] Received user response for conversation_id={self.conversation_id}: {response}")
         return response
 
-# Create an instance of our modified tool
-websocket_user_input_tool = WebSocketUserInputTool()
+def stop_if_conversation_closed(*_):
+    """Abort the crew thread's next LLM or tool call once its conversation has been closed"""
+    channel = current_channel()
+    if channel is not None and channel.closed:
+        # HookAborted is not retried by the agent, so the whole crew stops here
+        raise HookAborted(f"Conversation {channel.conversation_id} was closed", source="conversation_channel")
+
+register_before_llm_call_hook(stop_if_conversation_closed)
+register_before_tool_call_hook(stop_if_conversation_closed)
+
+def create_session_crew(conversation_id: str, channel: ConversationChannel):
+    """Build a PatientCrew and base crew bound to one conversation's input tool"""
+    user_input_tool = WebSocketUserInputTool(channel=channel, conversation_id=conversation_id)
+    patient_crew_manager = PatientCrew(user_input_tool=user_input_tool)
+
+    base_crew = Crew(
+        agents=[
+            patient_crew_manager.patient_info_collector(),
+            patient_crew_manager.symptom_severity_analyzer(),
+            patient_crew_manager.emergency_response_agent(),  # Emergency agent (only activates for critical cases)
+            patient_crew_manager.doctor_recommender()
+        ],
+        tasks=[
+            patient_crew_manager.collect_info_task(),
+            patient_crew_manager.analyze_symptoms_task(),
+            patient_crew_manager.emergency_response_task(),  # Emergency task (only activates for critical cases)
+            patient_crew_manager.recommend_doctors_task()
+        ],
+        process=Process.sequential,
+        verbose=True
+    )
+    return patient_crew_manager, base_crew
 
 async def start_real_time_monitoring(websocket: WebSocket, conversation_id: str, emergency_response: dict):
     """Start real-time monitoring for emergency video call"""
@@ -173,7 +235,7 @@ async def monitor_emergency_session(websocket: WebSocket, conversation_id: str,
             await asyncio.sleep(monitoring_interval)
             
             # Check if conversation is still active
-            if conversation_id not in conversation_state:
+            if not await conversation_state.contains_async(conversation_id):
                 print(f"🔍 Conversation {conversation_id} ended, stopping monitoring")
                 break
             
@@ -212,6 +274,109 @@ async def monitor_emergency_session(websocket: WebSocket, conversation_id: str,
     except Exception as e:
         print(f"❌ Error in monitoring loop: {e}")
 
+# Keys under which each base crew task's result is stored, in task order
+BASE_CREW_TASK_KEYS = ["patient_info", "symptom_assessment", "emergency_response", "doctor_recommendations"]
+
+def parse_task_json(raw_output: str, fallback: dict) -> dict:
+    """Parse a task's raw output as JSON, extracting an embedded object if needed"""
+    try:
+        return json.loads(raw_output)
+    except json.JSONDecodeError as json_error:
+        print(f"🔍 DEBUG: JSON decode error: {json_error}")
+        import re
+        json_match = re.search(r'\{.*\}', raw_output, re.DOTALL)
+        if json_match:
+            try:
+                return json.loads(json_match.group())
+            except json.JSONDecodeError as extract_error:
+                print(f"🔍 DEBUG: Failed to parse extracted JSON: {extract_error}")
+        return fallback
+
+async def send_task_result(websocket: WebSocket, conversation_id: str, task_key: str, raw_output: str):
+    """Store one finished base crew task's result and push it to the client"""
+    if task_key == "patient_info":
+        print("✅ Task 1: Patient info collection completed")
+        await conversation_state.update_async(conversation_id, {"patient_info": raw_output})
+
+    elif task_key == "symptom_assessment":
+        print(f"🔍 DEBUG: Raw assessment output: {raw_output}")
+        symptom_assessment = parse_task_json(raw_output, {
+            "error": "Failed to parse assessment",
+            "severity": "Unknown",
+            "urgency": "Unknown",
+            "reasoning": "Could not parse assessment data"
+        })
+        await websocket.send_text(json.dumps({"type": "assessment", "data": symptom_assessment}))
+        print("✅ Task 2: Symptom assessment sent to frontend")
+        await conversation_state.update_async(conversation_id, {"symptom_assessment": symptom_assessment})
+
+    elif task_key == "emergency_response":
+        print(f"🚨 DEBUG: Raw emergency response output: {raw_output}")
+        emergency_response = parse_task_json(raw_output, {
+            "emergency_detected": False,
+            "error": "Failed to parse emergency response"
+        })
+        print(f"🚨 DEBUG: Parsed emergency response: {emergency_response}")
+        
+        # Check if emergency was detected
+        emergency_detected = emergency_response.get("emergency_detected", False)
+        print(f"🚨 DEBUG: Emergency detected: {emergency_detected}")
+        
+        if emergency_detected:
+            print("🚨 CRITICAL EMERGENCY DETECTED - Activating AI Virtual Doctor")
+            await websocket.send_text(json.dumps({"type": "emergency", "data": emergency_response}))
+            
+            # Send immediate emergency notification
+            emergency_notification = {
+                "type": "emergency_notification",
+                "data": {
+                    "message": f"🚨 CRITICAL EMERGENCY: {emergency_response.get('emergency_type', 'Medical Emergency')} detected! AI Virtual Doctor activated.",
+                    "ambulance_called": emergency_response.get("ambulance_called", False),
+                    "calming_guidance": emergency_response.get("calming_guidance", ""),
+                    "immediate_actions": emergency_response.get("immediate_actions", []),
+                    "emergency_contacts": emergency_response.get("emergency_contacts", {}),
+                    "ai_virtual_doctor_activated": True,
+                    "emergency_type": emergency_response.get("emergency_type", "Medical Emergency")
+                }
+            }
+            await websocket.send_text(json.dumps(emergency_notification))
+            
+            # Start real-time monitoring if video call is created
+            if emergency_response.get("video_call", {}).get("video_call_created", False):
+                await start_real_time_monitoring(websocket, conversation_id, emergency_response)
+            
+            # Store emergency response
+            await conversation_state.update_async(conversation_id, {"emergency_response": emergency_response})
+            
+            # Continue with normal workflow but inform user about emergency
+            await websocket.send_text(json.dumps({
+                "type": "emergency_workflow_continue",
+                "data": "Critical emergency detected. AI Virtual Doctor activated. Continuing with doctor recommendations..."
+            }))
+        else:
+            print("✅ No critical emergency detected - AI Virtual Doctor not activated")
+            await websocket.send_text(json.dumps({
+                "type": "no_emergency",
+                "data": {
+                    "message": "No critical emergency detected. AI Virtual Doctor is only available for life-threatening emergencies.",
+                    "ai_virtual_doctor_activated": False,
+                    "recommended_action": "Continue with normal consultation workflow"
+                }
+            }))
+
+    elif task_key == "doctor_recommendations":
+        # Doctor recommendations are ALWAYS displayed regardless of emergency
+        print(f"🔍 DEBUG: Raw recommendations output: {raw_output}")
+        doctor_recommendations = parse_task_json(raw_output, {
+            "error": "Failed to parse recommendations",
+            "recommended_doctors": [],
+            "message": "We couldn't find valid doctor recommendations. Please try again."
+        })
+        print(f"🔍 DEBUG: Final recommendations object: {doctor_recommendations}")
+        await websocket.send_text(json.dumps({"type": "recommendations", "data": doctor_recommendations}))
+        print("✅ Task 4: Doctor recommendations sent to frontend")
+        await conversation_state.update_async(conversation_id, {"doctor_recommendations": doctor_recommendations})
+
 @app.get("/")
 async def get():
     with open("index.html") as f:
@@ -220,197 +385,77 @@ async def get():
 @app.websocket("/ws/{conversation_id}")
 async def websocket_endpoint(websocket: WebSocket, conversation_id: str):
     await websocket.accept()
-    conversation_state[conversation_id] = {"status": "running"}
     
-    websocket_user_input_tool.websocket = websocket
-    websocket_user_input_tool.conversation_id = conversation_id
+    # Kick the crew off exactly once per conversation, even if the client reconnects or two sockets race
+    if not await conversation_state.claim_async(conversation_id, "crew_started", {"status": "running"}):
+        await websocket.send_text(json.dumps({"type": "error", "data": f"Conversation {conversation_id} has already been started"}))
+        await websocket.close()
+        return
+    # Answers queued for an earlier attempt at this conversation must not reach the new crew
+    await asyncio.to_thread(state_backend.clear_responses, conversation_id)
+    
+    channel = ConversationChannel(websocket, asyncio.get_running_loop(), conversation_id, backend=state_backend)
+    conversation_channels[conversation_id] = channel
+    # Lets the crew threads notice when this conversation is closed and stop calling the LLM
+    set_current_channel(channel)
+    
+    # Every crew run and LLM call made for this conversation is queued at this priority
+    priority = ConversationPriority(conversation_id)
+    set_current_priority(priority)
+    # ...and bounded by the conversation's deadline, which tools can only tighten
+    set_deadline(CONVERSATION_DEADLINE_SECONDS)
     
     try:
-        patient_crew_manager = PatientCrew()
-        
-        # Configure all agents to use WebSocket user input tool
-        patient_info_collector_agent = patient_crew_manager.patient_info_collector()
-        patient_info_collector_agent.tools = [websocket_user_input_tool, patient_crew_manager.patient_info_collector().tools[1]]
-        
-        appointment_booking_agent = patient_crew_manager.appointment_booking_agent()
-        appointment_booking_agent.tools = [websocket_user_input_tool, appointment_booking_agent.tools[1]]
-        
-        # Create a crew with emergency response included (but only for genuine emergencies)
-        # We'll create two different crews based on whether emergency is detected
-        base_crew = Crew(
-            agents=[
-                patient_crew_manager.patient_info_collector(),
-                patient_crew_manager.symptom_severity_analyzer(),
-                patient_crew_manager.emergency_response_agent(),  # Emergency agent (only activates for critical cases)
-                patient_crew_manager.doctor_recommender()
-            ],
-            tasks=[
-                patient_crew_manager.collect_info_task(),
-                patient_crew_manager.analyze_symptoms_task(),
-                patient_crew_manager.emergency_response_task(),  # Emergency task (only activates for critical cases)
-                patient_crew_manager.recommend_doctors_task()
-            ],
-            process=Process.sequential,
-            verbose=True
-        )
-        
-        # Configure the agents in the base crew to use WebSocket tools
-        base_crew.agents[0].tools = [websocket_user_input_tool, base_crew.agents[0].tools[1]]  # Patient info collector
+        # Each conversation gets its own crew with agents bound to its own input tool
+        patient_crew_manager, base_crew = create_session_crew(conversation_id, channel)
 
-        # Run the base workflow first
-        print("🤖 Starting base workflow (patient info, symptom analysis, emergency response, doctor recommendations)...")
-        crew_result = await asyncio.to_thread(base_crew.kickoff)
-        
+        # Push each task's result to the client the moment that task finishes
+        loop = asyncio.get_running_loop()
+        task_results = asyncio.Queue()
 
+        def on_task_done(task_key: str, output):
+            stop_if_conversation_closed()
+            # Runs in the crew thread, so a High/Urgent assessment escalates before the next task's LLM calls
+            if task_key == "symptom_assessment":
+                priority.escalate(level_for_assessment(parse_task_json(output.raw, {})), "symptom assessment")
+            loop.call_soon_threadsafe(task_results.put_nowait, (task_key, output.raw))
 
+        for task_key, crew_task in zip(BASE_CREW_TASK_KEYS, base_crew.tasks):
+            crew_task.callback = lambda output, task_key=task_key: on_task_done(task_key, output)
 
-        crew_result = await asyncio.to_thread(base_crew.kickoff)
+        async def notify_queue_position(position: int):
+            await websocket.send_text(json.dumps({
+                "type": "queue_position",
+                "data": {
+                    "position": position,
+                    "message": f"All our assistants are busy right now. You are number {position} in line."
+                }
+            }))
 
-        # Extract and send results from all tasks
-        if crew_result.tasks_output:
+        print("🤖 Starting base workflow (patient info, symptom analysis, emergency response, doctor recommendations)...")
+        crew_run = asyncio.ensure_future(crew_executor.run(base_crew.kickoff, on_queued=notify_queue_position, priority=priority))
+        # Task callbacks are posted before kickoff returns, so this sentinel always arrives last
+        crew_run.add_done_callback(lambda _: task_results.put_nowait((None, None)))
+
+        while True:
+            task_key, raw_output = await task_results.get()
+            if task_key is None:
+                break
             try:
-                print(f"🤖 Processing {len(crew_result.tasks_output)} task outputs...")
-                
-                # Task 1: Patient Info Collection
-                if len(crew_result.tasks_output) > 0:
-                    print("✅ Task 1: Patient info collection completed")
-                    conversation_state[conversation_id]["patient_info"] = crew_result.tasks_output[0].raw
-                
-                # Task 2: Symptom Assessment
-                if len(crew_result.tasks_output) > 1:
-                    assessment_str = crew_result.tasks_output[1].raw
-                    print(f"🔍 DEBUG: Raw assessment output: {assessment_str}")
-                    
-                    try:
-                        symptom_assessment = json.loads(assessment_str)
-                    except json.JSONDecodeError:
-                        import re
-                        json_match = re.search(r'\{.*\}', assessment_str, re.DOTALL)
-                        if json_match:
-                            symptom_assessment = json.loads(json_match.group())
-                        else:
-                            symptom_assessment = {
-                                "error": "Failed to parse assessment",
-                                "severity": "Unknown",
-                                "urgency": "Unknown",
-                                "reasoning": "Could not parse assessment data"
-                            }
-                    
-                    await websocket.send_text(json.dumps({"type": "assessment", "data": symptom_assessment}))
-                    print("✅ Task 2: Symptom assessment sent to frontend")
-                    conversation_state[conversation_id]["symptom_assessment"] = symptom_assessment
-                
-                # Task 3: Emergency Response (index 2)
-                if len(crew_result.tasks_output) > 2:
-                    emergency_str = crew_result.tasks_output[2].raw
-                    print(f"🚨 DEBUG: Raw emergency response output: {emergency_str}")
-                    
-                    try:
-                        emergency_response = json.loads(emergency_str)
-                    except json.JSONDecodeError:
-                        import re
-                        json_match = re.search(r'\{.*\}', emergency_str, re.DOTALL)
-                        if json_match:
-                            emergency_response = json.loads(json_match.group())
-                        else:
-                            emergency_response = {
-                                "emergency_detected": False,
-                                "error": "Failed to parse emergency response"
-                            }
-                    
-                    print(f"🚨 DEBUG: Parsed emergency response: {emergency_response}")
-                    
-                    # Check if emergency was detected
-                    emergency_detected = emergency_response.get("emergency_detected", False)
-                    print(f"🚨 DEBUG: Emergency detected: {emergency_detected}")
-                    
-                    if emergency_detected:
-                        print("🚨 CRITICAL EMERGENCY DETECTED - Activating AI Virtual Doctor")
-                        await websocket.send_text(json.dumps({"type": "emergency", "data": emergency_response}))
-                        
-                        # Send immediate emergency notification
-                        emergency_notification = {
-                            "type": "emergency_notification",
-                            "data": {
-                                "message": f"🚨 CRITICAL EMERGENCY: {emergency_response.get('emergency_type', 'Medical Emergency')} detected! AI Virtual Doctor activated.",
-                                "ambulance_called": emergency_response.get("ambulance_called", False),
-                                "calming_guidance": emergency_response.get("calming_guidance", ""),
-                                "immediate_actions": emergency_response.get("immediate_actions", []),
-                                "emergency_contacts": emergency_response.get("emergency_contacts", {}),
-                                "ai_virtual_doctor_activated": True,
-                                "emergency_type": emergency_response.get("emergency_type", "Medical Emergency")
-                            }
-                        }
-                        await websocket.send_text(json.dumps(emergency_notification))
-                        
-                        # Start real-time monitoring if video call is created
-                        if emergency_response.get("video_call", {}).get("video_call_created", False):
-                            await start_real_time_monitoring(websocket, conversation_id, emergency_response)
-                        
-                        # Store emergency response
-                        conversation_state[conversation_id]["emergency_response"] = emergency_response
-                        
-                        # Continue with normal workflow but inform user about emergency
-                        await websocket.send_text(json.dumps({
-                            "type": "emergency_workflow_continue",
-                            "data": "Critical emergency detected. AI Virtual Doctor activated. Continuing with doctor recommendations..."
-                        }))
-                    else:
-                        print("✅ No critical emergency detected - AI Virtual Doctor not activated")
-                        await websocket.send_text(json.dumps({
-                            "type": "no_emergency",
-                            "data": {
-                                "message": "No critical emergency detected. AI Virtual Doctor is only available for life-threatening emergencies.",
-                                "ai_virtual_doctor_activated": False,
-                                "recommended_action": "Continue with normal consultation workflow"
-                            }
-                        }))
-                
-                # Task 4: Doctor Recommendations (index 3) - ALWAYS display regardless of emergency
-                if len(crew_result.tasks_output) > 3:
-                    print(f"🔍 DEBUG: Processing Doctor Recommendations task (index 3)")
-                    recommendations_str = crew_result.tasks_output[3].raw
-                    print(f"🔍 DEBUG: Raw recommendations output: {recommendations_str}")
-                    
-                    try:
-                        doctor_recommendations = json.loads(recommendations_str)
-                    except json.JSONDecodeError as json_error:
-                        print(f"🔍 DEBUG: JSON decode error: {json_error}")
-                        import re
-                        json_match = re.search(r'\{.*\}', recommendations_str, re.DOTALL)
-                        if json_match:
-                            try:
-                                doctor_recommendations = json.loads(json_match.group())
-                                print(f"🔍 DEBUG: Successfully extracted JSON from text")
-                            except json.JSONDecodeError as extract_error:
-                                print(f"🔍 DEBUG: Failed to parse extracted JSON: {extract_error}")
-                                doctor_recommendations = {
-                                    "error": "Failed to parse recommendations",
-                                    "recommended_doctors": [],
-                                    "message": "We couldn't find valid doctor recommendations. Please try again."
-                                }
-                        else:
-                            print(f"🔍 DEBUG: No JSON pattern found in text")
-                            doctor_recommendations = {
-                                "error": "No valid recommendations format found",
-                                "recommended_doctors": [],
-                                "message": "We couldn't find valid doctor recommendations. Please try again."
-                            }
-                    
-                    print(f"🔍 DEBUG: Final recommendations object: {doctor_recommendations}")
-                    await websocket.send_text(json.dumps({"type": "recommendations", "data": doctor_recommendations}))
-                    print("✅ Task 5: Doctor recommendations sent to frontend")
-                    conversation_state[conversation_id]["doctor_recommendations"] = doctor_recommendations
-                else:
-                    print(f"🔍 DEBUG: No doctor recommendations task found - tasks_output length: {len(crew_result.tasks_output)}")
-                
+                await send_task_result(websocket, conversation_id, task_key, raw_output)
+            except WebSocketDisconnect:
+                raise
             except Exception as e:
-                print(f"❌ Error extracting data from crew result: {e}")
+                print(f"❌ Error extracting data from {task_key} task: {e}")
                 import traceback
                 traceback.print_exc()
+
+        # Surface any error raised by the crew itself
+        await crew_run
         
         # Check if emergency was detected to provide appropriate completion message
-        emergency_detected = conversation_state[conversation_id].get("emergency_response", {}).get("emergency_detected", False)
+        session_state = await conversation_state.get_async(conversation_id, {})
+        emergency_detected = session_state.get("emergency_response", {}).get("emergency_detected", False)
         
         # If emergency was detected, create AI Virtual Doctor
         if emergency_detected:
@@ -430,7 +475,7 @@ async def websocket_endpoint(websocket: WebSocket, conversation_id: str):
             
             try:
                 # Run AI Virtual Doctor task
-                ai_doctor_result = await asyncio.to_thread(ai_doctor_crew.kickoff)
+                ai_doctor_result = await crew_executor.run(ai_doctor_crew.kickoff, priority=priority)
                 
                 if ai_doctor_result.tasks_output and len(ai_doctor_result.tasks_output) > 0:
                     ai_doctor_str = ai_doctor_result.tasks_output[0].raw
@@ -464,7 +509,7 @@ async def websocket_endpoint(websocket: WebSocket, conversation_id: str):
                                     script_parts.append(str(value))
                             
                             full_script = "\n".join(script_parts)
-                            ai_doctor_scripts["latest"] = full_script
+                            await ai_doctor_scripts.set_async(conversation_id, full_script)
                             print(f"📝 AI Doctor script stored for TTS: {full_script[:100]}...")
                             print(f"📝 Full script length: {len(full_script)} characters")
                         
@@ -473,7 +518,7 @@ async def websocket_endpoint(websocket: WebSocket, conversation_id: str):
                             "type": "ai_virtual_doctor_ready",
                             "data": {
                                 "doctor_name": ai_doctor_data.get("doctor_profile", {}).get("doctor_name", "Dr. Sarah Chen"),
-                                "emergency_type": emergency_response.get("emergency_type", "Medical Emergency")
+                                "emergency_type": session_state["emergency_response"].get("emergency_type", "Medical Emergency")
                             }
                         }))
                         print("✅ AI Virtual Doctor ready message sent to frontend")
@@ -491,31 +536,66 @@ async def websocket_endpoint(websocket: WebSocket, conversation_id: str):
             completion_message = "Patient info, symptom analysis, and doctor recommendations completed. No critical emergency detected - AI Virtual Doctor is only available for life-threatening emergencies. Ready for appointment booking."
         
         await websocket.send_text(json.dumps({"type": "initial_workflow_complete", "data": completion_message}))
+        # Keep the state for booking; the session store evicts it once the conversation goes idle
+        await conversation_state.update_async(conversation_id, {"status": "completed"})
 
     except WebSocketDisconnect:
         print(f"Client #{conversation_id} disconnected")
+    except CrewQueueFullError as e:
+        print(f"🚦 Rejected conversation {conversation_id}: {e}")
+        await websocket.send_text(json.dumps({
+            "type": "busy",
+            "data": "All our assistants are busy and the waiting line is full. Please try again in a few minutes. If this is an emergency, call 108 now."
+        }))
+        # Allow the patient to retry the same conversation later
+        await conversation_state.pop_async(conversation_id)
     except Exception as e:
+        if channel.closed:
+            # The crew was stopped because the client went away, so there is nobody left to tell
+            print(f"Client #{conversation_id} disconnected, crew stopped: {e}")
+            return
         print(f"Error in websocket for client #{conversation_id}: {e}")
+        # Do NOT delete conversation_state here, but let the patient start the crew again
+        await conversation_state.update_async(conversation_id, {"status": "failed", "crew_started": False})
         await websocket.send_text(json.dumps({"type": "error", "data": str(e)}))
-        # Do NOT delete conversation_state or user_responses here
     finally:
-        # Only clean up state if the conversation is truly finished (not on error)
-        if conversation_id in conversation_state and conversation_state[conversation_id].get('status') == 'finished':
-            del conversation_state[conversation_id]
-        if conversation_id in user_responses and conversation_state.get(conversation_id, {}).get('status') == 'finished':
-            del user_responses[conversation_id]
-        print(f"Conversation {conversation_id} ended (if finished).")
+        # Release a crew thread that may still be waiting for an answer
+        channel.close()
+        if conversation_channels.get(conversation_id) is channel:
+            conversation_channels.pop(conversation_id)
+        print(f"Conversation {conversation_id} ended.")
 
 @app.post("/respond/{conversation_id}")
 async def respond(conversation_id: str, response: dict):
     print(f"[DEBUG] /respond received for conversation_id={conversation_id}: {response.get('message')}")
-    user_responses[conversation_id] = response.get("message")
+    # The crew waiting for this answer may be running on another worker
+    if not await conversation_state.contains_async(conversation_id):
+        return {"status": "error", "message": f"No active conversation {conversation_id}"}
+    await asyncio.to_thread(state_backend.push_response, conversation_id, response.get("message", ""))
     return {"status": "received"}
 
+def load_patient_file() -> dict:
+    """Read patient_info.json, unwrapping the nested 'current' format (blocking; run off the event loop)"""
+    if not os.path.exists('patient_info.json'):
+        return None
+    with open('patient_info.json', 'r') as f:
+        patient_data = json.load(f)
+    if isinstance(patient_data, dict) and 'name' not in patient_data:
+        if 'current' in patient_data and isinstance(patient_data['current'], dict):
+            return patient_data['current']
+    return patient_data
+
+def save_json_file(path: str, data: dict):
+    """Write data to a JSON file (blocking; run off the event loop)"""
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
 @app.post("/book-appointment")
 async def book_appointment(booking_request: dict):
     """
-    New endpoint to handle booking with guaranteed notification
+    New endpoint to handle booking with guaranteed notification.
+    Confirms the appointment right away; the notification and reminder run as a
+    background job whose progress is available from /booking-status/{job_id}.
     """
     try:
         print(f"📋 Received booking request: {booking_request}")
@@ -532,8 +612,9 @@ async def book_appointment(booking_request: dict):
         patient_contact = None
         
         # Try to get patient info from conversation state first
-        if conversation_id and conversation_id in conversation_state:
-            stored_patient_info = conversation_state[conversation_id].get("patient_info")
+        session_state = await conversation_state.get_async(conversation_id) if conversation_id else None
+        if session_state is not None:
+            stored_patient_info = session_state.get("patient_info")
             if stored_patient_info:
                 try:
                     if isinstance(stored_patient_info, str):
@@ -550,22 +631,15 @@ async def book_appointment(booking_request: dict):
         # Fallback to stored patient info file
         if not patient_name:
             try:
-                if os.path.exists('patient_info.json'):
-                    with open('patient_info.json', 'r') as f:
-                        patient_data = json.load(f)
-                        if isinstance(patient_data, dict):
-                            if 'name' in patient_data:
-                                patient_name = patient_data['name']
-                                patient_contact = patient_data.get('contact')
-                            elif 'current' in patient_data and isinstance(patient_data['current'], dict):
-                                patient_name = patient_data['current'].get('name')
-                                patient_contact = patient_data['current'].get('contact')
+                patient_data = await asyncio.to_thread(load_patient_file)
+                if isinstance(patient_data, dict):
+                    patient_name = patient_data.get('name')
+                    patient_contact = patient_data.get('contact')
                     print(f"✅ Retrieved patient info from file: {patient_name}, {patient_contact}")
             except Exception as e:
                 print(f"⚠️ Could not read patient info from file: {e}")
         
         # Generate appointment ID
-        import uuid
         appointment_id = f"APT{uuid.uuid4().hex[:8].upper()}"
         
         # Create appointment booking object - only include fields that have valid data
@@ -587,84 +661,70 @@ async def book_appointment(booking_request: dict):
         if patient_contact and patient_contact.strip():
             appointment_booking["patient_contact"] = patient_contact
         
-        # Send notification using the PushNotificationTool
-        notification_tool = PushNotificationTool()
         notification_message = f"Your appointment with {doctor_name} has been confirmed for {appointment_date} at {doctor_hospital}. Please arrive 15 minutes early. Appointment ID: {appointment_id}"
-        
-        print(f"📱 Sending guaranteed notification: {notification_message}")
-        notification_result = notification_tool._run(notification_message)
-        
-        # Parse notification result
-        try:
-            notification_json = json.loads(notification_result)
-            appointment_booking["notification_sent"] = notification_json.get("notification_sent", False)
-            appointment_booking["notification_message"] = notification_message
-            if notification_json.get("error"):
-                appointment_booking["notification_error"] = notification_json.get("error")
-        except json.JSONDecodeError:
-            appointment_booking["notification_sent"] = False
-            appointment_booking["notification_error"] = "Failed to parse notification result"
+        appointment_booking["notification_message"] = notification_message
         
         # Save appointment to file
         try:
-            import os
             appointments_file = 'appointment_booking.json'
-            with open(appointments_file, 'w') as f:
-                json.dump(appointment_booking, f, indent=2)
+            await asyncio.to_thread(save_json_file, appointments_file, appointment_booking)
             print(f"✅ Appointment saved to {appointments_file}")
         except Exception as e:
             print(f"❌ Failed to save appointment: {e}")
         
+        # The appointment is confirmed; notification and reminder follow as background jobs
+        job = await booking_jobs.create(appointment_id, conversation_id)
+        job_id = job["job_id"]
+        
+        # Send notification using the PushNotificationTool
+        notification_tool = PushNotificationTool()
+        print(f"📱 Queueing guaranteed notification: {notification_message}")
+        booking_jobs.run_step(
+            job_id, "notification", notification_tool._run, notification_message,
+            succeeded=lambda result: isinstance(result, dict) and result.get("notification_sent", False)
+        )
+        
         # 🔑 AUTOMATICALLY SCHEDULE REMINDER
+        print(f"🔔 Automatically scheduling reminder for appointment {appointment_id}")
+        
+        # Get patient data from patient_info.json if it exists
+        patient_data = {}
         try:
-            print(f"🔔 Automatically scheduling reminder for appointment {appointment_id}")
-            
-            # Get patient data from patient_info.json if it exists
-            patient_data = {}
-            try:
-                if os.path.exists('patient_info.json'):
-                    with open('patient_info.json', 'r') as f:
-                        patient_data = json.load(f)
-                        # Extract actual patient data if it exists
-                        if isinstance(patient_data, dict):
-                            if 'name' in patient_data:
-                                # Direct format
-                                pass
-                            elif 'current' in patient_data and isinstance(patient_data['current'], dict):
-                                # Nested format
-                                patient_data = patient_data['current']
-                else:
-                    # Create minimal patient data only if we have actual patient info
-                    if patient_name and patient_name.strip():
-                        patient_data = {
-                            "name": patient_name,
-                            "location": "Pune"
-                        }
-                        if patient_contact and patient_contact.strip():
-                            patient_data["contact"] = patient_contact
-            except Exception as e:
-                print(f"⚠️ Could not load patient data: {e}")
-                # Only create patient data if we have actual patient info
+            stored_patient_data = await asyncio.to_thread(load_patient_file)
+            if stored_patient_data is not None:
+                patient_data = stored_patient_data
+            else:
+                # Create minimal patient data only if we have actual patient info
                 if patient_name and patient_name.strip():
-                    patient_data = {"name": patient_name}
+                    patient_data = {
+                        "name": patient_name,
+                        "location": "Pune"
+                    }
                     if patient_contact and patient_contact.strip():
                         patient_data["contact"] = patient_contact
-            
-            # Schedule the reminder automatically
-            from doccrew.research_crew.src.research_crew.tools.reminder_tool import CompleteReminderTool
-            reminder_tool = CompleteReminderTool()
-            reminder_result = reminder_tool._run(appointment_booking, patient_data)
-            
-            print(f"✅ Reminder automatically scheduled: {reminder_result}")
-            
         except Exception as e:
-            print(f"❌ Failed to schedule reminder automatically: {e}")
+            print(f"⚠️ Could not load patient data: {e}")
+            # Only create patient data if we have actual patient info
+            if patient_name and patient_name.strip():
+                patient_data = {"name": patient_name}
+                if patient_contact and patient_contact.strip():
+                    patient_data["contact"] = patient_contact
+        
+        # The reminder tool updates the appointment it is given, so hand it a copy
+        from doccrew.research_crew.src.research_crew.tools.reminder_tool import CompleteReminderTool
+        reminder_tool = CompleteReminderTool()
+        booking_jobs.run_step(
+            job_id, "reminder", reminder_tool._run, dict(appointment_booking), patient_data,
+            succeeded=lambda result: isinstance(result, dict) and result.get("reminder_scheduled", False)
+        )
         
-        print(f"✅ Booking completed with notification status: {appointment_booking['notification_sent']}")
+        print(f"✅ Booking {appointment_id} confirmed; follow-up job {job_id} started")
         return {
             "status": "success",
             "appointment": appointment_booking,
-            "message": "Appointment booked successfully and reminder scheduled!"
+            "job_id": job_id,
+            "job_status_url": f"/booking-status/{job_id}",
+            "message": "Appointment booked successfully! Your confirmation and reminder are on their way."
         }
         
     except Exception as e:
@@ -674,6 +734,55 @@ async def book_appointment(booking_request: dict):
             "message": f"Failed to book appointment: {str(e)}"
         }
 
+@app.get("/booking-status/{job_id}")
+async def booking_status(job_id: str):
+    """Status of the notification and reminder jobs for a booking"""
+    job = await booking_jobs.get(job_id)
+    if job is None:
+        return {"status": "error", "message": f"No booking job {job_id}"}
+    return {"status": "success", "job": job}
+
+@app.get("/diagnostics/event-loop")
+async def event_loop_diagnostics():
+    """Event loop lag percentiles and the most recent stalls with the stack that caused them"""
+    return event_loop_monitor.stats()
+
+@app.get("/metrics/sessions")
+async def session_metrics():
+    """Live and evicted session counters for the state backend and this worker's channels"""
+    return {
+        "state_backend": state_backend.stats(),
+        "conversation_channels": conversation_channels.stats()
+    }
+
+@app.get("/metrics/crew")
+async def crew_metrics():
+    """Crew pool occupancy, admission counters and queue-wait percentiles"""
+    return crew_executor.stats()
+
+@app.get("/metrics/models")
+async def model_metrics():
+    """Health of each Gemini model handle: error rate, last overload and latency EWMA"""
+    return MODEL_POOL.stats()
+
+@app.get("/metrics/llm-cache")
+async def llm_cache_metrics():
+    """Hit/miss counters per prompt family for the LLM response cache"""
+    return LLM_CACHE.stats()
+
+@app.get("/metrics/doctor-catalog")
+async def doctor_catalog_metrics():
+    """Size, reload counters and lookups per fallback stage for the doctor repository"""
+    return DOCTOR_REPOSITORY.stats()
+
+@app.get("/metrics/priority")
+async def priority_metrics():
+    """Per-priority latency for crew admission and Gemini calls"""
+    return {
+        "crew_queue_wait_ms": crew_executor.stats()["queue_wait_ms_by_priority"],
+        "llm": llm_gate.stats()
+    }
+
 @app.post("/store_ai_script")
 async def store_ai_script(request: dict):
     """Store AI doctor script for later use"""
@@ -682,9 +791,11 @@ async def store_ai_script(request: dict):
         script = data.get("script", "")
         
         if script:
-            ai_doctor_scripts["latest"] = script
-            print(f"✅ Script stored successfully: {len(script)} characters")
-            return {"status": "success", "message": "Script stored successfully"}
+            # Older clients don't send a conversation id, so give their script its own entry
+            conversation_id = data.get("conversation_id") or f"script-{uuid.uuid4().hex[:8]}"
+            await ai_doctor_scripts.set_async(conversation_id, script)
+            print(f"✅ Script stored successfully for {conversation_id}: {len(script)} characters")
+            return {"status": "success", "message": "Script stored successfully", "conversation_id": conversation_id}
         else:
             return {"status": "error", "message": "No script provided"}
             
@@ -701,8 +812,13 @@ async def start_ai_doctor_call(request: dict):
         
         print(f"👨‍⚕️ AI Doctor consultation requested: {call_type} with {doctor_name}")
         
-        # Get the stored script
-        script = ai_doctor_scripts.get("latest")
+        # Get the stored script for this conversation, or the most recent one for older clients
+        conversation_id = data.get("conversation_id")
+        if conversation_id:
+            script = await ai_doctor_scripts.get_async(conversation_id)
+        else:
+            most_recent = await ai_doctor_scripts.most_recent_async()
+            script = most_recent[1] if most_recent else None
         print(f"📝 Retrieved script: {'Available' if script else 'Not available'}")
         
         if not script:
@@ -728,7 +844,8 @@ async def start_ai_doctor_call(request: dict):
             
             # Generate audio file dynamically (same as test file)
             voice_speaker = AIVoiceSpeakerTool()
-            audio_result = voice_speaker._generate_speech_audio(script, doctor_profile)
+            # gTTS synthesis blocks for seconds, so run it in a worker thread
+            audio_result = await asyncio.to_thread(voice_speaker._generate_speech_audio, script, doctor_profile)
             
             if audio_result.get("audio_file"):
                 audio_filename = audio_result["audio_file"]
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Background jobs that deliver booking notifications and schedule reminders after an appointment is confirmed
+"""
+
+import asyncio
+import contextvars
+import json
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# Overall job status once every step has finished
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+# Threads for job steps, kept apart from the default executor that request handlers use for file and state I/O
+BOOKING_JOB_WORKERS = int(os.getenv("BOOKING_JOB_WORKERS", "8"))
+
+
+def _with_step(job: dict, step: str, fields: dict):
+    """Merge fields into one step of a job record and recompute the job's overall status"""
+    if job is None:
+        return None
+    job["steps"].setdefault(step, {}).update(fields)
+    statuses = [s["status"] for s in job["steps"].values()]
+    if all(status in (JOB_COMPLETED, JOB_FAILED) for status in statuses):
+        job["status"] = JOB_COMPLETED if all(status == JOB_COMPLETED for status in statuses) else JOB_FAILED
+    else:
+        job["status"] = "running"
+    return job
+
+
+class BookingJobs:
+    """Tracks the follow-up work for each booked appointment.
+
+    A job is a set of named steps (e.g. notification, reminder). Each step's
+    blocking call runs on the jobs' own thread pool as a background task on
+    this worker's event loop, while the job record lives in a state backend
+    namespace so its status can be read from any worker. Steps finishing
+    together update the record atomically through the backend's modify().
+    """
+
+    def __init__(self, store, max_workers: int = None):
+        self.store = store
+        # Slow notification and reminder calls must not starve the bookings being confirmed
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or BOOKING_JOB_WORKERS, thread_name_prefix="booking-job")
+        self._tasks = set()
+        self.created = 0
+        self.steps_completed = 0
+        self.steps_failed = 0
+
+    async def create(self, appointment_id: str, conversation_id: str = None, steps=("notification", "reminder")) -> dict:
+        """Record a new job with all steps pending"""
+        job = {
+            "job_id": f"JOB{uuid.uuid4().hex[:8].upper()}",
+            "appointment_id": appointment_id,
+            "conversation_id": conversation_id,
+            "status": "pending",
+            "created_at": datetime.now().isoformat(),
+            "steps": {step: {"status": "pending"} for step in steps}
+        }
+        await self.store.set_async(job["job_id"], job)
+        self.created += 1
+        return job
+
+    async def get(self, job_id: str) -> dict:
+        return await self.store.get_async(job_id)
+
+    def run_step(self, job_id: str, step: str, fn, *args, succeeded=None):
+        """Run fn(*args) on the job thread pool as one step of the job.
+
+        The step's JSON result is stored on the job; succeeded is an optional
+        predicate over that result deciding whether the step completed or failed.
+        """
+        task = asyncio.ensure_future(self._run_step(job_id, step, fn, args, succeeded))
+        # Keep a reference so the task isn't garbage collected mid-flight
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run_step(self, job_id: str, step: str, fn, args, succeeded):
+        await self._update_step(job_id, step, {"status": "running", "started_at": datetime.now().isoformat()})
+        try:
+            context = contextvars.copy_context()
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, context.run, fn, *args)
+            if isinstance(result, str):
+                try:
+                    result = json.loads(result)
+                except json.JSONDecodeError:
+                    pass
+            ok = succeeded(result) if succeeded else True
+            fields = {"status": JOB_COMPLETED if ok else JOB_FAILED, "result": result}
+        except Exception as e:
+            print(f"❌ Booking job {job_id} step {step} failed: {e}")
+            fields = {"status": JOB_FAILED, "error": str(e)}
+
+        if fields["status"] == JOB_COMPLETED:
+            self.steps_completed += 1
+        else:
+            self.steps_failed += 1
+        fields["finished_at"] = datetime.now().isoformat()
+        await self._update_step(job_id, step, fields)
+        print(f"📬 Booking job {job_id}: {step} {fields['status']}")
+
+    async def _update_step(self, job_id: str, step: str, fields: dict):
+        await self.store.modify_async(job_id, lambda job: _with_step(job, step, fields))
+
+    async def drain(self):
+        """Wait for every job step started on this worker to finish"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "jobs_created": self.created,
+            "steps_in_flight": len(self._tasks),
+            "steps_completed": self.steps_completed,
+            "steps_failed": self.steps_failed
+        }
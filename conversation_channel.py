@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Conversation channel between crew worker threads and the FastAPI event loop
+"""
+
+import asyncio
+import contextvars
+import json
+import secrets
+import time
+
+from state_backend import InMemoryStateBackend, CLOSED_MARKER_KEY
+
+
+class ConversationClosedError(Exception):
+    """Raised when a conversation ends while the crew is still waiting on the user"""
+    pass
+
+
+# Channel of the conversation the current crew thread is working for
+_current_channel = contextvars.ContextVar("conversation_channel", default=None)
+
+
+def set_current_channel(channel: "ConversationChannel"):
+    """Bind a conversation's channel to the current context (flows into its crew threads)"""
+    return _current_channel.set(channel)
+
+
+def current_channel():
+    return _current_channel.get()
+
+
+class ConversationChannel:
+    """Per-conversation rendezvous for questions and answers.
+
+    The crew runs in a worker thread while the WebSocket lives on the event loop.
+    Questions are scheduled onto the loop with run_coroutine_threadsafe and answers
+    are handed back through the state backend, so a waiting crew thread blocks
+    without polling and wakes up the moment /respond delivers the answer, even
+    when /respond was handled by another worker.
+    """
+
+    def __init__(self, websocket, loop: asyncio.AbstractEventLoop, conversation_id: str = None,
+                 backend=None, wait_slice: float = 30.0):
+        self.websocket = websocket
+        self.loop = loop
+        self.conversation_id = conversation_id
+        self.backend = backend or InMemoryStateBackend()
+        self.wait_slice = wait_slice
+        self.closed = False
+        self._closed_marker = {CLOSED_MARKER_KEY: secrets.token_hex(16)}
+
+    def send(self, message: dict, timeout: float = None):
+        """Send a JSON message to the client from a worker thread"""
+        if self.closed:
+            raise ConversationClosedError(f"Conversation {self.conversation_id} is closed")
+        future = asyncio.run_coroutine_threadsafe(
+            self.websocket.send_text(json.dumps(message)), self.loop
+        )
+        try:
+            return future.result(timeout)
+        except Exception as e:
+            # The socket is gone, so stop the crew rather than let it keep asking
+            self.close()
+            raise ConversationClosedError(f"Conversation {self.conversation_id} is closed: {e}") from e
+
+    def deliver(self, answer):
+        """Hand the user's answer to the waiting crew thread"""
+        self.backend.push_response(self.conversation_id, answer)
+
+    def wait_for_answer(self, timeout: float = None):
+        """Block the calling worker thread until an answer is delivered"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.closed:
+            wait = self.wait_slice
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    raise TimeoutError(f"No response received for conversation {self.conversation_id}")
+            answer = self.backend.wait_for_response(self.conversation_id, wait)
+            if isinstance(answer, dict) and CLOSED_MARKER_KEY in answer:
+                if answer == self._closed_marker:
+                    break
+                # Left behind by an earlier channel for this conversation, or sent by a client
+                continue
+            if answer is not None:
+                return answer
+        raise ConversationClosedError(f"Conversation {self.conversation_id} was closed")
+
+    def ask(self, question: str, timeout: float = None):
+        """Send a question to the client and wait for the answer"""
+        self.send({"type": "question", "data": question})
+        return self.wait_for_answer(timeout)
+
+    def close(self):
+        """Close the channel and release any thread still waiting for an answer"""
+        if not self.closed:
+            self.closed = True
+            self.backend.push_response(self.conversation_id, self._closed_marker)
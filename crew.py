@@ -1,5 +1,8 @@
+import functools
+
 from crewai import Agent, Crew, Process, Task
-from crewai.project import CrewBase, agent, crew, task
+from crewai.project import CrewBase, crew
+from crewai.project.wrappers import AgentMethod, TaskMethod
 from pydantic import BaseModel, Field
 from tools.custom_tool import PatientDataTool, UserInputTool, SymptomSeverityTool
 from tools.doctor_recommendation_tool import DoctorRecommendationTool
@@ -11,6 +14,28 @@ from tools.ai_virtual_doctor import AIVirtualDoctorTool
 import os
 
 
+def _once_per_crew(meth):
+    """Build a component once per crew instance and keep it on that instance"""
+    @functools.wraps(meth)
+    def build(self):
+        components = self.__dict__.setdefault("_components", {})
+        if meth.__name__ not in components:
+            components[meth.__name__] = meth(self)
+        return components[meth.__name__]
+    return build
+
+
+# CrewAI's @agent/@task memoize into a process-wide cache keyed by id(self) that is never
+# evicted, so every session crew would stay alive there. These mark the methods the same
+# way for CrewBase but keep the built agents and tasks on the session's crew instead.
+def session_agent(meth):
+    return AgentMethod(_once_per_crew(meth))
+
+
+def session_task(meth):
+    return TaskMethod(_once_per_crew(meth))
+
+
 class PatientInfo(BaseModel):
     patient_id: str = Field(description="Unique identifier for the patient")
     name: str = Field(description="Patient's full name")
@@ -103,15 +128,19 @@ class PatientCrew():
     agents_config = 'config/agents.yaml'
     tasks_config = 'config/tasks.yaml'
 
-    @agent
+    def __init__(self, user_input_tool: UserInputTool = None):
+        # Session-scoped input tool so concurrent conversations never share a question channel
+        self.user_input_tool = user_input_tool or UserInputTool()
+
+    @session_agent
     def patient_info_collector(self) -> Agent:
         return Agent(
             config=self.agents_config['patient_info_collector'],
-            tools=[UserInputTool(), PatientDataTool()],
+            tools=[self.user_input_tool, PatientDataTool()],
             verbose=True
         )
 
-    @agent
+    @session_agent
     def symptom_severity_analyzer(self) -> Agent:
         return Agent(
             config=self.agents_config['symptom_severity_analyzer'],
@@ -119,7 +148,7 @@ class PatientCrew():
             verbose=True
         )
 
-    @agent
+    @session_agent
     def doctor_recommender(self) -> Agent:
         return Agent(
             config=self.agents_config['doctor_recommender'],
@@ -127,15 +156,15 @@ class PatientCrew():
             verbose=True
         )
 
-    @agent
+    @session_agent
     def appointment_booking_agent(self) -> Agent:
         return Agent(
             config=self.agents_config['appointment_booking_agent'],
-            tools=[UserInputTool(), PushNotificationTool()],
+            tools=[self.user_input_tool, PushNotificationTool()],
             verbose=True
         )
 
-    @agent
+    @session_agent
     def reminder_specialist(self) -> Agent:
         return Agent(
             config=self.agents_config['reminder_specialist'],
@@ -143,7 +172,7 @@ class PatientCrew():
             verbose=True
         )
 
-    @agent
+    @session_agent
     def emergency_response_agent(self) -> Agent:
         return Agent(
             config=self.agents_config['emergency_response_agent'],
@@ -151,7 +180,7 @@ class PatientCrew():
             verbose=True
         )
 
-    @agent
+    @session_agent
     def ai_virtual_doctor_agent(self) -> Agent:
         return Agent(
             config=self.agents_config['ai_virtual_doctor_agent'],
@@ -159,7 +188,7 @@ class PatientCrew():
             verbose=True
         )
 
-    @task
+    @session_task
     def collect_info_task(self) -> Task:
         return Task(
             config=self.tasks_config['collect_info_task'],
@@ -167,7 +196,7 @@ class PatientCrew():
             output_file='patient_info.json'
         )
 
-    @task
+    @session_task
     def analyze_symptoms_task(self) -> Task:
         return Task(
             config=self.tasks_config['analyze_symptoms_task'],
@@ -176,7 +205,7 @@ class PatientCrew():
             context=[self.collect_info_task()]
         )
 
-    @task
+    @session_task
     def recommend_doctors_task(self) -> Task:
         return Task(
             config=self.tasks_config['recommend_doctors_task'],
@@ -185,7 +214,7 @@ class PatientCrew():
             context=[self.collect_info_task(), self.analyze_symptoms_task()]
         )
 
-    @task
+    @session_task
     def book_appointment_task(self) -> Task:
         return Task(
             config=self.tasks_config['book_appointment_task'],
@@ -194,7 +223,7 @@ class PatientCrew():
             context=[self.collect_info_task(), self.analyze_symptoms_task(), self.recommend_doctors_task()]
         )
 
-    @task
+    @session_task
     def schedule_reminder_task(self) -> Task:
         return Task(
             config=self.tasks_config['schedule_reminder_task'],
@@ -203,7 +232,7 @@ class PatientCrew():
             context=[self.collect_info_task(), self.book_appointment_task()]
         )
 
-    @task
+    @session_task
     def send_immediate_reminder_task(self) -> Task:
         return Task(
             config=self.tasks_config['send_immediate_reminder_task'],
@@ -212,7 +241,7 @@ class PatientCrew():
             context=[self.collect_info_task(), self.book_appointment_task()]
         )
 
-    @task
+    @session_task
     def emergency_response_task(self) -> Task:
         return Task(
             config=self.tasks_config['emergency_response_task'],
@@ -221,7 +250,7 @@ class PatientCrew():
             context=[self.collect_info_task(), self.analyze_symptoms_task()]
         )
 
-    @task
+    @session_task
     def ai_virtual_doctor_task(self) -> Task:
         return Task(
             config=self.tasks_config['ai_virtual_doctor_task'],
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Dedicated bounded executor for crew runs with admission control
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from priority_scheduler import ROUTINE, PRIORITY_NAMES, LatencyByPriority, get_current_priority, percentile
+
+
+class CrewQueueFullError(Exception):
+    """Raised when the crew queue is at its depth limit and a run cannot be admitted"""
+    pass
+
+
+class CrewExecutor:
+    """Runs crew kickoffs on a fixed-size thread pool.
+
+    At most max_workers crews run at once and at most max_queue wait behind
+    them; anything beyond that is rejected with CrewQueueFullError instead of
+    queueing silently. Waiting callers are told their place in line through
+    their on_queued callback whenever it changes. Admission bookkeeping runs
+    on the event loop, so run() must be awaited from the server's loop.
+
+    The line is ordered by conversation priority, then arrival. Escalated
+    conversations jump ahead of routine ones, may use the reserved_workers
+    that routine runs cannot take, and displace the newest routine waiter
+    when the line is full.
+    """
+
+    def __init__(self, max_workers: int = None, max_queue: int = None, reserved_workers: int = None,
+                 sample_size: int = 1000):
+        self.max_workers = max_workers or int(os.getenv("CREW_MAX_WORKERS", "8"))
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv("CREW_MAX_QUEUE", "50"))
+        reserved = reserved_workers if reserved_workers is not None else int(os.getenv("CREW_RESERVED_WORKERS", "1"))
+        self.reserved_workers = min(max(0, reserved), self.max_workers - 1)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="crew")
+        self._waiting = []  # [priority, seq, future, on_queued, last_position, level at enqueue]
+        self._seq = 0
+        self._running = 0
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self._queue_waits = deque(maxlen=sample_size)
+        self._run_times = deque(maxlen=sample_size)
+        self._queue_waits_by_priority = LatencyByPriority(sample_size)
+
+    def _limit(self, level: int) -> int:
+        return self.max_workers if level < ROUTINE else self.max_workers - self.reserved_workers
+
+    @staticmethod
+    def _level(waiter) -> int:
+        priority = waiter[0]
+        return priority.level if priority is not None else waiter[5]
+
+    def _ordered_waiting(self):
+        return sorted(self._waiting, key=lambda waiter: (self._level(waiter), waiter[1]))
+
+    def _notify_positions(self):
+        """Tell every waiting caller its current place in line (caller holds the lock)"""
+        for position, waiter in enumerate(self._ordered_waiting(), start=1):
+            on_queued, last_position = waiter[3], waiter[4]
+            if on_queued and position != last_position:
+                waiter[4] = position
+                asyncio.ensure_future(self._safe_notify(on_queued, position))
+
+    @staticmethod
+    async def _safe_notify(on_queued, position: int):
+        try:
+            await on_queued(position)
+        except Exception as e:
+            print(f"⚠️ Could not send queue position {position}: {e}")
+
+    def _admit_next(self):
+        """Hand a free slot to the next waiting caller (caller holds the lock)"""
+        while self._waiting:
+            waiter = self._ordered_waiting()[0]
+            if self._running >= self._limit(self._level(waiter)):
+                break
+            self._waiting.remove(waiter)
+            future = waiter[2]
+            if not future.done():
+                self._running += 1
+                future.set_result(self._level(waiter))
+        self._notify_positions()
+
+    def _displace_for(self, level: int) -> bool:
+        """Reject the newest waiter of a lower priority to make room (caller holds the lock)"""
+        ordered = self._ordered_waiting()
+        if not ordered or self._level(ordered[-1]) <= level:
+            return False
+        displaced = ordered[-1]
+        self._waiting.remove(displaced)
+        self.rejected += 1
+        if not displaced[2].done():
+            displaced[2].set_exception(CrewQueueFullError("Displaced from the crew queue by a higher priority conversation"))
+        return True
+
+    async def run(self, fn, *args, on_queued=None, priority=None):
+        """Run fn(*args) on the crew pool, waiting for a slot if all workers are busy.
+
+        on_queued is an optional coroutine function called with the caller's
+        position in line while it waits. priority is the conversation's
+        ConversationPriority; it defaults to the one bound to the current context.
+        """
+        loop = asyncio.get_running_loop()
+        priority = priority if priority is not None else get_current_priority()
+        level = priority.level if priority is not None else ROUTINE
+        enqueued_at = time.monotonic()
+        with self._lock:
+            self.submitted += 1
+            ahead = any(self._level(w) <= level for w in self._waiting)
+            if self._running < self._limit(level) and not ahead:
+                self._running += 1
+                ticket = None
+            elif len(self._waiting) >= self.max_queue and not self._displace_for(level):
+                self.rejected += 1
+                raise CrewQueueFullError(
+                    f"Crew queue is full ({self._running} running, {len(self._waiting)} waiting)"
+                )
+            else:
+                ticket = loop.create_future()
+                self._seq += 1
+                self._waiting.append([priority, self._seq, ticket, on_queued, None, level])
+                self._notify_positions()
+
+        if ticket is not None:
+            try:
+                level = await ticket
+            except asyncio.CancelledError:
+                with self._lock:
+                    if ticket.done() and not ticket.cancelled() and ticket.exception() is None:
+                        # The slot was granted just before cancellation; give it back
+                        self._running -= 1
+                    self._waiting = [w for w in self._waiting if w[2] is not ticket]
+                    self._admit_next()
+                raise
+
+        started_at = time.monotonic()
+        self._queue_waits.append(started_at - enqueued_at)
+        self._queue_waits_by_priority.record(level, started_at - enqueued_at)
+        # Copy the caller's context so request-scoped context variables reach the crew thread
+        context = contextvars.copy_context()
+        try:
+            job = self._executor.submit(context.run, fn, *args)
+        except Exception:
+            self._release()
+            raise
+        # The slot belongs to the crew thread, not to this caller: a cancelled caller stops
+        # waiting, but the slot is only freed once the thread has actually finished
+        job.add_done_callback(lambda job: loop.call_soon_threadsafe(self._finished, job, started_at))
+        return await asyncio.wrap_future(job, loop=loop)
+
+    def _finished(self, job, started_at: float):
+        """Record a finished crew run and free its slot (runs on the event loop)"""
+        self._run_times.append(time.monotonic() - started_at)
+        if job.cancelled() or job.exception() is not None:
+            self.failed += 1
+        else:
+            self.completed += 1
+        self._release()
+
+    def _release(self):
+        with self._lock:
+            self._running -= 1
+            self._admit_next()
+
+    def stats(self) -> dict:
+        """Pool occupancy, admission counters and queue-wait percentiles"""
+        with self._lock:
+            queue_waits = list(self._queue_waits)
+            run_times = list(self._run_times)
+            queued_by_priority = {}
+            for waiter in self._waiting:
+                name = PRIORITY_NAMES.get(self._level(waiter), "routine")
+                queued_by_priority[name] = queued_by_priority.get(name, 0) + 1
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "reserved_workers": self.reserved_workers,
+                "running": self._running,
+                "queued": len(self._waiting),
+                "queued_by_priority": queued_by_priority,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "failed": self.failed,
+                "queue_wait_ms": {
+                    "p50": round(percentile(queue_waits, 50) * 1000, 1),
+                    "p95": round(percentile(queue_waits, 95) * 1000, 1),
+                    "p99": round(percentile(queue_waits, 99) * 1000, 1),
+                    "max": round(max(queue_waits, default=0.0) * 1000, 1)
+                },
+                "queue_wait_ms_by_priority": self._queue_waits_by_priority.summary(),
+                "run_time_ms": {
+                    "p50": round(percentile(run_times, 50) * 1000, 1),
+                    "p99": round(percentile(run_times, 99) * 1000, 1)
+                }
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+# Global crew executor instance
+crew_executor = CrewExecutor()
@@ -5,7 +5,7 @@ from typing import Type
 from pydantic import BaseModel, Field
 from crewai.tools import BaseTool
 import google.generativeai as genai
-from model_config import get_model_with_retry
+from model_config import get_model_with_retry, run_coroutine, MODEL_POOL
 from faker import Faker
 import random
 import logging
@@ -19,7 +19,7 @@ genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
 # Create a model instance with SSL verification disabled
 try:
-    model = genai.GenerativeModel('gemini-1.5-pro')
+    model = MODEL_POOL.router('gemini-1.5-pro')
 except Exception as e:
     print(f"⚠️ Warning: Could not initialize Gemini model: {e}")
     model = None
@@ -132,6 +132,9 @@ class GeminiChatTool(BaseTool):
     args_schema: Type[BaseModel] = GeminiChatToolInput
 
     def _run(self, prompt: str, temperature: float = 0.7, max_tokens: int = 1000, context: str = "") -> str:
+        return run_coroutine(self._arun(prompt, temperature, max_tokens, context))
+
+    async def _arun(self, prompt: str, temperature: float = 0.7, max_tokens: int = 1000, context: str = "") -> str:
         try:
             structured_prompt = f"""
             Context: {context}
@@ -154,7 +157,7 @@ class GeminiChatTool(BaseTool):
                 top_k=40
             )
 
-            response = model.generate_content(
+            response = await model.generate_content_async(
                 structured_prompt,
                 generation_config=generation_config
             )
@@ -185,6 +188,17 @@ class SymptomSeverityTool(BaseTool):
         medical_history: str,
         age: int,
         current_medications: str
+    ) -> str:
+        return run_coroutine(self._arun(symptoms, duration, impact, medical_history, age, current_medications))
+
+    async def _arun(
+        self,
+        symptoms: str,
+        duration: str,
+        impact: str,
+        medical_history: str,
+        age: int,
+        current_medications: str
     ) -> str:
         try:
             # Ensure all inputs are the correct type
@@ -251,7 +265,7 @@ Patient Info:
                 top_k=40
             )
 
-            response = model.generate_content(prompt, generation_config=generation_config)
+            response = await model.generate_content_async(prompt, generation_config=generation_config)
             output_text = response.text.strip()
 
             # Try to return clean JSON
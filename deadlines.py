@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Request-scoped deadlines for LLM calls
+
+A deadline is bound to the current context when a conversation starts and
+flows with contextvars into the crew threads, the tools and every Gemini call
+they make. Each call gets the remaining budget as its timeout, and once the
+budget is spent calls fail fast with DeadlineExceededError so tools fall back
+to their canned content instead of hanging.
+"""
+
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+
+# Whole conversation, including the time spent waiting for the patient's answers
+CONVERSATION_DEADLINE_SECONDS = float(os.getenv("CONVERSATION_DEADLINE_SECONDS", "900"))
+# Everything the emergency response does once an emergency is detected
+EMERGENCY_DEADLINE_SECONDS = float(os.getenv("EMERGENCY_DEADLINE_SECONDS", "45"))
+# Upper bound for a single Gemini call, deadline or not
+LLM_CALL_TIMEOUT_SECONDS = float(os.getenv("LLM_CALL_TIMEOUT_SECONDS", "30"))
+
+
+class DeadlineExceededError(Exception):
+    """Raised when a request's time budget ran out before an LLM call could be made"""
+    pass
+
+
+# Absolute time.monotonic() by which the current request must be done
+_current_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+
+def set_deadline(seconds: float):
+    """Bind a deadline seconds from now to the current context"""
+    return _current_deadline.set(time.monotonic() + seconds)
+
+
+@contextmanager
+def deadline(seconds: float):
+    """Tighten the deadline for the with-block (an earlier outer deadline still wins)"""
+    new_deadline = time.monotonic() + seconds
+    current = _current_deadline.get()
+    if current is not None and current < new_deadline:
+        new_deadline = current
+    token = _current_deadline.set(new_deadline)
+    try:
+        yield
+    finally:
+        _current_deadline.reset(token)
+
+
+def remaining_time():
+    """Seconds left before the current deadline, or None when there is no deadline"""
+    current = _current_deadline.get()
+    if current is None:
+        return None
+    return current - time.monotonic()
+
+
+def deadline_expired() -> bool:
+    budget = remaining_time()
+    return budget is not None and budget <= 0
+
+
+def call_timeout(what: str = "LLM call", cap: float = None) -> float:
+    """Timeout for the next call: the remaining budget, capped at the per-call limit"""
+    cap = cap or LLM_CALL_TIMEOUT_SECONDS
+    budget = remaining_time()
+    if budget is None:
+        return cap
+    if budget <= 0:
+        raise DeadlineExceededError(f"Request deadline exceeded before {what}")
+    return min(cap, budget)
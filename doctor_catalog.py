@@ -0,0 +1,578 @@
+#!/usr/bin/env python3
+"""
+In-memory doctor catalog indexed by location and specialty, reloaded when the CSV changes
+"""
+
+import argparse
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+DOCTOR_DATABASE_FILE = "doctor_database.csv"
+
+COLUMNS = ("name", "specialty", "location", "hospital", "cost", "insurance", "available_slots")
+
+DAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+SLOT_PATTERN = re.compile(r"^(%s) (1[0-2]|[1-9]):([0-5][0-9]) (AM|PM)$" % "|".join(DAYS))
+
+# Fallback stages of a lookup, most specific first
+STAGES = ("location_specialty", "location", "specialty", "all")
+
+# Top doctors for a request: row positions in rank order, whether each accepts the
+# patient's insurance, and whether any matching doctor does
+Ranking = namedtuple("Ranking", "stage matched positions accepted insurance_matched")
+
+
+def normalize(value) -> str:
+    """Case-fold and collapse whitespace so 'Pune ' and 'pune' share an index key"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ""
+    return " ".join(str(value).split()).casefold()
+
+
+def smallest_int_dtype(high: int, signed: bool = True):
+    """Narrowest integer dtype that holds values up to `high` (and -1 when signed)"""
+    for dtype in ((np.int8, np.int16, np.int32) if signed else (np.uint8, np.uint16, np.uint32)):
+        if high <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64 if signed else np.uint64
+
+
+def encode_slot(text: str):
+    """'Monday 9:00 AM' as minutes since Monday 00:00, or None for any other format"""
+    match = SLOT_PATTERN.match(text)
+    if not match:
+        return None
+    day, hour, minute, half = match.groups()
+    hour = int(hour) % 12 + (12 if half == "PM" else 0)
+    return DAYS.index(day) * 1440 + hour * 60 + int(minute)
+
+
+def decode_slot(code: int) -> str:
+    day, minutes = divmod(int(code), 1440)
+    hour, minute = divmod(minutes, 60)
+    return f"{DAYS[day]} {hour % 12 or 12}:{minute:02d} {'PM' if hour >= 12 else 'AM'}"
+
+
+def split_insurers(value) -> tuple:
+    """Normalized insurer names from a comma-separated insurance cell, each once and in file order"""
+    return tuple(dict.fromkeys(name for name in (normalize(part) for part in normalize(value).split(",")) if name))
+
+
+def split_slots(value) -> list:
+    """Slot texts from a comma-separated schedule cell, whatever the spacing around the commas"""
+    return [slot.strip() for slot in str(value).split(",") if slot.strip()]
+
+
+def normalize_slots(value) -> str:
+    """A schedule cell as the repositories serve it: slots joined by "," if they all parse, else as written"""
+    if pd.isna(value):
+        return ""
+    slots = split_slots(value)
+    if any(encode_slot(slot) is None for slot in slots):
+        return str(value)
+    return ",".join(slots)
+
+
+class InsurerRegistry:
+    """Closed set of insurers, each assigned one bit of a network mask.
+
+    A doctor's accepted networks become a single integer, so "accepts any of
+    these plans" is one AND over a contiguous array. Masks fit the smallest
+    unsigned dtype for the number of insurers; past 64 they fall back to
+    Python ints, which still support the same bitwise operations.
+    """
+
+    def __init__(self, names=()):
+        self.bits = {}  # normalized name -> bit position
+        self.names = []  # normalized names by bit position
+        for name in names:
+            self.register(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def register(self, name: str) -> int:
+        """Bit for the insurer, assigning the next free one to a new name"""
+        name = normalize(name)
+        if name not in self.bits:
+            self.bits[name] = len(self.names)
+            self.names.append(name)
+        return self.bits[name]
+
+    def mask(self, plans) -> int:
+        """Mask for a plan name, a comma-separated list of plans or an iterable of them.
+
+        Plans the registry has never seen contribute no bits.
+        """
+        if plans is None:
+            return 0
+        if isinstance(plans, str):
+            plans = split_insurers(plans)
+        mask = 0
+        for name in plans:
+            bit = self.bits.get(normalize(name))
+            if bit is not None:
+                mask |= 1 << bit
+        return mask
+
+    def names_for(self, mask: int) -> tuple:
+        return tuple(name for bit, name in enumerate(self.names) if mask >> bit & 1)
+
+    @property
+    def dtype(self):
+        for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+            if len(self.names) <= np.iinfo(dtype).bits:
+                return dtype
+        return object
+
+
+class CategoricalColumn:
+    """Interned category values plus one small integer code per row (-1 when missing)"""
+
+    def __init__(self, values):
+        codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=True)
+        self.categories = [sys.intern(str(value)) for value in uniques]
+        self.codes = codes.astype(smallest_int_dtype(len(self.categories)))
+
+    def __getitem__(self, position):
+        code = self.codes[position]
+        return self.categories[code] if code >= 0 else None
+
+    def take(self, positions) -> list:
+        lookup = self.categories + [None]
+        return [lookup[code] for code in self.codes[positions].tolist()]
+
+    def nbytes(self) -> int:
+        return self.codes.nbytes + sum(sys.getsizeof(value) for value in self.categories)
+
+
+class StringColumn:
+    """Free-text values packed into one UTF-8 buffer with row offsets"""
+
+    def __init__(self, values):
+        encoded = [b"" if pd.isna(value) else str(value).encode() for value in values]
+        lengths = np.fromiter((len(value) for value in encoded), dtype=np.int64, count=len(encoded))
+        self.buffer = b"".join(encoded)
+        self.offsets = np.zeros(len(encoded) + 1, dtype=smallest_int_dtype(len(self.buffer), signed=False))
+        np.cumsum(lengths, out=self.offsets[1:])
+
+    def __getitem__(self, position) -> str:
+        return self.buffer[self.offsets[position]:self.offsets[position + 1]].decode()
+
+    def nbytes(self) -> int:
+        return len(self.buffer) + self.offsets.nbytes
+
+
+class SlotColumn:
+    """Weekly schedules packed as arrays of minutes-since-Monday.
+
+    Doctors mostly share a few schedules, so each distinct schedule is
+    stored once (values sliced by offsets) and every row holds a pattern
+    code. A schedule that would not rebuild to the same slot texts keeps
+    its original string, so nothing is lost for odd formats.
+    """
+
+    def __init__(self, values):
+        codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=True)
+        self.codes = codes.astype(smallest_int_dtype(len(uniques)))
+        self.raw = {}  # pattern -> original text, for schedules that do not round-trip
+        packed, lengths = [], []
+        for pattern, text in enumerate(uniques):
+            encoded = [encode_slot(slot) for slot in split_slots(text)]
+            if None in encoded:
+                self.raw[pattern] = str(text)
+                encoded = []
+            packed.extend(encoded)
+            lengths.append(len(encoded))
+        self.values = np.array(packed, dtype=np.uint16)
+        self.offsets = np.zeros(len(lengths) + 1, dtype=smallest_int_dtype(len(packed), signed=False))
+        np.cumsum(lengths, out=self.offsets[1:])
+
+    def slots(self, position) -> np.ndarray:
+        """Packed slot codes for a row (empty for no schedule or a raw one)"""
+        pattern = self.codes[position]
+        if pattern < 0:
+            return self.values[:0]
+        return self.values[self.offsets[pattern]:self.offsets[pattern + 1]]
+
+    def __getitem__(self, position) -> str:
+        """The row's schedule as the comma-separated text the date utilities parse"""
+        pattern = int(self.codes[position])
+        if pattern in self.raw:
+            return self.raw[pattern]
+        return ",".join(decode_slot(code) for code in self.slots(position))
+
+    def nbytes(self) -> int:
+        return (self.codes.nbytes + self.values.nbytes + self.offsets.nbytes
+                + sum(sys.getsizeof(text) for text in self.raw.values()))
+
+
+class DoctorTable:
+    """Columnar copy of the doctor CSV without per-cell Python objects.
+
+    Location, specialty and hospital are interned categorical codes, names
+    share one packed buffer, cost is an int array, insurance is a network
+    bitmask per row (plus a code into the distinct insurer lists, which keep
+    the file's order for display) and schedules are packed slot arrays.
+    """
+
+    def __init__(self, frame: pd.DataFrame):
+        self.length = len(frame)
+        self.names = StringColumn(frame["name"])
+        self.specialty = CategoricalColumn(frame["specialty"])
+        self.location = CategoricalColumn(frame["location"])
+        self.hospital = CategoricalColumn(frame["hospital"])
+        costs = pd.to_numeric(frame["cost"], errors="coerce").fillna(0).astype(np.int64).to_numpy()
+        self.costs = costs.astype(smallest_int_dtype(int(costs.max()) if len(costs) else 0))
+        self.slots = SlotColumn(frame["available_slots"])
+
+        # Insurance cells repeat a lot, so split each distinct cell once and keep a code per row
+        self.registry = InsurerRegistry()
+        codes, cells = pd.factorize(frame["insurance"], use_na_sentinel=True)
+        self.insurance_cells = [tuple(sys.intern(name) for name in split_insurers(cell)) for cell in cells]
+        self.insurance_cells.append(())  # code -1 (missing) picks the last entry
+        self.insurance_codes = codes.astype(smallest_int_dtype(len(cells)))
+        cell_masks = [sum(1 << self.registry.register(name) for name in names) for names in self.insurance_cells]
+        self.insurance_bits = np.array(cell_masks, dtype=self.registry.dtype)[codes]
+
+    def __len__(self):
+        return self.length
+
+    def insurers(self, position) -> tuple:
+        return self.insurance_cells[self.insurance_codes[position]]
+
+    def row(self, position) -> dict:
+        return {
+            "name": self.names[position],
+            "specialty": self.specialty[position],
+            "location": self.location[position],
+            "hospital": self.hospital[position],
+            "cost": int(self.costs[position]),
+            "insurance": self.insurers(position),
+            "available_slots": self.slots[position]
+        }
+
+    def nbytes(self) -> int:
+        return (self.names.nbytes() + self.specialty.nbytes() + self.location.nbytes()
+                + self.hospital.nbytes() + self.costs.nbytes + self.slots.nbytes()
+                + self.insurance_bits.nbytes + self.insurance_codes.nbytes
+                + sum(sys.getsizeof(names) for names in self.insurance_cells)
+                + sum(sys.getsizeof(name) for name in self.registry.names))
+
+
+def group_positions(codes: np.ndarray, key_for, dtype) -> dict:
+    """Map each code's key to the positions holding it, as views into one sorted array"""
+    order = np.argsort(codes, kind="stable").astype(dtype)
+    present, starts = np.unique(codes[order], return_index=True)
+    ends = np.append(starts[1:], len(order))
+    return {key_for(code): order[start:end]
+            for code, start, end in zip(present.tolist(), starts.tolist(), ends.tolist())}
+
+
+def normalized_codes(column: CategoricalColumn):
+    """Per-row codes of the column's normalized values, and the key for each code"""
+    keys = {}
+    lookup = [keys.setdefault(normalize(value), len(keys)) for value in column.categories]
+    lookup.append(keys.setdefault("", len(keys)))  # code -1 (missing) picks the last entry
+    return np.array(lookup, dtype=np.int64)[column.codes], list(keys)
+
+
+class CatalogSnapshot:
+    """One immutable load of the doctor CSV plus its hash indexes.
+
+    Rows live in a compact DoctorTable. Indexes map normalized keys to
+    arrays of row positions, so a lookup costs O(matches) instead of
+    scanning every row, and ranking a request's matches is a handful of
+    array operations on the cost and insurance columns.
+    """
+
+    def __init__(self, path: str, frame: pd.DataFrame, mtime_ns: int, size: int):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.loaded_at = time.time()
+        self.table = DoctorTable(frame.reset_index(drop=True))
+        self.registry = self.table.registry
+        self.insurance_bits = self.table.insurance_bits
+        self.costs = self.table.costs
+        self.locations = list(self.table.location.categories)
+        self.specialties = list(self.table.specialty.categories)
+
+        position_dtype = smallest_int_dtype(len(self.table))
+        locations, location_keys = normalized_codes(self.table.location)
+        specialties, specialty_keys = normalized_codes(self.table.specialty)
+        width = len(specialty_keys)
+        self.by_location = group_positions(locations, location_keys.__getitem__, position_dtype)
+        self.by_specialty = group_positions(specialties, specialty_keys.__getitem__, position_dtype)
+        self.by_location_specialty = group_positions(
+            locations * width + specialties,
+            lambda code: (location_keys[code // width], specialty_keys[code % width]),
+            position_dtype
+        )
+        self.all_positions = np.arange(len(self.table), dtype=position_dtype)
+
+    def __len__(self):
+        return len(self.table)
+
+    def insurers(self, position) -> tuple:
+        return self.table.insurers(position)
+
+    def row(self, position) -> dict:
+        return self.table.row(position)
+
+    def rows(self, positions) -> pd.DataFrame:
+        positions = np.asarray(positions, dtype=np.int64)
+        return pd.DataFrame([self.table.row(position) for position in positions.tolist()],
+                            columns=list(COLUMNS), index=positions)
+
+    def index_nbytes(self) -> int:
+        indexes = (self.by_location, self.by_specialty, self.by_location_specialty)
+        # Index entries are views, so count each base array once
+        bases = {id(view.base): view.base.nbytes for index in indexes for view in index.values()}
+        return sum(bases.values()) + self.all_positions.nbytes
+
+    def match(self, location: str, specialty: str):
+        """Row positions for the most specific stage with matches, and the stage's name"""
+        location, specialty = normalize(location), normalize(specialty)
+        for stage, positions in (
+            ("location_specialty", self.by_location_specialty.get((location, specialty))),
+            ("location", self.by_location.get(location)),
+            ("specialty", self.by_specialty.get(specialty))
+        ):
+            if positions is not None and len(positions):
+                return positions, stage
+        return self.all_positions, "all"
+
+    def find(self, location: str, specialty: str):
+        """Doctors for the most specific stage with matches, and the stage's name"""
+        positions, stage = self.match(location, specialty)
+        return self.rows(positions), stage
+
+    def accepts(self, positions, plans) -> np.ndarray:
+        """Mask over positions of the doctors that take any of the plans"""
+        positions = np.asarray(positions, dtype=np.int64)
+        mask = self.registry.mask(plans)
+        if not mask:
+            return np.zeros(len(positions), dtype=bool)
+        return (self.insurance_bits[positions] & mask) != 0
+
+    def rank(self, positions, insurance, limit: int = 5):
+        """Best positions by (insurance not accepted, cost), ties in file order.
+
+        `insurance` is one plan or several (comma-separated or a list); a doctor
+        taking any of them accepts the patient. Only the top `limit` rows are
+        sorted; the rest are partitioned away. Returns the ranked positions,
+        their acceptance and whether any match accepted.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        accepted = self.accepts(positions, insurance)
+        if len(positions) == 0:
+            return positions, accepted, False
+        costs = self.costs[positions]
+        # One integer key per row: rejected rows after accepted ones, then cost, then file order
+        spread = int(costs.max()) - int(costs.min()) + 1
+        keys = ((~accepted).astype(np.int64) * spread + (costs - costs.min())) * len(positions)
+        keys += np.arange(len(positions))
+        if len(positions) > limit:
+            top = np.argpartition(keys, limit - 1)[:limit]
+        else:
+            top = np.arange(len(positions))
+        top = top[np.argsort(keys[top])]
+        return positions[top], accepted[top], bool(accepted.any())
+
+
+class DoctorCatalog:
+    """Long-lived doctor catalog shared by every recommendation.
+
+    The CSV is loaded once and swapped for a fresh snapshot only when its
+    mtime or size changes. A reload is built off to the side and published
+    with a single assignment, so readers always see a complete snapshot. A
+    file that fails to parse keeps the previous snapshot in service. The
+    path comes from DOCTOR_DATABASE_PATH or is looked up in the working
+    directory and next to this module.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv("DOCTOR_DATABASE_PATH")
+        self._snapshot = None
+        self._reload_lock = threading.Lock()
+        self.loads = 0
+        self.load_errors = 0
+        self.lookups = 0
+        self.stage_counts = {stage: 0 for stage in STAGES}
+        self.last_error = None
+
+    def resolve_path(self):
+        if self.path:
+            return self.path if os.path.exists(self.path) else None
+        for directory in (os.getcwd(), os.path.dirname(os.path.abspath(__file__))):
+            candidate = os.path.join(directory, DOCTOR_DATABASE_FILE)
+            if os.path.exists(candidate):
+                return candidate
+        return None
+
+    @staticmethod
+    def _signature(path: str):
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def is_stale(self) -> bool:
+        """True when the CSV changed (or appeared) since the current snapshot was loaded"""
+        path = self.resolve_path()
+        if path is None:
+            return False
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.path != path:
+            return True
+        try:
+            return self._signature(path) != (snapshot.mtime_ns, snapshot.size)
+        except OSError:
+            return False
+
+    def reload(self):
+        """Load the CSV into a new snapshot if it changed; returns the snapshot in service"""
+        with self._reload_lock:
+            if not self.is_stale():
+                return self._snapshot
+            path = self.resolve_path()
+            try:
+                mtime_ns, size = self._signature(path)
+                snapshot = CatalogSnapshot(path, pd.read_csv(path), mtime_ns, size)
+            except Exception as e:
+                self.load_errors += 1
+                self.last_error = str(e)
+                print(f"⚠️ Could not load doctor database {path}: {e}")
+                return self._snapshot
+            self._snapshot = snapshot
+            self.loads += 1
+            print(f"📋 Doctor catalog loaded {len(snapshot)} doctors from {path}")
+            return snapshot
+
+    @property
+    def current(self):
+        """Snapshot in service without checking the file; None before the first load"""
+        return self._snapshot
+
+    def snapshot(self):
+        """Current snapshot, reloading first if the CSV changed; None if there is no database"""
+        if self.is_stale():
+            return self.reload()
+        return self._snapshot
+
+    def find(self, location: str, specialty: str, snapshot: CatalogSnapshot = None):
+        """Doctors matching location and specialty with the usual fallbacks, and the stage used.
+
+        Pass the snapshot a request already holds to keep the whole request on one load.
+        """
+        if snapshot is None:
+            snapshot = self.snapshot()
+        if snapshot is None:
+            return None, None
+        doctors, stage = snapshot.find(location, specialty)
+        self.lookups += 1
+        self.stage_counts[stage] += 1
+        return doctors, stage
+
+    def recommend(self, location: str, specialty: str, insurance, limit: int = 5,
+                  snapshot: CatalogSnapshot = None):
+        """Top doctors for a request as a Ranking; None if there is no database"""
+        if snapshot is None:
+            snapshot = self.snapshot()
+        if snapshot is None:
+            return None
+        positions, stage = snapshot.match(location, specialty)
+        ranked, accepted, insurance_matched = snapshot.rank(positions, insurance, limit)
+        self.lookups += 1
+        self.stage_counts[stage] += 1
+        return Ranking(stage, len(positions), ranked, accepted, insurance_matched)
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        loaded = snapshot is not None
+        return {
+            "path": snapshot.path if loaded else self.resolve_path(),
+            "doctors": len(snapshot) if loaded else 0,
+            "locations": len(snapshot.by_location) if loaded else 0,
+            "specialties": len(snapshot.by_specialty) if loaded else 0,
+            "insurers": len(snapshot.registry) if loaded else 0,
+            "loaded_at": snapshot.loaded_at if loaded else None,
+            "loads": self.loads,
+            "load_errors": self.load_errors,
+            "last_error": self.last_error,
+            "lookups": self.lookups,
+            "lookups_by_stage": dict(self.stage_counts)
+        }
+
+
+def footprint(path: str, scale: int = 1) -> dict:
+    """Memory of the doctor file loaded by pandas versus the compact catalog.
+
+    With scale > 1 the file's rows are repeated (with distinct names) into a
+    temporary CSV first, to size a national catalog from the local one.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if scale > 1:
+            frame = pd.concat([pd.read_csv(path)] * scale, ignore_index=True)
+            frame["name"] = [f"{name} #{i}" for i, name in enumerate(frame["name"])]
+            path = os.path.join(tmp_dir, DOCTOR_DATABASE_FILE)
+            frame.to_csv(path, index=False)
+        text_columns = {column: object for column in COLUMNS if column != "cost"}
+        frame = pd.read_csv(path)
+        pandas_bytes = int(frame.memory_usage(deep=True).sum())
+        object_bytes = int(pd.read_csv(path, dtype=text_columns).memory_usage(deep=True).sum())
+        started = time.perf_counter()
+        snapshot = CatalogSnapshot(path, frame, 0, 0)
+        build_seconds = time.perf_counter() - started
+    return {
+        "rows": len(snapshot),
+        "pandas_bytes": pandas_bytes,
+        "pandas_object_bytes": object_bytes,
+        "compact_bytes": snapshot.table.nbytes(),
+        "index_bytes": snapshot.index_nbytes(),
+        "build_seconds": round(build_seconds, 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the doctor catalog")
+    commands = parser.add_subparsers(dest="command", required=True)
+    stats_parser = commands.add_parser("stats", help="load the catalog and show its indexes")
+    stats_parser.add_argument("--path", help="doctor CSV (default: DOCTOR_DATABASE_PATH or doctor_database.csv)")
+    bench_parser = commands.add_parser("bench", help="memory footprint against a pandas load")
+    bench_parser.add_argument("--path", help="doctor CSV (default: DOCTOR_DATABASE_PATH or doctor_database.csv)")
+    bench_parser.add_argument("--scale", type=int, default=1, help="repeat the file's rows this many times")
+    args = parser.parse_args()
+
+    catalog = DoctorCatalog(args.path)
+    path = catalog.resolve_path()
+    if path is None:
+        parser.error("doctor database not found")
+    if args.command == "stats":
+        catalog.snapshot()
+        for key, value in catalog.stats().items():
+            print(f"   {key:18} {value}")
+    else:
+        report = footprint(path, scale=args.scale)
+        compact = report["compact_bytes"] + report["index_bytes"]
+        print(f"📊 {report['rows']} doctors from {path}")
+        print(f"   pandas read_csv       {report['pandas_bytes'] / 1024:10.1f} KiB")
+        print(f"   pandas object columns {report['pandas_object_bytes'] / 1024:10.1f} KiB")
+        print(f"   compact columns       {report['compact_bytes'] / 1024:10.1f} KiB")
+        print(f"   compact + indexes     {compact / 1024:10.1f} KiB "
+              f"({report['pandas_object_bytes'] / max(compact, 1):.1f}x smaller than object columns)")
+        print(f"⏱️ Built in {report['build_seconds']}s")
+
+
+DOCTOR_CATALOG = DoctorCatalog()
+
+
+if __name__ == "__main__":
+    main()
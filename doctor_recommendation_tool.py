@@ -1,11 +1,12 @@
-import pandas as pd
+import asyncio
 import json
 import os
 from typing import Type
 from pydantic import BaseModel, Field
 from crewai.tools import BaseTool
 import google.generativeai as genai
-from model_config import get_model_with_retry
+from model_config import get_model_with_retry, run_coroutine, MODEL_POOL
+from doctor_repository import DOCTOR_REPOSITORY
 from datetime import datetime, timedelta
 from .date_utils import get_next_available_slots, convert_slot_to_actual_date
 
@@ -15,7 +16,7 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 try:
-    model = genai.GenerativeModel('gemini-1.5-pro')
+    model = MODEL_POOL.router('gemini-1.5-pro')
 except Exception as e:
     print(f"⚠️ Warning: Could not initialize Gemini model: {e}")
     model = None
@@ -30,6 +31,9 @@ class DoctorRecommendationTool(BaseTool):
     args_schema: Type[BaseModel] = DoctorRecommendationInput
 
     def _run(self, patient_info: dict, symptom_assessment: dict) -> str:
+        return run_coroutine(self._arun(patient_info, symptom_assessment))
+
+    async def _arun(self, patient_info: dict, symptom_assessment: dict) -> str:
         try:
             # Configure Gemini
             genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
@@ -43,45 +47,18 @@ class DoctorRecommendationTool(BaseTool):
             try:
                 model = get_model_with_retry()
             except:
-                try:
-                    model = genai.GenerativeModel('gemini-1.5-flash')
-                except:
-                    model = genai.GenerativeModel('gemini-1.5-pro')
-            
-            # Load doctor database from CSV - use single consolidated database
-            possible_paths = [
-                os.path.join(os.getcwd(), 'doctor_database.csv'),
-                os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), 'doctor_database.csv'),
-                'doctor_database.csv'
-            ]
-            
-            # Debug: Print all possible paths
-            print(f"DEBUG: Current working directory: {os.getcwd()}")
-            print(f"DEBUG: File location: {__file__}")
-            for i, path in enumerate(possible_paths):
-                exists = os.path.exists(path)
-                print(f"DEBUG: Path {i+1}: {path} - EXISTS: {exists}")
+                model = MODEL_POOL.router('gemini-1.5-pro')
             
-            csv_path = None
-            for path in possible_paths:
-                if os.path.exists(path):
-                    csv_path = path
-                    print(f"DEBUG: Found CSV at: {csv_path}")
-                    break
-            
-            if not csv_path:
-                print("DEBUG: No CSV file found in any location!")
-                return json.dumps({
-                    "error": "Doctor database not found",
-                    "recommended_doctors": [],
-                    "message": "We couldn't find the doctor database. Please contact support."
-                })
-
-            df = pd.read_csv(csv_path)
-            print(f"DEBUG: Successfully loaded CSV with {len(df)} rows")
-            print(f"DEBUG: CSV columns: {list(df.columns)}")
-            print(f"DEBUG: First few rows:")
-            print(df.head(3))
+            # Doctors come from the configured repository (in-memory CSV catalog or SQLite)
+            doctor_database_missing = json.dumps({
+                "error": "Doctor database not found",
+                "recommended_doctors": [],
+                "message": "We couldn't find the doctor database. Please contact support."
+            })
+            if not DOCTOR_REPOSITORY.available():
+                print("DEBUG: No doctor database found!")
+                return doctor_database_missing
+            print(f"DEBUG: Doctor repository: {DOCTOR_REPOSITORY.describe()}")
             
             # Extract patient preferences
             patient_location = patient_info.get('location', 'Pune')
@@ -117,65 +94,43 @@ class DoctorRecommendationTool(BaseTool):
             Return only the specialty name, nothing else.
             """
             
-            specialty_response = model.generate_content(specialty_prompt)
+            # The specialty only depends on symptoms and severity, so reuse earlier answers
+            specialty_response = await model.generate_content_async(
+                specialty_prompt,
+                cache_family="specialty_mapping",
+                cache_key={"symptoms": symptoms, "severity": severity}
+            )
             recommended_specialty = specialty_response.text.strip()
             
             # Filter doctors by location and specialty
             print(f"DEBUG: Looking for doctors in {patient_location} with specialty {recommended_specialty}")
-            print(f"DEBUG: Available locations in CSV: {df['location'].unique()}")
-            print(f"DEBUG: Available specialties in CSV: {df['specialty'].unique()}")
             
-            # First try: exact location and specialty match
-            filtered_doctors = df[
-                (df['location'].str.lower() == patient_location.lower()) &
-                (df['specialty'].str.lower() == recommended_specialty.lower())
-            ]
-            print(f"DEBUG: Found {len(filtered_doctors)} doctors with exact match")
-            
-            # Second try: if no exact match, try any doctor in the location
-            if filtered_doctors.empty:
-                print(f"DEBUG: No exact specialty match in {patient_location}, trying any doctor in location")
-                filtered_doctors = df[df['location'].str.lower() == patient_location.lower()]
-                print(f"DEBUG: Found {len(filtered_doctors)} doctors in {patient_location}")
-            
-            # Third try: if still no doctors, expand to all locations with the specialty
-            if filtered_doctors.empty:
-                print(f"DEBUG: No doctors found in {patient_location}, expanding search to all locations with specialty {recommended_specialty}")
-                filtered_doctors = df[df['specialty'].str.lower() == recommended_specialty.lower()]
-                print(f"DEBUG: Found {len(filtered_doctors)} doctors with specialty {recommended_specialty} in all locations")
-            
-            # Fourth try: if still no doctors, show any available doctors
-            if filtered_doctors.empty:
-                print(f"DEBUG: No doctors found with specialty {recommended_specialty}, showing all available doctors")
-                filtered_doctors = df
-                print(f"DEBUG: Found {len(filtered_doctors)} total doctors available")
-            
-            if filtered_doctors.empty:
+            # Exact location and specialty, then any doctor in the location, then the
+            # specialty in any location, then every doctor. Matches are ranked by insurance
+            # acceptance and cost inside the repository, keeping only the top 5
+            ranking = await DOCTOR_REPOSITORY.recommend_async(
+                patient_location, recommended_specialty, patient_insurance, limit=5
+            )
+            if ranking is None:
+                return doctor_database_missing
+            print(f"DEBUG: Found {ranking.matched} doctors (match: {ranking.stage})")
+            
+            if not ranking.matched:
                 return json.dumps({
                     "error": "No suitable doctors found",
                     "recommended_doctors": [],
                     "message": "We couldn't find any doctors matching your requirements. Please try a different location or contact us for assistance."
                 })
             
-            # Process insurance matching
+            # Slots are only worked out for the doctors that made the top 5
             recommended_doctors = []
-            insurance_matched = False
+            insurance_matched = ranking.insurance_matched
             
-            for _, doctor in filtered_doctors.iterrows():
-                doctor_insurances = doctor['insurance'].split(',') if pd.notna(doctor['insurance']) else []
-                doctor_insurances = [ins.strip().lower() for ins in doctor_insurances]
-                
-                # Check if patient's insurance is accepted (case-insensitive)
-                # Fix: Add null check for patient_insurance before calling .lower()
-                insurance_accepted = False
-                if patient_insurance and patient_insurance.strip():  # Check if insurance exists and is not empty
-                    insurance_accepted = patient_insurance.lower() in doctor_insurances
-                
-                if insurance_accepted:
-                    insurance_matched = True
+            for doctor, insurance_accepted in zip(ranking.doctors, ranking.accepted):
+                doctor_insurances = list(doctor['insurance'])
                 
                 # Parse available slots with actual dates
-                slots_str = doctor['available_slots'] if pd.notna(doctor['available_slots']) else ""
+                slots_str = doctor['available_slots']
                 available_slots = []
                 if slots_str:
                     # Use the new date utility to get actual dates
@@ -234,20 +189,14 @@ class DoctorRecommendationTool(BaseTool):
                     "specialty": doctor['specialty'],
                     "location": doctor['location'],
                     "hospital": doctor['hospital'],
-                    "cost": int(doctor['cost']) if pd.notna(doctor['cost']) else 0,
+                    "cost": doctor['cost'],
                     "insurance": doctor_insurances,
                     "available_slots": available_slots,
-                    "insurance_accepted": insurance_accepted
+                    "insurance_accepted": bool(insurance_accepted)
                 }
                 
                 recommended_doctors.append(doctor_info)
             
-            # Sort by insurance acceptance first, then by cost
-            recommended_doctors.sort(key=lambda x: (not x['insurance_accepted'], x['cost']))
-            
-            # Limit to top 5 recommendations
-            recommended_doctors = recommended_doctors[:5]
-            
             # Create response message
             if patient_insurance and not insurance_matched:
                 message = f"We found {len(recommended_doctors)} doctors in {patient_location} specializing in {recommended_specialty}. Unfortunately, none of them accept {patient_insurance} insurance. However, we've listed alternative options with different insurance providers."
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Doctor repositories behind DoctorRecommendationTool
+
+Recommendations go through the DoctorRepository interface so the doctor data can
+outgrow the CSV without touching the tool:
+
+- csv:    doctor_database.csv held in memory by the indexed DoctorCatalog (the default)
+- sqlite: an embedded database queried through indexes, for catalogs too big for RAM
+
+Select a repository with DOCTOR_REPOSITORY=csv|sqlite (DOCTOR_SQLITE_PATH). Build the
+database from the CSV with: python doctor_repository.py import [--csv PATH] [--db PATH]
+"""
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+import pandas as pd
+
+from doctor_catalog import DOCTOR_CATALOG, STAGES, normalize, normalize_slots, split_insurers
+
+# Top doctors for a request: the fallback stage used, how many doctors it matched, the
+# ranked doctor rows, whether each accepts the patient's insurance, and whether any match does
+Recommendation = namedtuple("Recommendation", "stage matched doctors accepted insurance_matched")
+
+IMPORT_CHUNK_ROWS = 50000
+
+
+class DoctorRepository:
+    """Interface for looking up doctors.
+
+    recommend() runs the fallback search (location and specialty, then
+    location, then specialty, then everyone) and returns the best `limit`
+    doctors by insurance acceptance and cost, ties in file order. Doctor rows
+    are dicts with name, specialty, location, hospital, cost, insurance (a
+    tuple of distinct normalized insurer names) and available_slots (see
+    normalize_slots()), identical whichever implementation serves them.
+    """
+
+    name = "repository"
+
+    def available(self) -> bool:
+        raise NotImplementedError
+
+    def describe(self) -> str:
+        raise NotImplementedError
+
+    def recommend(self, location: str, specialty: str, insurance, limit: int = 5):
+        """Recommendation for the request, or None if there is no database"""
+        raise NotImplementedError
+
+    async def recommend_async(self, location: str, specialty: str, insurance, limit: int = 5):
+        return await asyncio.to_thread(self.recommend, location, specialty, insurance, limit)
+
+    def stats(self) -> dict:
+        raise NotImplementedError
+
+
+class CSVDoctorRepository(DoctorRepository):
+    """The CSV loaded into the in-memory catalog and reloaded when the file changes"""
+
+    name = "csv"
+
+    def __init__(self, catalog=None):
+        self.catalog = catalog or DOCTOR_CATALOG
+
+    def available(self) -> bool:
+        return self.catalog.resolve_path() is not None
+
+    def describe(self) -> str:
+        snapshot = self.catalog.current
+        if snapshot is None:
+            return f"CSV catalog at {self.catalog.resolve_path()} (not loaded yet)"
+        return f"CSV catalog with {len(snapshot)} doctors from {snapshot.path}"
+
+    def recommend(self, location, specialty, insurance, limit=5):
+        return self._recommend(self.catalog.snapshot(), location, specialty, insurance, limit)
+
+    async def recommend_async(self, location, specialty, insurance, limit=5):
+        # Only a reload touches the disk; lookups are in-memory and stay on the loop
+        if self.catalog.is_stale():
+            await asyncio.to_thread(self.catalog.reload)
+        return self._recommend(self.catalog.current, location, specialty, insurance, limit)
+
+    def _recommend(self, snapshot, location, specialty, insurance, limit):
+        if snapshot is None:
+            return None
+        ranking = self.catalog.recommend(location, specialty, insurance, limit, snapshot=snapshot)
+        doctors = [snapshot.row(position) for position in ranking.positions]
+        return Recommendation(ranking.stage, ranking.matched, doctors,
+                              [bool(accepted) for accepted in ranking.accepted], ranking.insurance_matched)
+
+    def stats(self) -> dict:
+        return {"repository": self.name, **self.catalog.stats()}
+
+
+SCHEMA = (
+    "CREATE TABLE doctors ("
+    "id INTEGER PRIMARY KEY, name TEXT, specialty TEXT, location TEXT, hospital TEXT, "
+    "cost INTEGER NOT NULL, available_slots TEXT, location_key TEXT NOT NULL, specialty_key TEXT NOT NULL)",
+    "CREATE TABLE insurers (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)",
+    "CREATE TABLE doctor_insurers ("
+    "doctor_id INTEGER NOT NULL, insurer_id INTEGER NOT NULL, position INTEGER NOT NULL, "
+    "PRIMARY KEY (doctor_id, insurer_id)) WITHOUT ROWID",
+)
+
+# Every stage walks an index in (cost, id) order, so the top doctors come off the
+# front of the index without sorting or reading the other matches
+INDEXES = (
+    "CREATE INDEX idx_doctors_location_specialty ON doctors (location_key, specialty_key, cost, id)",
+    "CREATE INDEX idx_doctors_location ON doctors (location_key, cost, id)",
+    "CREATE INDEX idx_doctors_specialty ON doctors (specialty_key, cost, id)",
+    "CREATE INDEX idx_doctors_cost ON doctors (cost, id)",
+    "CREATE INDEX idx_doctor_insurers_insurer ON doctor_insurers (insurer_id, doctor_id)",
+)
+
+STAGE_FILTERS = {
+    "location_specialty": ("location_key = ? AND specialty_key = ?", lambda location, specialty: (location, specialty)),
+    "location": ("location_key = ?", lambda location, specialty: (location,)),
+    "specialty": ("specialty_key = ?", lambda location, specialty: (specialty,)),
+    "all": ("1 = 1", lambda location, specialty: ())
+}
+
+DOCTOR_COLUMNS = "d.id, d.name, d.specialty, d.location, d.hospital, d.cost, d.available_slots"
+
+
+def import_csv(csv_path: str, db_path: str, chunk_rows: int = IMPORT_CHUNK_ROWS) -> int:
+    """Convert a doctor CSV into a SQLite database; returns the number of doctors.
+
+    The CSV is read in chunks so files larger than memory convert. The
+    database is built next to the target and moved into place when complete,
+    so running repositories never see a half-written file.
+    """
+    directory = os.path.dirname(os.path.abspath(db_path))
+    handle, tmp_path = tempfile.mkstemp(prefix=".doctors-", suffix=".db", dir=directory)
+    os.close(handle)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        for statement in SCHEMA:
+            conn.execute(statement)
+        insurer_ids = {}
+        doctor_id = 0
+        for chunk in pd.read_csv(csv_path, chunksize=chunk_rows):
+            ids = range(doctor_id, doctor_id + len(chunk))
+            text = {column: [None if pd.isna(value) else str(value) for value in chunk[column]]
+                    for column in ("name", "specialty", "location", "hospital")}
+            costs = pd.to_numeric(chunk["cost"], errors="coerce").fillna(0).astype(int).tolist()
+            # Keys, schedules and insurer lists are worked out once per distinct value in the chunk
+            codes, uniques = pd.factorize(chunk["available_slots"], use_na_sentinel=True)
+            lookup = [normalize_slots(value) for value in uniques] + [""]
+            text["available_slots"] = [lookup[code] for code in codes]
+            keys = {}
+            for column in ("location", "specialty"):
+                codes, uniques = pd.factorize(chunk[column], use_na_sentinel=True)
+                lookup = [normalize(value) for value in uniques] + [""]
+                keys[column] = [lookup[code] for code in codes]
+            codes, cells = pd.factorize(chunk["insurance"], use_na_sentinel=True)
+            cell_insurers = []
+            for cell in cells:
+                names = split_insurers(cell)
+                for insurer in names:
+                    if insurer not in insurer_ids:
+                        insurer_ids[insurer] = len(insurer_ids)
+                        conn.execute("INSERT INTO insurers (id, name) VALUES (?, ?)", (insurer_ids[insurer], insurer))
+                cell_insurers.append([insurer_ids[insurer] for insurer in names])
+            cell_insurers.append([])  # code -1 (missing) picks the last entry
+
+            conn.executemany("INSERT INTO doctors VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", zip(
+                ids, text["name"], text["specialty"], text["location"], text["hospital"], costs,
+                text["available_slots"], keys["location"], keys["specialty"]
+            ))
+            conn.executemany("INSERT INTO doctor_insurers VALUES (?, ?, ?)", (
+                (row_id, insurer, position)
+                for row_id, code in zip(ids, codes.tolist())
+                for position, insurer in enumerate(cell_insurers[code])
+            ))
+            doctor_id += len(chunk)
+        # Indexes are cheaper to build once over the loaded tables than to maintain per insert
+        for statement in INDEXES:
+            conn.execute(statement)
+        conn.execute("ANALYZE")
+        conn.commit()
+    except BaseException:
+        conn.close()
+        os.remove(tmp_path)
+        raise
+    conn.close()
+    os.replace(tmp_path, db_path)
+    return doctor_id
+
+
+class SQLiteDoctorRepository(DoctorRepository):
+    """Doctors in an embedded SQLite database built by import_csv().
+
+    Each fallback stage is a covering-index count plus a LIMIT query in
+    (cost, id) order, first over doctors taking the patient's insurance and
+    then over the rest, so memory stays flat however many doctors there are.
+    The database is opened read-only and reopened when an import replaces it.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv("DOCTOR_SQLITE_PATH", "doctor_database.db")
+        self._lock = threading.Lock()
+        self._conn = None
+        self._inode = None
+        self.doctors = 0
+        self.opens = 0
+        self.lookups = 0
+        self.stage_counts = {stage: 0 for stage in STAGES}
+        self.query_seconds = 0.0
+
+    def _connection(self):
+        """Connection to the current database file (caller holds the lock)"""
+        inode = os.stat(self.path).st_ino
+        if self._conn is None or inode != self._inode:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = sqlite3.connect(f"file:{os.path.abspath(self.path)}?mode=ro", uri=True,
+                                         check_same_thread=False)
+            self._inode = inode
+            self.doctors = self._conn.execute("SELECT count(*) FROM doctors").fetchone()[0]
+            self.opens += 1
+        return self._conn
+
+    def available(self) -> bool:
+        return os.path.exists(self.path)
+
+    def describe(self) -> str:
+        return f"SQLite database at {self.path}"
+
+    def recommend(self, location, specialty, insurance, limit=5):
+        if not self.available():
+            return None
+        location, specialty = normalize(location), normalize(specialty)
+        plans = split_insurers(insurance) if isinstance(insurance, str) or insurance is None \
+            else tuple(normalize(plan) for plan in insurance)
+        started = time.perf_counter()
+        with self._lock:
+            conn = self._connection()
+            stage, matched = "all", self.doctors
+            for candidate in STAGES[:-1]:
+                condition, params = STAGE_FILTERS[candidate]
+                count = conn.execute(f"SELECT count(*) FROM doctors WHERE {condition}",
+                                     params(location, specialty)).fetchone()[0]
+                if count:
+                    stage, matched = candidate, count
+                    break
+            condition, params = STAGE_FILTERS[stage]
+            params = params(location, specialty)
+
+            insurer_ids = []
+            if plans:
+                marks = ", ".join("?" * len(plans))
+                insurer_ids = [row[0] for row in conn.execute(
+                    f"SELECT id FROM insurers WHERE name IN ({marks})", plans)]
+            accepted_rows = []
+            if insurer_ids:
+                takes_plan = ("EXISTS (SELECT 1 FROM doctor_insurers di WHERE di.doctor_id = d.id "
+                              f"AND di.insurer_id IN ({', '.join('?' * len(insurer_ids))}))")
+                accepted_rows = conn.execute(
+                    f"SELECT {DOCTOR_COLUMNS} FROM doctors d WHERE {condition} AND {takes_plan} "
+                    "ORDER BY d.cost, d.id LIMIT ?", (*params, *insurer_ids, limit)
+                ).fetchall()
+                other_filter = f"{condition} AND NOT {takes_plan}"
+                other_params = (*params, *insurer_ids)
+            else:
+                other_filter, other_params = condition, params
+            other_rows = []
+            if len(accepted_rows) < limit:
+                other_rows = conn.execute(
+                    f"SELECT {DOCTOR_COLUMNS} FROM doctors d WHERE {other_filter} "
+                    "ORDER BY d.cost, d.id LIMIT ?", (*other_params, limit - len(accepted_rows))
+                ).fetchall()
+
+            rows = accepted_rows + other_rows
+            insurers = {row[0]: [] for row in rows}
+            if rows:
+                for doctor_id, name in conn.execute(
+                    "SELECT di.doctor_id, i.name FROM doctor_insurers di JOIN insurers i ON i.id = di.insurer_id "
+                    f"WHERE di.doctor_id IN ({', '.join('?' * len(rows))}) ORDER BY di.doctor_id, di.position",
+                    list(insurers)
+                ):
+                    insurers[doctor_id].append(name)
+            self.lookups += 1
+            self.stage_counts[stage] += 1
+            self.query_seconds += time.perf_counter() - started
+
+        doctors = [{
+            "name": name, "specialty": doctor_specialty, "location": doctor_location, "hospital": hospital,
+            "cost": cost, "insurance": tuple(insurers[doctor_id]), "available_slots": slots or ""
+        } for doctor_id, name, doctor_specialty, doctor_location, hospital, cost, slots in rows]
+        accepted = [True] * len(accepted_rows) + [False] * len(other_rows)
+        return Recommendation(stage, matched, doctors, accepted, bool(accepted_rows))
+
+    def stats(self) -> dict:
+        return {
+            "repository": self.name,
+            "path": self.path,
+            "doctors": self.doctors,
+            "opens": self.opens,
+            "lookups": self.lookups,
+            "lookups_by_stage": dict(self.stage_counts),
+            "avg_query_ms": round(1000 * self.query_seconds / self.lookups, 3) if self.lookups else None
+        }
+
+
+def create_doctor_repository(kind: str = None) -> DoctorRepository:
+    """Create the repository selected by DOCTOR_REPOSITORY (csv or sqlite)"""
+    kind = (kind or os.getenv("DOCTOR_REPOSITORY", "csv")).lower()
+    if kind == "sqlite":
+        return SQLiteDoctorRepository()
+    if kind != "csv":
+        print(f"⚠️ Unknown DOCTOR_REPOSITORY '{kind}', using the CSV catalog")
+    return CSVDoctorRepository()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the doctor repository")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="convert the doctor CSV into a SQLite database")
+    import_parser.add_argument("--csv", help="doctor CSV (default: DOCTOR_DATABASE_PATH or doctor_database.csv)")
+    import_parser.add_argument("--db", help="database to write (default: DOCTOR_SQLITE_PATH or doctor_database.db)")
+    search_parser = commands.add_parser("search", help="run one recommendation lookup")
+    search_parser.add_argument("location")
+    search_parser.add_argument("specialty")
+    search_parser.add_argument("--insurance", default="")
+    search_parser.add_argument("--repository", choices=("csv", "sqlite"))
+    args = parser.parse_args()
+
+    if args.command == "import":
+        csv_path = args.csv or DOCTOR_CATALOG.resolve_path()
+        if csv_path is None:
+            parser.error("doctor database not found")
+        db_path = args.db or SQLiteDoctorRepository().path
+        started = time.perf_counter()
+        count = import_csv(csv_path, db_path)
+        print(f"✅ Imported {count} doctors from {csv_path} into {db_path} in {time.perf_counter() - started:.1f}s")
+    else:
+        repository = create_doctor_repository(args.repository)
+        result = repository.recommend(args.location, args.specialty, args.insurance)
+        if result is None:
+            parser.error(f"{repository.describe()} not found")
+        print(f"🔎 {result.matched} doctors matched ({result.stage}) in {repository.describe()}")
+        for doctor, accepted in zip(result.doctors, result.accepted):
+            print(f"   {'✅' if accepted else '  '} {doctor['name']:28} {doctor['specialty']:20} "
+                  f"{doctor['location']:12} {doctor['cost']:6}")
+
+
+DOCTOR_REPOSITORY = create_doctor_repository()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import asyncio
 import json
 import os
 import requests
@@ -9,7 +10,10 @@ from crewai.tools import BaseTool
 import google.generativeai as genai
 import urllib3
 from .video_call_tool import VideoCallTool
-from model_config import get_model_with_retry
+from model_config import get_model_with_retry, run_coroutine
+from llm_cache import LLM_CACHE
+from priority_scheduler import EMERGENCY, escalate_current_priority
+from deadlines import deadline, EMERGENCY_DEADLINE_SECONDS
 
 # Disable SSL warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -27,11 +31,14 @@ class EmergencyResponseTool(BaseTool):
     args_schema: Type[BaseModel] = EmergencyResponseInput
 
     def _run(self, patient_info: dict, symptom_assessment: dict) -> str:
+        return run_coroutine(self._arun(patient_info, symptom_assessment))
+
+    async def _arun(self, patient_info: dict, symptom_assessment: dict) -> str:
         try:
             print("🚨 EMERGENCY RESPONSE TOOL ACTIVATED")
             
             # Check if this is an emergency
-            is_emergency = self._check_emergency_criteria(patient_info, symptom_assessment)
+            is_emergency = await self._check_emergency_criteria(patient_info, symptom_assessment)
             
             if not is_emergency:
                 return json.dumps({
@@ -40,39 +47,43 @@ class EmergencyResponseTool(BaseTool):
                 })
             
             print("🚨 EMERGENCY DETECTED - INITIATING RESPONSE")
+            # Move this conversation's remaining LLM calls and crews into the emergency lane
+            escalate_current_priority(EMERGENCY, "emergency criteria met")
             
-            # Extract emergency details
-            emergency_type = self._determine_emergency_type(patient_info, symptom_assessment)
-            patient_location = patient_info.get('location', 'Unknown Location')
-            patient_name = patient_info.get('name', 'Unknown Patient')
-            patient_contact = patient_info.get('contact', 'No contact provided')
+            # The whole response shares one time budget; LLM steps that run out of it use their fallbacks
+            with deadline(EMERGENCY_DEADLINE_SECONDS):
+                # Extract emergency details
+                emergency_type = await self._determine_emergency_type(patient_info, symptom_assessment)
+                patient_location = patient_info.get('location', 'Unknown Location')
+                patient_name = patient_info.get('name', 'Unknown Patient')
+                patient_contact = patient_info.get('contact', 'No contact provided')
             
-            # Get dynamic emergency contacts
-            emergency_contacts = self._get_emergency_contacts(patient_location)
+                # Get dynamic emergency contacts
+                emergency_contacts = await self._get_emergency_contacts(patient_location)
             
-            # 1. Generate AI Doctor Script
-            ai_doctor_script = self._generate_ai_doctor_script(patient_info, symptom_assessment, emergency_type)
+                # 1. Generate AI Doctor Script
+                ai_doctor_script = await self._generate_ai_doctor_script(patient_info, symptom_assessment, emergency_type)
             
-            # 2. Call Ambulance (Simulated with free SMS service)
-            ambulance_result = self._call_ambulance(patient_name, patient_location, emergency_type, patient_contact, emergency_contacts)
+                # 2. Call Ambulance (Simulated with free SMS service)
+                ambulance_result = await asyncio.to_thread(self._call_ambulance, patient_name, patient_location, emergency_type, patient_contact, emergency_contacts)
             
-            # 3. Generate Calming Guidance
-            calming_guidance = self._generate_calming_guidance(emergency_type, patient_info)
+                # 3. Generate Calming Guidance
+                calming_guidance = await self._generate_calming_guidance(emergency_type, patient_info)
             
-            # 4. Generate Monitoring Instructions
-            monitoring_instructions = self._generate_monitoring_instructions(emergency_type)
+                # 4. Generate Monitoring Instructions
+                monitoring_instructions = await self._generate_monitoring_instructions(emergency_type)
             
-            # 5. Immediate Actions List
-            immediate_actions = self._generate_immediate_actions(emergency_type, patient_info, symptom_assessment)
+                # 5. Immediate Actions List
+                immediate_actions = await self._generate_immediate_actions(emergency_type, patient_info, symptom_assessment)
             
-            # 6. Setup Video Call (NEW)
-            video_call_tool = VideoCallTool()
-            video_call_result = video_call_tool._run(patient_info, emergency_type, ai_doctor_script)
+                # 6. Setup Video Call (NEW)
+                video_call_tool = VideoCallTool()
+                video_call_result = await video_call_tool._arun(patient_info, emergency_type, ai_doctor_script)
             
-            try:
-                video_call_data = json.loads(video_call_result)
-            except json.JSONDecodeError:
-                video_call_data = {"video_call_created": False, "error": "Failed to parse video call result"}
+                try:
+                    video_call_data = json.loads(video_call_result)
+                except json.JSONDecodeError:
+                    video_call_data = {"video_call_created": False, "error": "Failed to parse video call result"}
             
             emergency_response = {
                 "emergency_detected": True,
@@ -93,7 +104,7 @@ class EmergencyResponseTool(BaseTool):
             }
             
             # Save emergency response to file
-            self._save_emergency_response(emergency_response)
+            await asyncio.to_thread(self._save_emergency_response, emergency_response)
             
             return json.dumps(emergency_response, indent=2)
             
@@ -105,10 +116,10 @@ class EmergencyResponseTool(BaseTool):
                 "message": "Emergency detected but response failed. Please call emergency services manually."
             })
 
-    def _check_emergency_criteria(self, patient_info: dict, symptom_assessment: dict) -> bool:
+    async def _check_emergency_criteria(self, patient_info: dict, symptom_assessment: dict) -> bool:
         """Dynamically check if symptoms meet emergency criteria using AI"""
         try:
-            model = get_model_with_retry()
+            model = get_model_with_retry(hedge=True)
             
             prompt = f"""
             You are an emergency medical AI. Analyze the following patient information and determine if this is a CRITICAL medical emergency that requires immediate intervention and AI virtual doctor support.
@@ -158,7 +169,7 @@ class EmergencyResponseTool(BaseTool):
             CRITICAL: AI Virtual Doctor should ONLY appear for GENUINE LIFE-THREATENING emergencies that require immediate medical intervention and calming presence. Be very strict - only activate for severe, critical situations.
             """
             
-            response = model.generate_content(prompt)
+            response = await model.generate_content_async(prompt)
             result_text = response.text.strip()
             
             # Try to parse JSON response
@@ -186,10 +197,10 @@ class EmergencyResponseTool(BaseTool):
             urgency = symptom_assessment.get('urgency', '').lower()
             return severity in ['high', 'critical'] and urgency in ['urgent', 'immediate']
 
-    def _determine_emergency_type(self, patient_info: dict, symptom_assessment: dict) -> str:
+    async def _determine_emergency_type(self, patient_info: dict, symptom_assessment: dict) -> str:
         """Dynamically determine emergency type using AI"""
         try:
-            model = get_model_with_retry()
+            model = get_model_with_retry(hedge=True)
             
             prompt = f"""
             You are an emergency medicine specialist. Based on the patient information, determine the specific type of medical emergency.
@@ -215,17 +226,17 @@ class EmergencyResponseTool(BaseTool):
             Respond with ONLY the emergency type name, nothing else.
             """
             
-            response = model.generate_content(prompt)
+            response = await model.generate_content_async(prompt)
             return response.text.strip()
             
         except Exception as e:
             print(f"Error determining emergency type: {e}")
             return "General Medical Emergency"
 
-    def _generate_ai_doctor_script(self, patient_info: dict, symptom_assessment: dict, emergency_type: str) -> str:
+    async def _generate_ai_doctor_script(self, patient_info: dict, symptom_assessment: dict, emergency_type: str) -> str:
         """Generate AI doctor consultation script using Gemini"""
         try:
-            model = get_model_with_retry()
+            model = get_model_with_retry(hedge=True)
             
             prompt = f"""
             You are a professional emergency medicine doctor conducting a video consultation.
@@ -254,7 +265,7 @@ class EmergencyResponseTool(BaseTool):
             Focus on emergency protocols and immediate patient safety.
             """
             
-            response = model.generate_content(prompt)
+            response = await model.generate_content_async(prompt)
             return response.text.strip()
             
         except Exception as e:
@@ -332,10 +343,10 @@ class EmergencyResponseTool(BaseTool):
                 "message": "SMS sending failed"
             }
 
-    def _generate_calming_guidance(self, emergency_type: str, patient_info: dict) -> str:
+    async def _generate_calming_guidance(self, emergency_type: str, patient_info: dict) -> str:
         """Generate calming guidance for the patient"""
         try:
-            model = get_model_with_retry()
+            model = get_model_with_retry(hedge=True)
             
             prompt = f"""
             Generate calming, reassuring guidance for a patient experiencing a {emergency_type}.
@@ -353,16 +364,16 @@ class EmergencyResponseTool(BaseTool):
             Keep it comforting, professional, and immediately helpful.
             """
             
-            response = model.generate_content(prompt)
+            response = await model.generate_content_async(prompt)
             return response.text.strip()
             
         except Exception as e:
             return f"Stay calm. Help is on the way. Emergency services have been notified."
 
-    def _generate_monitoring_instructions(self, emergency_type: str) -> str:
+    async def _generate_monitoring_instructions(self, emergency_type: str) -> str:
         """Generate monitoring instructions for the emergency"""
         try:
-            model = get_model_with_retry()
+            model = get_model_with_retry(hedge=True)
             
             prompt = f"""
             Generate monitoring instructions for a {emergency_type}.
@@ -377,16 +388,16 @@ class EmergencyResponseTool(BaseTool):
             Make it clear and actionable for non-medical personnel.
             """
             
-            response = model.generate_content(prompt)
+            response = await model.generate_content_async(prompt, cache_family="monitoring_instructions", cache_key=emergency_type)
             return response.text.strip()
             
         except Exception as e:
             return "Monitor breathing, consciousness, and vital signs. Call for help if condition worsens."
 
-    def _generate_immediate_actions(self, emergency_type: str, patient_info: dict, symptom_assessment: dict) -> list:
+    async def _generate_immediate_actions(self, emergency_type: str, patient_info: dict, symptom_assessment: dict) -> list:
         """Dynamically generate immediate actions based on emergency type using AI"""
         try:
-            model = get_model_with_retry()
+            model = get_model_with_retry(hedge=True)
             
             prompt = f"""
             You are an emergency medical coordinator. Generate a list of immediate actions that should be taken for this specific emergency.
@@ -414,7 +425,7 @@ class EmergencyResponseTool(BaseTool):
             Make actions specific to this emergency type and patient situation.
             """
             
-            response = model.generate_content(prompt)
+            response = await model.generate_content_async(prompt)
             result_text = response.text.strip()
             
             # Try to parse JSON response
@@ -465,10 +476,10 @@ class EmergencyResponseTool(BaseTool):
         except Exception as e:
             print(f"⚠️ Could not save emergency response: {e}") 
 
-    def _get_emergency_contacts(self, patient_location: str) -> dict:
+    async def _get_emergency_contacts(self, patient_location: str) -> dict:
         """Dynamically get emergency contact numbers based on patient location"""
         try:
-            model = get_model_with_retry()
+            model = get_model_with_retry(hedge=True)
             
             prompt = f"""
             You are an emergency services coordinator. Based on the patient's location, provide the appropriate emergency contact numbers.
@@ -496,13 +507,15 @@ class EmergencyResponseTool(BaseTool):
             Use standard emergency numbers for the detected country/region.
             """
             
-            response = model.generate_content(prompt)
+            # Emergency numbers only depend on the location, so reuse earlier answers
+            response = await model.generate_content_async(prompt, cache_family="emergency_contacts", cache_key=patient_location)
             result_text = response.text.strip()
             
             try:
                 contacts = json.loads(result_text)
                 return contacts
             except json.JSONDecodeError:
+                LLM_CACHE.discard("emergency_contacts", patient_location)
                 return self._get_fallback_contacts(patient_location)
                 
         except Exception as e:
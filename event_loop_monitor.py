@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Event loop lag monitor that catches blocking calls hiding inside async handlers
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+from priority_scheduler import percentile
+
+
+class EventLoopMonitor:
+    """Measures event loop lag and records what was running when the loop stalled.
+
+    A heartbeat coroutine sleeps for interval seconds and records how late it
+    wakes up. A watchdog thread notices when the heartbeat has been silent for
+    longer than stall_threshold and captures the loop thread's stack, the task
+    that was running and the endpoint that task was serving, so the blocking
+    call shows up while it is still blocking.
+    """
+
+    def __init__(self, interval: float = None, stall_threshold: float = None,
+                 max_stalls: int = 100, sample_size: int = 2000):
+        self.interval = interval or float(os.getenv("LOOP_MONITOR_INTERVAL_MS", "50")) / 1000
+        self.stall_threshold = stall_threshold or float(os.getenv("LOOP_STALL_THRESHOLD_MS", "200")) / 1000
+        self._lags = deque(maxlen=sample_size)
+        self._stalls = deque(maxlen=max_stalls)
+        self._open_stall = None
+        self._endpoints = {}  # running task -> endpoint label
+        self._lock = threading.Lock()
+        self._loop = None
+        self._loop_thread_id = None
+        self._last_beat = None
+        self._heartbeat_task = None
+        self._watchdog = None
+        self._stopped = threading.Event()
+        self.total_stalls = 0
+
+    async def start(self):
+        """Start monitoring the running event loop"""
+        if self._heartbeat_task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._heartbeat_task = asyncio.ensure_future(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="event-loop-watchdog", daemon=True)
+        self._watchdog.start()
+        print(f"🩺 Event loop monitor started (stall threshold {self.stall_threshold * 1000:.0f}ms)")
+
+    async def stop(self):
+        self._stopped.set()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat_task = None
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            with self._lock:
+                self._lags.append(lag)
+                self._last_beat = now
+                if self._open_stall is not None:
+                    # The loop is responsive again; close out the stall with its full length
+                    self._open_stall["duration_ms"] = round(lag * 1000, 1)
+                    self._open_stall = None
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            with self._lock:
+                silent_for = time.monotonic() - self._last_beat - self.interval
+                if silent_for < self.stall_threshold or self._open_stall is not None:
+                    continue
+                stall = self._capture(silent_for)
+                self._open_stall = stall
+                self._stalls.append(stall)
+                self.total_stalls += 1
+            print(f"🐢 Event loop stalled for {stall['duration_ms']:.0f}ms+ in "
+                  f"{stall['endpoint'] or stall['coroutine'] or 'unknown code'}")
+
+    def _capture(self, silent_for: float) -> dict:
+        """Snapshot the loop thread while it is blocked (caller holds the lock)"""
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = traceback.format_stack(frame)[-15:] if frame is not None else []
+        task = asyncio.current_task(self._loop)
+        coroutine = None
+        if task is not None:
+            coro = task.get_coro()
+            coroutine = getattr(coro, "__qualname__", None) or repr(coro)
+        return {
+            "detected_at": datetime.now().isoformat(),
+            "duration_ms": round(silent_for * 1000, 1),
+            "task": task.get_name() if task is not None else None,
+            "coroutine": coroutine,
+            "endpoint": self._endpoints.get(task),
+            "stack": [line.rstrip() for line in stack]
+        }
+
+    @contextmanager
+    def track(self, endpoint: str):
+        """Label the current task with the endpoint it is serving"""
+        task = asyncio.current_task()
+        self._endpoints[task] = endpoint
+        try:
+            yield
+        finally:
+            self._endpoints.pop(task, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lags = list(self._lags)
+            stalls = [dict(stall) for stall in self._stalls]
+        return {
+            "running": self._heartbeat_task is not None,
+            "interval_ms": round(self.interval * 1000, 1),
+            "stall_threshold_ms": round(self.stall_threshold * 1000, 1),
+            "lag_ms": {
+                "p50": round(percentile(lags, 50) * 1000, 1),
+                "p99": round(percentile(lags, 99) * 1000, 1),
+                "max": round(max(lags, default=0.0) * 1000, 1)
+            },
+            "total_stalls": self.total_stalls,
+            "active_endpoints": sorted(set(self._endpoints.values())),
+            "recent_stalls": list(reversed(stalls))
+        }
+
+
+class EventLoopMonitorMiddleware:
+    """ASGI middleware that tells the monitor which endpoint each task is serving"""
+
+    def __init__(self, app, monitor: EventLoopMonitor):
+        self.app = app
+        self.monitor = monitor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+        label = f"{scope.get('method', 'WEBSOCKET')} {scope['path']}"
+        with self.monitor.track(label):
+            await self.app(scope, receive, send)
+
+
+# Global event loop monitor instance
+event_loop_monitor = EventLoopMonitor()
@@ -1,7 +1,10 @@
 import time
 import os
 import google.generativeai as genai
-from model_config import get_model_with_retry
+from model_config import get_model_with_retry, ModelConfig
+from llm_cassette import LLM_CASSETTE
+from deadlines import remaining_time
+from rate_limiter import RateLimitExceededError
 from tenacity import retry, stop_after_attempt, wait_exponential
 import logging
 
@@ -11,7 +14,7 @@ logger = logging.getLogger(__name__)
 
 # Configure API key
 api_key = os.getenv("GOOGLE_API_KEY")
-if not api_key:
+if not api_key and not (ModelConfig.is_offline(ModelConfig.get_model_name()) or LLM_CASSETTE.replaying):
     raise ValueError("GOOGLE_API_KEY environment variable is not set")
 genai.configure(api_key=api_key)
 
@@ -19,7 +22,12 @@ class QuotaExhaustedError(Exception):
     """Custom exception for quota exhaustion"""
     pass
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+def _out_of_budget(retry_state) -> bool:
+    """Stop retrying once the request deadline can't cover another backoff"""
+    budget = remaining_time()
+    return budget is not None and budget < 4
+
+@retry(stop=(stop_after_attempt(3) | _out_of_budget), wait=wait_exponential(multiplier=1, min=4, max=10))
 def call_gemini_with_retry(prompt: str, temperature: float = 0.7, max_output_tokens: int = 1000, top_p: float = 0.8, top_k: int = 40) -> str:
     try:
         generation_config = genai.types.GenerationConfig(
@@ -39,6 +47,11 @@ def call_gemini_with_retry(prompt: str, temperature: float = 0.7, max_output_tok
     except Exception as e:
         error_str = str(e)
         
+        # Our own limiter held the call back to stay under quota (on every model, if the router gave up); worth retrying shortly
+        if isinstance(e, RateLimitExceededError) or isinstance(e.__cause__, RateLimitExceededError):
+            logger.warning(f"🚦 Gemini calls are being throttled to stay under quota: {error_str}")
+            raise
+        
         # Check for quota exhaustion
         if "429" in error_str and "quota" in error_str.lower():
             logger.error("🚨 Google Gemini API quota exhausted!")
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+LRU + TTL cache for LLM prompts that are pure functions of a small key
+"""
+
+import atexit
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Seconds a cached answer stays valid, per prompt family
+DEFAULT_FAMILY_TTLS = {
+    "emergency_contacts": 7 * 24 * 3600,
+    "specialty_mapping": 24 * 3600,
+    "monitoring_instructions": 24 * 3600
+}
+
+
+class CachedResponse:
+    """Stands in for a Gemini response when the answer comes from the cache"""
+
+    cached = True
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+def normalize_key(key) -> str:
+    """Case-fold and collapse whitespace so trivially different inputs share an entry"""
+    if isinstance(key, dict):
+        return json.dumps({k: normalize_key(v) for k, v in sorted(key.items())}, sort_keys=True)
+    if isinstance(key, (list, tuple)):
+        return json.dumps([normalize_key(part) for part in key])
+    text = re.sub(r"\s+", " ", str(key)).strip().casefold()
+    return text.rstrip(".!?;,")
+
+
+class LLMResponseCache:
+    """Size-bounded LRU cache of LLM answer text with per-family TTLs.
+
+    Entries are keyed by prompt family plus a normalized key. TTLs come from
+    DEFAULT_FAMILY_TTLS, overridable with LLM_CACHE_TTL_<FAMILY> (seconds);
+    other families use LLM_CACHE_DEFAULT_TTL. When a path is given
+    (LLM_CACHE_PATH) entries are saved to a JSON file and reloaded on start,
+    so answers survive restarts. Saving is write-behind: changes only mark the
+    cache dirty, and a background thread writes a burst of them at most every
+    LLM_CACHE_FLUSH_SECONDS, plus once more at exit.
+    """
+
+    def __init__(self, max_entries: int = None, path: str = None, family_ttls: dict = None,
+                 default_ttl: float = None, flush_interval: float = None):
+        self.max_entries = max_entries or int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+        self.path = path if path is not None else os.getenv("LLM_CACHE_PATH")
+        self.default_ttl = default_ttl or float(os.getenv("LLM_CACHE_DEFAULT_TTL", "3600"))
+        self.flush_interval = flush_interval if flush_interval is not None else float(os.getenv("LLM_CACHE_FLUSH_SECONDS", "1.0"))
+        self.family_ttls = dict(DEFAULT_FAMILY_TTLS)
+        for family in list(self.family_ttls):
+            env_ttl = os.getenv(f"LLM_CACHE_TTL_{family.upper()}")
+            if env_ttl:
+                self.family_ttls[family] = float(env_ttl)
+        self.family_ttls.update(family_ttls or {})
+        self._entries = OrderedDict()  # cache key -> (text, expires_at wall time)
+        self._lock = threading.RLock()
+        self.hits = {}
+        self.misses = {}
+        self.evictions = 0
+        self._dirty = False
+        self._wake = threading.Event()
+        self._save_lock = threading.Lock()
+        self._saver = None
+        if self.path:
+            self._load()
+
+    def ttl_for(self, family: str) -> float:
+        return self.family_ttls.get(family, self.default_ttl)
+
+    @staticmethod
+    def _cache_key(family: str, key) -> str:
+        return f"{family}:{normalize_key(key)}"
+
+    def get(self, family: str, key):
+        """Cached answer text, or None on a miss"""
+        cache_key = self._cache_key(family, key)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[1] <= time.time():
+                del self._entries[cache_key]
+                entry = None
+            if entry is None:
+                self.misses[family] = self.misses.get(family, 0) + 1
+                return None
+            self._entries.move_to_end(cache_key)
+            self.hits[family] = self.hits.get(family, 0) + 1
+            return entry[0]
+
+    def set(self, family: str, key, text: str):
+        cache_key = self._cache_key(family, key)
+        with self._lock:
+            self._entries[cache_key] = (text, time.time() + self.ttl_for(family))
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            if self.path:
+                self._mark_dirty()
+
+    def discard(self, family: str, key):
+        """Drop an entry, e.g. when the cached answer turned out to be unusable"""
+        with self._lock:
+            if self._entries.pop(self._cache_key(family, key), None) is not None and self.path:
+                self._mark_dirty()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self.path:
+                self._mark_dirty()
+
+    def flush(self):
+        """Write pending changes to disk now"""
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                snapshot = {cache_key: list(entry) for cache_key, entry in self._entries.items()}
+                self._dirty = False
+            self._save(snapshot)
+
+    def _mark_dirty(self):
+        """Schedule a background save (caller holds the lock)"""
+        self._dirty = True
+        if self._saver is None:
+            self._saver = threading.Thread(target=self._save_loop, name="llm-cache-saver", daemon=True)
+            self._saver.start()
+            atexit.register(self.flush)
+        self._wake.set()
+
+    def _save_loop(self):
+        while True:
+            self._wake.wait()
+            # Let a burst of inserts settle so they share one write
+            time.sleep(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"⚠️ Could not load LLM cache from {self.path}: {e}")
+            return
+        now = time.time()
+        for cache_key, (text, expires_at) in stored.items():
+            if expires_at > now:
+                self._entries[cache_key] = (text, expires_at)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        print(f"💾 Loaded {len(self._entries)} cached LLM answers from {self.path}")
+
+    def _save(self, snapshot: dict):
+        """Write a snapshot of the entries to disk atomically (caller holds the save lock)"""
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, "w") as f:
+                json.dump(snapshot, f)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            print(f"⚠️ Could not persist LLM cache to {self.path}: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            families = sorted(set(self.hits) | set(self.misses))
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "evictions": self.evictions,
+                "persistent": bool(self.path),
+                "families": {
+                    family: {
+                        "hits": self.hits.get(family, 0),
+                        "misses": self.misses.get(family, 0),
+                        "hit_rate": round(
+                            self.hits.get(family, 0) / (self.hits.get(family, 0) + self.misses.get(family, 0)), 3
+                        ),
+                        "ttl_seconds": self.ttl_for(family)
+                    }
+                    for family in families
+                }
+            }
+
+
+# Global LLM response cache
+LLM_CACHE = LLMResponseCache()
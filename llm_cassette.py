@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+"""
+Record and replay Gemini traffic through the model layer
+
+LLM_CASSETTE_MODE=record wraps every Gemini model so each call's prompt,
+answer, latency and outcome are appended to a gzipped JSON-lines cassette
+(LLM_CASSETTE_PATH) with patient identifiers scrubbed. LLM_CASSETTE_MODE=replay
+serves the recorded answers back with the recorded latencies scaled by
+LLM_CASSETTE_SPEED (1 = original timing, 0.1 = ten times faster, 0 = no
+waiting), so the emergency and intake flows run end to end without network
+access. Prompts the cassette has not seen get an offline stand-in answer.
+
+    python llm_cassette.py stats llm_cassette.jsonl.gz
+    python llm_cassette.py bench llm_cassette.jsonl.gz --speed 0.1 --out before.json
+    python llm_cassette.py compare before.json after.json
+
+bench replays the recorded calls through the model pool (rate limiter,
+priority gate, breakers, coalescing) at their recorded offsets and
+priorities and reports p50/p99 per prompt family; compare diffs two reports.
+"""
+
+import argparse
+import asyncio
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from offline_model import OfflineGenerativeModel, OfflineResponse, prompt_family, prompt_text
+from priority_scheduler import ROUTINE, percentile, current_priority_level
+from rate_limiter import CHARS_PER_TOKEN, tokens_used
+
+# JSON fields and "Label: value" lines that identify a patient
+PII_KEYS = ("name", "patient_name", "contact", "phone", "email", "address", "location", "patient_location",
+            "emergency_contact")
+_PII_JSON = re.compile(r'"(%s)"\s*:\s*"([^"]*)"' % "|".join(PII_KEYS), re.IGNORECASE)
+_PII_LINE = re.compile(
+    r"^([ \t-]*(?:patient(?:[ \t]+(?:name|contact|phone|email|address|location))?|name|contact|phone|email|address|location)"
+    r"[ \t]*:[ \t]*)(\S.*)$",
+    re.IGNORECASE | re.MULTILINE
+)
+_PII_PATTERNS = [
+    (re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+"), "<email>"),
+    (re.compile(r"\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?"), "<date>"),
+    (re.compile(r"\+?\d[\d ().-]{7,}\d"), "<phone>"),
+    (re.compile(r"\bAPT[A-Z0-9_]{4,}\b"), "<appointment_id>"),
+]
+
+
+def _redact_values(text: str, values) -> str:
+    """Replace every occurrence of the removed values, word by word (e.g. a first name on its own)"""
+    words = {word for value in values for word in [value] + value.split() if len(word) >= 3}
+    for word in sorted(words, key=len, reverse=True):
+        text = re.sub(r"\b%s\b" % re.escape(word), "<redacted>", text)
+    return text
+
+
+def scrub(text: str):
+    """Replace patient identifiers in a prompt; returns the scrubbed text and the values removed"""
+    values = set()
+
+    def json_field(match):
+        values.add(match.group(2))
+        return f'"{match.group(1)}": "<{match.group(1).lower()}>"'
+
+    def line_field(match):
+        values.add(match.group(2).strip())
+        return match.group(1) + "<redacted>"
+
+    text = _PII_JSON.sub(json_field, text)
+    text = _PII_LINE.sub(line_field, text)
+    values = {value for value in values if len(value) >= 3 and not value.startswith("<")}
+    # The same identifiers turn up in free text too ("Hello Asha Patil"), which also keeps them out of the replay key
+    text = _redact_values(text, values)
+    for pattern, placeholder in _PII_PATTERNS:
+        text = pattern.sub(placeholder, text)
+    return text, values
+
+
+def scrub_response(text: str, values) -> str:
+    """Scrub an answer of the identifiers removed from its prompt"""
+    text = _redact_values(text, values)
+    for pattern, placeholder in _PII_PATTERNS:
+        text = pattern.sub(placeholder, text)
+    return text
+
+
+def prompt_key(scrubbed_prompt: str) -> str:
+    """Replay lookup key: the scrubbed prompt with whitespace normalized"""
+    return hashlib.sha256(" ".join(scrubbed_prompt.split()).encode("utf-8")).hexdigest()[:16]
+
+
+class RecordingModel:
+    """Wraps a genai model and records every call made through it"""
+
+    def __init__(self, model, model_name: str, cassette: "Cassette"):
+        self._model = model
+        self._model_name = model_name
+        self._cassette = cassette
+
+    def generate_content(self, *args, **kwargs):
+        started = time.monotonic()
+        try:
+            response = self._model.generate_content(*args, **kwargs)
+        except Exception as e:
+            self._cassette.record(self._model_name, prompt_text(args, kwargs), None, e, time.monotonic() - started)
+            raise
+        self._cassette.record(self._model_name, prompt_text(args, kwargs), response, None, time.monotonic() - started)
+        return response
+
+    async def generate_content_async(self, *args, **kwargs):
+        started = time.monotonic()
+        try:
+            response = await self._model.generate_content_async(*args, **kwargs)
+        except Exception as e:
+            self._cassette.record(self._model_name, prompt_text(args, kwargs), None, e, time.monotonic() - started)
+            raise
+        self._cassette.record(self._model_name, prompt_text(args, kwargs), response, None, time.monotonic() - started)
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+
+class ReplayModel:
+    """Drop-in for genai.GenerativeModel that answers from a cassette"""
+
+    def __init__(self, model_name: str, cassette: "Cassette"):
+        self.model_name = model_name
+        self._cassette = cassette
+
+    def _plan(self, args, kwargs):
+        """(delay, response or exception) for a call, or None when the cassette has no answer"""
+        prompt = prompt_text(args, kwargs)
+        entry = self._cassette.lookup(prompt)
+        if entry is None:
+            return None
+        delay = entry["latency_ms"] / 1000 * self._cassette.speed
+        timeout = (kwargs.get("request_options") or {}).get("timeout")
+        if timeout is not None and delay > timeout:
+            return timeout, Exception(f"504 Deadline Exceeded (replayed {self.model_name})")
+        if entry.get("error"):
+            return delay, Exception(entry["error"])
+        response = OfflineResponse(entry["response"] or "", len(prompt) // CHARS_PER_TOKEN + 1, entry["family"])
+        if entry.get("tokens"):
+            response.usage_metadata.total_token_count = entry["tokens"]
+        return delay, response
+
+    def generate_content(self, *args, **kwargs):
+        plan = self._plan(args, kwargs)
+        if plan is None:
+            return self._cassette.fallback(self.model_name).generate_content(*args, **kwargs)
+        delay, outcome = plan
+        if delay > 0:
+            time.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    async def generate_content_async(self, *args, **kwargs):
+        plan = self._plan(args, kwargs)
+        if plan is None:
+            return await self._cassette.fallback(self.model_name).generate_content_async(*args, **kwargs)
+        delay, outcome = plan
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class Cassette:
+    """A recording of Gemini calls on disk, in record, replay or off mode.
+
+    Entries are appended in batches of flush_every (each batch is one gzip
+    member, and members concatenate) and whatever is left at exit, so a long
+    recording compresses well and loses at most one batch if the process is
+    killed. On replay, calls whose scrubbed prompts match are served in
+    recorded order, cycling when a prompt is asked more often than it was
+    recorded.
+    """
+
+    def __init__(self, path: str = None, mode: str = None, speed: float = None, flush_every: int = 20):
+        self.path = path or os.getenv("LLM_CASSETTE_PATH", "llm_cassette.jsonl.gz")
+        self.mode = (mode if mode is not None else os.getenv("LLM_CASSETTE_MODE", "")).lower()
+        self.speed = speed if speed is not None else float(os.getenv("LLM_CASSETTE_SPEED", "1"))
+        self._lock = threading.Lock()
+        self.flush_every = flush_every
+        self._started = None
+        self._pending = []
+        self._index = None  # prompt key -> recorded entries
+        self._positions = {}
+        self._fallbacks = {}
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def wrap(self, model, model_name: str) -> RecordingModel:
+        return RecordingModel(model, model_name, self)
+
+    def replay_model(self, model_name: str) -> ReplayModel:
+        return ReplayModel(model_name, self)
+
+    def fallback(self, model_name: str) -> OfflineGenerativeModel:
+        with self._lock:
+            self.misses += 1
+            if model_name not in self._fallbacks:
+                self._fallbacks[model_name] = OfflineGenerativeModel(model_name, latency_ms=0, tail_ms=0, error_rate=0)
+            return self._fallbacks[model_name]
+
+    def record(self, model_name: str, prompt: str, response=None, error: Exception = None, latency: float = 0.0,
+               level: int = None):
+        scrubbed_prompt, values = scrub(prompt)
+        text = None
+        if response is not None:
+            try:
+                text = response.text
+            except Exception:
+                # Blocked or empty responses have no text
+                text = ""
+        entry = {
+            "model": model_name,
+            "level": current_priority_level() if level is None else level,
+            "family": prompt_family(prompt)[0],
+            "key": prompt_key(scrubbed_prompt),
+            "prompt": scrubbed_prompt,
+            "latency_ms": round(latency * 1000, 1),
+            "response": scrub_response(text, values) if text is not None else None,
+            "tokens": tokens_used(response) if response is not None else None,
+            "error": scrub_response(str(error), values)[:500] if error is not None else None
+        }
+        with self._lock:
+            now = time.monotonic()
+            if self._started is None:
+                self._started = now - latency
+            entry["t"] = round(now - latency - self._started, 3)
+            if self.recorded == 0:
+                atexit.register(self.flush)
+            self._pending.append(entry)
+            self.recorded += 1
+            if len(self._pending) >= self.flush_every:
+                self._flush()
+
+    def flush(self):
+        """Write recorded entries that are still in memory"""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        with gzip.open(self.path, "at", encoding="utf-8") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in self._pending)
+        self._pending = []
+
+    def entries(self) -> list:
+        """All recorded entries in the order they were written"""
+        if not os.path.exists(self.path):
+            return []
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def lookup(self, prompt: str):
+        """The next recorded entry for a prompt, or None when it was never recorded"""
+        key = prompt_key(scrub(prompt)[0])
+        with self._lock:
+            if self._index is None:
+                self._index = {}
+                for entry in self.entries():
+                    self._index.setdefault(entry["key"], []).append(entry)
+                print(f"📼 Loaded {sum(len(entries) for entries in self._index.values())} recorded LLM calls from {self.path}")
+            entries = self._index.get(key)
+            if not entries:
+                return None
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+            self.replayed += 1
+            return entries[position % len(entries)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "mode": self.mode or "off",
+                "path": self.path,
+                "speed": self.speed,
+                "recorded": self.recorded,
+                "replayed": self.replayed,
+                "misses": self.misses
+            }
+
+
+def latency_summary(samples: list, errors: int = 0) -> dict:
+    return {
+        "count": len(samples),
+        "errors": errors,
+        "p50_ms": round(percentile(samples, 50), 1),
+        "p99_ms": round(percentile(samples, 99), 1)
+    }
+
+
+def summarize(results: list) -> dict:
+    """Per-family and overall p50/p99 from (family, latency_ms, ok) results"""
+    samples, errors = {}, {}
+    for family, latency_ms, ok in results:
+        samples.setdefault(family, []).append(latency_ms)
+        errors[family] = errors.get(family, 0) + (0 if ok else 1)
+    return {
+        "overall": latency_summary([latency_ms for _, latency_ms, _ in results], sum(errors.values())),
+        "families": {family: latency_summary(samples[family], errors[family]) for family in sorted(samples)}
+    }
+
+
+def cassette_stats(path: str) -> dict:
+    """Recorded latencies of a cassette, per prompt family"""
+    entries = Cassette(path).entries()
+    report = summarize([(e["family"], e["latency_ms"], not e.get("error")) for e in entries])
+    report["cassette"] = path
+    return report
+
+
+def bench(path: str, speed: float = 1.0, pool=None) -> dict:
+    """Replay a cassette's calls through the model pool and measure them as the tools would see them"""
+    from model_config import MODEL_POOL, ModelConfig
+    from priority_scheduler import ConversationPriority, set_current_priority
+
+    pool = pool or MODEL_POOL
+    cassette = Cassette(path, mode="replay", speed=speed)
+    entries = cassette.entries()
+    for name in set(ModelConfig.get_fallback_models()) | {entry["model"] for entry in entries}:
+        pool.get(name)._model = cassette.replay_model(name)
+
+    async def replay_call(entry):
+        await asyncio.sleep(entry["t"] * speed)
+        set_current_priority(ConversationPriority("cassette", entry.get("level", ROUTINE)))
+        started = time.monotonic()
+        try:
+            await pool.router(entry["model"]).generate_content_async(entry["prompt"])
+            ok = True
+        except Exception:
+            ok = False
+        return entry["family"], (time.monotonic() - started) * 1000, ok
+
+    async def run():
+        pool.enable_native_async()
+        started = time.monotonic()
+        results = await asyncio.gather(*(replay_call(entry) for entry in entries))
+        return results, time.monotonic() - started
+
+    results, wall_seconds = asyncio.run(run())
+    report = summarize(results)
+    report.update({"cassette": path, "speed": speed, "wall_seconds": round(wall_seconds, 2),
+                   "replay": cassette.stats()})
+    return report
+
+
+def compare(before: dict, after: dict) -> dict:
+    """p50/p99 change per family between two bench reports (negative is faster)"""
+    changes = {}
+    names = ["overall"] + sorted(set(before["families"]) | set(after["families"]))
+    for name in names:
+        old = before["overall"] if name == "overall" else before["families"].get(name)
+        new = after["overall"] if name == "overall" else after["families"].get(name)
+        if not old or not new:
+            continue
+        changes[name] = {
+            f"{stat}_change_pct": round((new[stat] - old[stat]) / old[stat] * 100, 1) if old[stat] else None
+            for stat in ("p50_ms", "p99_ms")
+        }
+        changes[name].update({"before": old, "after": new})
+    return changes
+
+
+def print_report(report: dict):
+    overall = report["overall"]
+    print(f"📊 {overall['count']} calls, {overall['errors']} errors, p50 {overall['p50_ms']}ms, p99 {overall['p99_ms']}ms")
+    for family, summary in report["families"].items():
+        print(f"   {family:22} {summary['count']:5} calls  p50 {summary['p50_ms']:8.1f}ms  p99 {summary['p99_ms']:8.1f}ms  errors {summary['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect, replay and compare LLM cassettes")
+    commands = parser.add_subparsers(dest="command", required=True)
+    stats_parser = commands.add_parser("stats", help="recorded latencies per prompt family")
+    stats_parser.add_argument("cassette")
+    bench_parser = commands.add_parser("bench", help="replay a cassette through the model layer")
+    bench_parser.add_argument("cassette")
+    bench_parser.add_argument("--speed", type=float, default=1.0, help="scale recorded timing (0.1 = 10x faster)")
+    bench_parser.add_argument("--out", help="write the report as JSON")
+    compare_parser = commands.add_parser("compare", help="compare two bench reports")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        print_report(cassette_stats(args.cassette))
+    elif args.command == "bench":
+        report = bench(args.cassette, speed=args.speed)
+        print_report(report)
+        print(f"⏱️ Replayed in {report['wall_seconds']}s ({report['replay']['misses']} prompts not in the cassette)")
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"💾 Report written to {args.out}")
+    else:
+        with open(args.before) as f:
+            before = json.load(f)
+        with open(args.after) as f:
+            after = json.load(f)
+        for name, change in compare(before, after).items():
+            print(f"{name:22} p50 {change['before']['p50_ms']:8.1f} → {change['after']['p50_ms']:8.1f}ms ({change['p50_ms_change_pct']}%)"
+                  f"   p99 {change['before']['p99_ms']:8.1f} → {change['after']['p99_ms']:8.1f}ms ({change['p99_ms_change_pct']}%)")
+
+
+# Global cassette configured from the environment (off unless LLM_CASSETTE_MODE is set)
+LLM_CASSETTE = Cassette()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,24 @@ Model Configuration for AI Healthcare Assistant
 This file centralizes model selection to easily switch between different AI models
 """
 
+import asyncio
+import contextvars
+import hashlib
 import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
 from typing import Dict, Any
 
+from priority_scheduler import llm_gate, percentile, current_priority_level, GateTimeoutError
+from llm_cache import LLM_CACHE, CachedResponse
+from rate_limiter import rate_limiter, estimate_tokens, tokens_used
+from deadlines import DeadlineExceededError, call_timeout, deadline_expired
+from offline_model import OfflineGenerativeModel, OFFLINE_MODEL
+from llm_cassette import LLM_CASSETTE
+
 class ModelConfig:
     """Centralized model configuration"""
     
@@ -42,6 +57,15 @@ class ModelConfig:
             "temperature": 0.7,
             "reliability": "high",
             "speed": "medium"
+        },
+        OFFLINE_MODEL: {
+            "name": OFFLINE_MODEL,
+            "description": "Deterministic local stand-in for tests and benchmarks (no network, no API key)",
+            "max_tokens": 8192,
+            "temperature": 0.0,
+            "reliability": "configurable",
+            "speed": "configurable",
+            "backend": "offline"
         }
     }
     
@@ -59,11 +83,15 @@ class ModelConfig:
     @classmethod
     def get_model_name(cls, model_key: str = None) -> str:
         """Get the model name to use"""
+        env_model = os.getenv("GEMINI_MODEL", cls.DEFAULT_MODEL)
+        # An offline backend replaces every model, so nothing can reach the network
+        if cls.is_offline(env_model):
+            return cls.AVAILABLE_MODELS[env_model]["name"]
+        
         if model_key and model_key in cls.AVAILABLE_MODELS:
             return cls.AVAILABLE_MODELS[model_key]["name"]
         
         # Try environment variable
-        env_model = os.getenv("GEMINI_MODEL", cls.DEFAULT_MODEL)
         if env_model in cls.AVAILABLE_MODELS:
             return cls.AVAILABLE_MODELS[env_model]["name"]
         
@@ -78,6 +106,9 @@ class ModelConfig:
     @classmethod
     def get_fallback_models(cls) -> list:
         """Get list of fallback models"""
+        env_model = os.getenv("GEMINI_MODEL", cls.DEFAULT_MODEL)
+        if cls.is_offline(env_model):
+            return [env_model]
         return cls.FALLBACK_MODELS
     
     @classmethod
@@ -85,6 +116,11 @@ class ModelConfig:
         """Check if a model is available"""
         return model_key in cls.AVAILABLE_MODELS
     
+    @classmethod
+    def is_offline(cls, model_key: str) -> bool:
+        """True for models served by the local offline backend"""
+        return cls.AVAILABLE_MODELS.get(model_key, {}).get("backend") == "offline"
+    
     @classmethod
     def get_model_info(cls, model_key: str = None) -> str:
         """Get human-readable model information"""
@@ -94,52 +130,755 @@ class ModelConfig:
 # Global model configuration
 MODEL_CONFIG = ModelConfig()
 
-def get_gemini_model(model_key: str = None):
-    """Get configured Gemini model instance"""
-    import google.generativeai as genai
-    
-    model_name = MODEL_CONFIG.get_model_name(model_key)
-    print(f"🤖 Using AI model: {model_name}")
-    
-    try:
-        model = genai.GenerativeModel(model_name)
-        return model
-    except Exception as e:
-        print(f"❌ Error loading model {model_name}: {e}")
-        # Try fallback models
-        for fallback_model in MODEL_CONFIG.get_fallback_models():
-            if fallback_model != model_name:
+class ModelUnavailableError(Exception):
+    """Raised when every candidate model is overloaded or has an open circuit breaker"""
+    pass
+
+def is_overload_error(error: Exception) -> bool:
+    """True for the 503 / overloaded / unavailable errors Gemini returns under load"""
+    error_msg = str(error).lower()
+    return "overloaded" in error_msg or "unavailable" in error_msg or "503" in error_msg
+
+def is_transient_error(error: Exception) -> bool:
+    """Errors worth retrying on another model: overloads, quota, timeouts and server errors"""
+    error_msg = str(error).lower()
+    return is_overload_error(error) or any(marker in error_msg for marker in (
+        "429", "resource exhausted", "quota", "500", "internal", "timeout", "timed out", "deadline"
+    ))
+
+class CircuitBreaker:
+    """Per-model circuit breaker.
+
+    closed: calls flow. After failure_threshold consecutive failures (errors
+    or calls slower than latency_threshold) it opens and the model is skipped
+    entirely. After open_seconds it goes half-open and lets a single probe
+    through; a good probe closes it, a bad one opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = None, latency_threshold: float = None, open_seconds: float = None):
+        self.failure_threshold = failure_threshold or int(os.getenv("MODEL_BREAKER_FAILURES", "5"))
+        self.latency_threshold = latency_threshold or float(os.getenv("MODEL_BREAKER_LATENCY_SECONDS", "20"))
+        self.open_seconds = open_seconds or float(os.getenv("MODEL_BREAKER_OPEN_SECONDS", "30"))
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        """Whether a call may go to this model now (claims the probe when half-open)"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self, latency: float):
+        if latency > self.latency_threshold:
+            self.record_failure()
+            return
+        with self._lock:
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+            self.state = self.CLOSED
+
+    def release_probe(self):
+        """Give back a claimed probe when the call never reached the model"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        with self._lock:
+            reopens_in = None
+            if self.state == self.OPEN:
+                reopens_in = round(max(0.0, self.open_seconds - (time.monotonic() - self.opened_at)), 1)
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "times_opened": self.times_opened,
+                "half_open_in_seconds": reopens_in
+            }
+
+class ModelHandle:
+    """A cached Gemini model plus the health observed on its calls.
+
+    Every generate_content call first takes its share of the Gemini quota from
+    the shared rate limiter, then waits for a slot in the LLM priority gate, so
+    calls made on behalf of an escalated conversation are admitted ahead of
+    routine ones. Each call's timeout is the remaining request deadline, capped
+    at LLM_CALL_TIMEOUT_SECONDS. Outcomes feed a rolling error rate, the time of the last
+    overload (503) and a latency EWMA, which the pool uses to order fallbacks,
+    and into the model's circuit breaker.
+    """
+
+    ERROR_WINDOW = 20
+    LATENCY_ALPHA = 0.3
+    LATENCY_SAMPLES = 200
+
+    def __init__(self, name: str, gate=None, limiter=None):
+        self.name = name
+        self._gate = gate or llm_gate
+        self._limiter = limiter or rate_limiter
+        self._model = None
+        self.breaker = CircuitBreaker()
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=self.ERROR_WINDOW)
+        self._latencies = deque(maxlen=self.LATENCY_SAMPLES)
+        self.calls = 0
+        self.errors = 0
+        self.last_error = None
+        self.last_overload_at = None
+        self.latency_ewma = None
+
+    @property
+    def model(self):
+        """The underlying genai.GenerativeModel (or offline / replay stand-in), built on first use"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    if ModelConfig.is_offline(self.name):
+                        self._model = OfflineGenerativeModel(self.name)
+                    elif LLM_CASSETTE.replaying:
+                        self._model = LLM_CASSETTE.replay_model(self.name)
+                    else:
+                        import google.generativeai as genai
+                        self._model = genai.GenerativeModel(self.name)
+                        if LLM_CASSETTE.recording:
+                            self._model = LLM_CASSETTE.wrap(self._model, self.name)
+                    print(f"🤖 Loaded AI model: {self.name}")
+        return self._model
+
+    def generate_content(self, *args, **kwargs):
+        tokens = estimate_tokens(args, kwargs)
+        try:
+            self._limiter.acquire(self.name, tokens, timeout=call_timeout(f"{self.name} quota"))
+        except Exception:
+            # Out of quota or out of time is not a model fault, keep it away from the breaker
+            self.breaker.release_probe()
+            raise
+        try:
+            with self._gate.slot(timeout=call_timeout(f"a {self.name} slot")):
+                return self._call_model(tokens, args, kwargs)
+        except (GateTimeoutError, DeadlineExceededError) as e:
+            self._limiter.settle(self.name, tokens, 0)
+            self.breaker.release_probe()
+            if isinstance(e, DeadlineExceededError):
+                raise
+            raise DeadlineExceededError(f"Request deadline exceeded waiting for {self.name}: {e}") from e
+
+    def _with_timeout(self, kwargs: dict) -> dict:
+        """kwargs with the remaining budget as the request timeout"""
+        request_options = dict(kwargs.get("request_options") or {})
+        request_options["timeout"] = min(request_options.get("timeout") or float("inf"), call_timeout(self.name))
+        return dict(kwargs, request_options=request_options)
+
+    def _call_model(self, tokens: int, args, kwargs):
+        """Make the call with the remaining budget as its timeout (caller holds a gate slot)"""
+        kwargs = self._with_timeout(kwargs)
+        started_at = time.monotonic()
+        try:
+            response = self.model.generate_content(*args, **kwargs)
+        except Exception as e:
+            self._limiter.settle(self.name, tokens, 0)
+            self.record_failure(e)
+            raise
+        self.record_success(time.monotonic() - started_at)
+        self._limiter.settle(self.name, tokens, tokens_used(response))
+        return response
+
+    async def generate_content_async(self, *args, **kwargs):
+        """generate_content on the event loop: quota, gate slot and model call are all awaited"""
+        tokens = estimate_tokens(args, kwargs)
+        try:
+            await self._limiter.acquire_async(self.name, tokens, timeout=call_timeout(f"{self.name} quota"))
+        except (Exception, asyncio.CancelledError):
+            self.breaker.release_probe()
+            raise
+        try:
+            async with self._gate.slot_async(timeout=call_timeout(f"a {self.name} slot")):
+                return await self._call_model_async(tokens, args, kwargs)
+        except (GateTimeoutError, DeadlineExceededError) as e:
+            await self._limiter.settle_async(self.name, tokens, 0)
+            self.breaker.release_probe()
+            if isinstance(e, DeadlineExceededError):
+                raise
+            raise DeadlineExceededError(f"Request deadline exceeded waiting for {self.name}: {e}") from e
+        except asyncio.CancelledError:
+            # e.g. the losing side of a hedge; says nothing about the model's health
+            self.breaker.release_probe()
+            raise
+
+    async def _call_model_async(self, tokens: int, args, kwargs):
+        kwargs = self._with_timeout(kwargs)
+        started_at = time.monotonic()
+        try:
+            response = await self.model.generate_content_async(*args, **kwargs)
+        except Exception as e:
+            await self._limiter.settle_async(self.name, tokens, 0)
+            self.record_failure(e)
+            raise
+        self.record_success(time.monotonic() - started_at)
+        await self._limiter.settle_async(self.name, tokens, tokens_used(response))
+        return response
+
+    def record_success(self, latency: float):
+        with self._lock:
+            self.calls += 1
+            self._outcomes.append(True)
+            self._latencies.append(latency)
+            if self.latency_ewma is None:
+                self.latency_ewma = latency
+            else:
+                self.latency_ewma = self.LATENCY_ALPHA * latency + (1 - self.LATENCY_ALPHA) * self.latency_ewma
+        self.breaker.record_success(latency)
+
+    def record_failure(self, error: Exception):
+        with self._lock:
+            self.calls += 1
+            self.errors += 1
+            self._outcomes.append(False)
+            self.last_error = str(error)[:200]
+            if is_overload_error(error):
+                self.last_overload_at = time.time()
+        self.breaker.record_failure()
+
+    @property
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self._outcomes:
+                return 0.0
+            return self._outcomes.count(False) / len(self._outcomes)
+
+    def latency_samples(self) -> list:
+        with self._lock:
+            return list(self._latencies)
+
+    def recently_overloaded(self, cooldown: float) -> bool:
+        return self.last_overload_at is not None and time.time() - self.last_overload_at < cooldown
+
+    def __getattr__(self, name):
+        # Anything other than generate_content goes straight to the model
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    def stats(self) -> dict:
+        with self._lock:
+            outcomes = list(self._outcomes)
+            return {
+                "model": self.name,
+                "loaded": self._model is not None,
+                "calls": self.calls,
+                "errors": self.errors,
+                "recent_error_rate": round(outcomes.count(False) / len(outcomes), 3) if outcomes else 0.0,
+                "last_error": self.last_error,
+                "last_overload_at": datetime.fromtimestamp(self.last_overload_at).isoformat() if self.last_overload_at else None,
+                "latency_ewma_ms": round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+                "breaker": self.breaker.stats(),
+                "offline_backend": self._model.stats() if isinstance(self._model, OfflineGenerativeModel) else None
+            }
+
+class RequestHedger:
+    """Hedged generate_content calls for latency-critical prompts.
+
+    The primary model is called in a hedge thread. If it has not answered by
+    its own latency percentile (LLM_HEDGE_PERCENTILE, default p95, never less
+    than LLM_HEDGE_MIN_DELAY_MS), the same prompt goes to the next available
+    model and whichever answers first wins. The loser is cancelled if it has
+    not started; a call already in flight cannot be interrupted, so it
+    finishes in the background and its answer is discarded. On the async path
+    both calls are tasks, so the loser is cancelled even mid-flight.
+    """
+
+    MIN_SAMPLES = 5
+
+    def __init__(self, pct: float = None, min_delay: float = None, default_delay: float = None,
+                 max_workers: int = None):
+        self.percentile = pct or float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+        self.min_delay = min_delay if min_delay is not None else float(os.getenv("LLM_HEDGE_MIN_DELAY_MS", "1000")) / 1000
+        self.default_delay = default_delay or float(os.getenv("LLM_HEDGE_DEFAULT_DELAY_MS", "4000")) / 1000
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or int(os.getenv("LLM_HEDGE_WORKERS", "16")), thread_name_prefix="llm-hedge"
+        )
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def delay_for(self, handle: ModelHandle) -> float:
+        """How long to wait on the primary before hedging"""
+        samples = handle.latency_samples()
+        if len(samples) < self.MIN_SAMPLES:
+            return self.default_delay
+        return max(self.min_delay, percentile(samples, self.percentile))
+
+    def _submit(self, handle: ModelHandle, args, kwargs):
+        # Each call gets its own copy of the context so the conversation's priority comes along
+        return self._executor.submit(contextvars.copy_context().run, handle.generate_content, *args, **kwargs)
+
+    def call(self, primary: ModelHandle, next_available, args, kwargs):
+        """Call primary, hedging to next_available() if it is slower than its deadline"""
+        with self._lock:
+            self.calls += 1
+        primary_future = self._submit(primary, args, kwargs)
+        done, _ = wait([primary_future], timeout=self.delay_for(primary))
+        if done:
+            return primary_future.result()
+
+        secondary = next_available()
+        if secondary is None:
+            return primary_future.result()
+        with self._lock:
+            self.hedged += 1
+        print(f"⏱️ {primary.name} is slow, hedging with {secondary.name}")
+        pending = {primary_future: primary, self._submit(secondary, args, kwargs): secondary}
+
+        first_error = None
+        while pending:
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in done:
+                handle = pending.pop(future)
                 try:
-                    print(f"🔄 Trying fallback model: {fallback_model}")
-                    model = genai.GenerativeModel(fallback_model)
-                    print(f"✅ Successfully loaded fallback model: {fallback_model}")
-                    return model
-                except Exception as fallback_error:
-                    print(f"❌ Fallback model {fallback_model} also failed: {fallback_error}")
+                    result = future.result()
+                except Exception as e:
+                    first_error = first_error or e
                     continue
-        
-        # If all models fail, raise the original error
-        raise e
+                for loser in pending:
+                    loser.cancel()
+                if handle is secondary:
+                    with self._lock:
+                        self.hedge_wins += 1
+                return result
+        raise first_error
+
+    async def call_async(self, primary: ModelHandle, next_available, args, kwargs):
+        """call() for coroutines"""
+        with self._lock:
+            self.calls += 1
+        primary_task = asyncio.ensure_future(primary.generate_content_async(*args, **kwargs))
+        done, _ = await asyncio.wait([primary_task], timeout=self.delay_for(primary))
+        if done:
+            return primary_task.result()
+
+        secondary = next_available()
+        if secondary is None:
+            return await primary_task
+        with self._lock:
+            self.hedged += 1
+        print(f"⏱️ {primary.name} is slow, hedging with {secondary.name}")
+        pending = {primary_task: primary, asyncio.ensure_future(secondary.generate_content_async(*args, **kwargs)): secondary}
+
+        first_error = None
+        try:
+            while pending:
+                done, _ = await asyncio.wait(list(pending), return_when=FIRST_COMPLETED)
+                for task in done:
+                    handle = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        first_error = first_error or e
+                        continue
+                    if handle is secondary:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return result
+            raise first_error
+        finally:
+            for loser in pending:
+                loser.cancel()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "hedged": self.hedged,
+                "hedge_rate": round(self.hedged / self.calls, 3) if self.calls else 0.0,
+                "hedge_wins": self.hedge_wins,
+                "hedge_win_rate": round(self.hedge_wins / self.hedged, 3) if self.hedged else 0.0,
+                "deadline_percentile": self.percentile,
+                "min_delay_ms": round(self.min_delay * 1000, 1),
+                "default_delay_ms": round(self.default_delay * 1000, 1)
+            }
+
+class SingleFlight:
+    """Coalesces identical in-flight calls so concurrent callers share one result.
+
+    The first caller for a key (the leader) makes the call; callers arriving
+    while it is in flight wait and receive the same response or exception.
+    A caller with a higher priority than the leader does not join, so an
+    emergency never waits behind a routine call queued in the LLM gate.
+    Async callers share calls among themselves through do_async().
+    """
+
+    def __init__(self):
+        self._calls = {}  # key -> [done event, result, error, leader priority level]
+        self._async_calls = {}  # key -> [future, leader priority level]
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn, level: int):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and level >= call[3]:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = [threading.Event(), None, None, level]
+                if key not in self._calls:
+                    self._calls[key] = call
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            call[0].wait()
+            if call[2] is not None:
+                raise call[2]
+            return call[1]
 
-def get_model_with_retry(model_key: str = None, max_retries: int = 3):
-    """Get model with retry logic for overloaded models"""
-    import time
-    import google.generativeai as genai
-    
-    for attempt in range(max_retries):
         try:
-            model = get_gemini_model(model_key)
-            return model
+            call[1] = fn()
+            return call[1]
         except Exception as e:
-            error_msg = str(e).lower()
-            if "overloaded" in error_msg or "unavailable" in error_msg or "503" in error_msg:
-                print(f"⚠️ Model overloaded (attempt {attempt + 1}/{max_retries}), trying fallback...")
-                if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)  # Exponential backoff
-                    continue
+            call[2] = e
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call[0].set()
+
+    async def do_async(self, key: str, coro_fn, level: int):
+        with self._lock:
+            call = self._async_calls.get(key)
+            if call is not None and level >= call[1]:
+                self.coalesced += 1
+                leader = False
             else:
-                # Non-overload error, don't retry
-                raise e
+                future = asyncio.get_running_loop().create_future()
+                # Nobody may be waiting on a failed call; don't let asyncio warn about it
+                future.add_done_callback(lambda f: f.exception())
+                call = [future, level]
+                if key not in self._async_calls:
+                    self._async_calls[key] = call
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            return await asyncio.shield(call[0])
+
+        try:
+            result = await coro_fn()
+            call[0].set_result(result)
+            return result
+        except Exception as e:
+            call[0].set_exception(e)
+            raise
+        except asyncio.CancelledError:
+            call[0].set_exception(ModelUnavailableError("The shared Gemini call was cancelled"))
+            raise
+        finally:
+            with self._lock:
+                if self._async_calls.get(key) is call:
+                    del self._async_calls[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = len(self._calls) + len(self._async_calls)
+        total = self.leaders + self.coalesced
+        return {
+            "in_flight": in_flight,
+            "calls_made": self.leaders,
+            "calls_coalesced": self.coalesced,
+            "coalesced_rate": round(self.coalesced / total, 3) if total else 0.0
+        }
+
+class ModelPool:
+    """Process-wide pool of model handles keyed by model name.
+
+    Handles are built once and reused, and the fallback order from
+    ModelConfig.FALLBACK_MODELS is re-ranked by the health each handle has
+    observed: models with an open breaker go last, then recently overloaded
+    ones, then by recent error rate and latency, with the configured order
+    breaking ties.
+
+    Gemini's async client is bound to the event loop it is first used on, so
+    native async calls are only made on the loop passed to
+    enable_native_async() (the API server's loop). Async callers on any other
+    loop run the sync path in a worker thread.
+    """
+
+    def __init__(self, config: ModelConfig = None, overload_cooldown: float = None, max_error_rate: float = 0.5,
+                 limiter=None):
+        self.config = config or MODEL_CONFIG
+        self.overload_cooldown = overload_cooldown or float(os.getenv("MODEL_OVERLOAD_COOLDOWN_SECONDS", "60"))
+        self.max_error_rate = max_error_rate
+        self.hedger = RequestHedger()
+        self.cache = LLM_CACHE
+        self.single_flight = SingleFlight()
+        self.limiter = limiter or rate_limiter
+        self.async_loop = None
+        self._handles = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_name: str) -> ModelHandle:
+        """The shared handle for a model name"""
+        with self._lock:
+            handle = self._handles.get(model_name)
+            if handle is None:
+                handle = ModelHandle(model_name, limiter=self.limiter)
+                self._handles[model_name] = handle
+            return handle
+
+    def is_healthy(self, handle: ModelHandle) -> bool:
+        return (
+            handle.breaker.state == CircuitBreaker.CLOSED
+            and not handle.recently_overloaded(self.overload_cooldown)
+            and handle.error_rate < self.max_error_rate
+        )
+
+    def _health_key(self, handle: ModelHandle, preference: int):
+        return (
+            handle.breaker.state == CircuitBreaker.OPEN,
+            handle.recently_overloaded(self.overload_cooldown),
+            round(handle.error_rate, 1),
+            handle.latency_ewma or 0.0,
+            preference
+        )
+
+    def ranked(self, model_key: str = None) -> list:
+        """Handles to try in order: the configured model while healthy, then fallbacks by health"""
+        preferred = self.config.get_model_name(model_key)
+        names = [preferred] + [name for name in self.config.get_fallback_models() if name != preferred]
+        handles = [self.get(name) for name in names]
+        if self.is_healthy(handles[0]):
+            first, rest = handles[:1], handles[1:]
+        else:
+            first, rest = [], handles
+        ranked_rest = [
+            handle for _, handle in sorted(
+                ((self._health_key(handle, index), handle) for index, handle in enumerate(rest)),
+                key=lambda item: item[0]
+            )
+        ]
+        return first + ranked_rest
+
+    def select(self, model_key: str = None) -> ModelHandle:
+        """The healthiest handle for this model key"""
+        return self.ranked(model_key)[0]
+
+    def enable_native_async(self, loop=None):
+        """Make native async Gemini calls on this event loop (default: the running one)"""
+        self.async_loop = loop or asyncio.get_running_loop()
+        print("⚡ Native async Gemini calls enabled on the API event loop")
+
+    def native_async(self) -> bool:
+        try:
+            return self.async_loop is not None and asyncio.get_running_loop() is self.async_loop
+        except RuntimeError:
+            return False
+
+    def router(self, model_key: str = None, hedge: bool = False) -> "ModelRouter":
+        """A model-like object that routes each call to the healthiest available model"""
+        return ModelRouter(self, model_key, hedge=hedge)
+
+    def stats(self) -> dict:
+        with self._lock:
+            handles = list(self._handles.values())
+        return {
+            "overload_cooldown_seconds": self.overload_cooldown,
+            "models": {handle.name: dict(handle.stats(), healthy=self.is_healthy(handle)) for handle in handles},
+            "hedging": self.hedger.stats(),
+            "single_flight": self.single_flight.stats(),
+            "cassette": LLM_CASSETTE.stats(),
+            "rate_limit": self.limiter.stats(),
+            "native_async": self.async_loop is not None
+        }
+
+class ModelRouter:
+    """Routes each generate_content call across the pool.
+
+    Models whose breaker is open are skipped entirely. A transient failure
+    (overload, quota, timeout) moves on to the next model in health order.
+    Any other error is raised as before, so tools keep their own fallbacks.
+    With hedge=True each call is hedged through the pool's RequestHedger.
+
+    Prompts that are pure functions of a small key can pass cache_family and
+    cache_key to be answered from the pool's LLM cache. Identical prompt and
+    config pairs already in flight share a single Gemini call.
+
+    generate_content_async() offers the same behaviour to coroutines.
+    """
+
+    def __init__(self, pool: ModelPool, model_key: str = None, hedge: bool = False):
+        self.pool = pool
+        self.model_key = model_key
+        self.hedge = hedge
+
+    @property
+    def model_name(self) -> str:
+        return self.pool.select(self.model_key).name
+
+    def generate_content(self, *args, cache_family: str = None, cache_key=None, **kwargs):
+        if cache_family is None:
+            return self._coalesced(*args, **kwargs)
+        cached = self.pool.cache.get(cache_family, cache_key)
+        if cached is not None:
+            return CachedResponse(cached)
+        response = self._coalesced(*args, **kwargs)
+        self._remember(cache_family, cache_key, response)
+        return response
+
+    async def generate_content_async(self, *args, cache_family: str = None, cache_key=None, **kwargs):
+        if not self.pool.native_async():
+            return await asyncio.to_thread(
+                self.generate_content, *args, cache_family=cache_family, cache_key=cache_key, **kwargs
+            )
+        if cache_family is None:
+            return await self._coalesced_async(*args, **kwargs)
+        cached = self.pool.cache.get(cache_family, cache_key)
+        if cached is not None:
+            return CachedResponse(cached)
+        response = await self._coalesced_async(*args, **kwargs)
+        self._remember(cache_family, cache_key, response)
+        return response
+
+    def _remember(self, cache_family: str, cache_key, response):
+        try:
+            text = response.text
+        except Exception:
+            # Blocked or empty responses have no text and are not worth caching
+            text = None
+        if text:
+            self.pool.cache.set(cache_family, cache_key, text)
+
+    def _flight_key(self, args, kwargs) -> str:
+        fingerprint = repr((self.model_key, args, sorted(kwargs.items())))
+        return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()
+
+    def _coalesced(self, *args, **kwargs):
+        """Share one in-flight call between concurrent identical prompts"""
+        key = self._flight_key(args, kwargs)
+        return self.pool.single_flight.do(key, lambda: self._generate(*args, **kwargs), current_priority_level())
+
+    async def _coalesced_async(self, *args, **kwargs):
+        key = self._flight_key(args, kwargs)
+        return await self.pool.single_flight.do_async(
+            key, lambda: self._generate_async(*args, **kwargs), current_priority_level()
+        )
+
+    def _candidates(self):
+        """next_available(): the next handle in health order whose breaker lets a call through"""
+        candidates = iter(self.pool.ranked(self.model_key))
+
+        def next_available():
+            for handle in candidates:
+                if handle.breaker.allow_request():
+                    return handle
+            return None
+        return next_available
+
+    def _check_reroute(self, handle: ModelHandle, error: Exception):
+        """Raise unless the error is worth retrying on the next model"""
+        if isinstance(error, DeadlineExceededError) or not is_transient_error(error):
+            raise error
+        if deadline_expired():
+            raise DeadlineExceededError(f"Request deadline exceeded after {handle.name} failed: {error}") from error
+        print(f"⚠️ {handle.name} failed ({str(error)[:80]}), routing to the next model")
+
+    def _generate(self, *args, **kwargs):
+        next_available = self._candidates()
+        last_error = None
+        while True:
+            handle = next_available()
+            if handle is None:
+                break
+            try:
+                if self.hedge:
+                    return self.pool.hedger.call(handle, next_available, args, kwargs)
+                return handle.generate_content(*args, **kwargs)
+            except Exception as e:
+                self._check_reroute(handle, e)
+                last_error = e
+        raise ModelUnavailableError(f"No Gemini model is currently available (last error: {last_error})") from last_error
+
+    async def _generate_async(self, *args, **kwargs):
+        next_available = self._candidates()
+        last_error = None
+        while True:
+            handle = next_available()
+            if handle is None:
+                break
+            try:
+                if self.hedge:
+                    return await self.pool.hedger.call_async(handle, next_available, args, kwargs)
+                return await handle.generate_content_async(*args, **kwargs)
+            except Exception as e:
+                self._check_reroute(handle, e)
+                last_error = e
+        raise ModelUnavailableError(f"No Gemini model is currently available (last error: {last_error})") from last_error
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.pool.select(self.model_key), name)
+
+# Global model pool
+MODEL_POOL = ModelPool()
+
+def run_coroutine(coro):
+    """Run a tool coroutine to completion from synchronous code.
+
+    Crew tools run in worker threads; when the API has enabled native async
+    calls their coroutines are handed to its event loop, so every tool's
+    Gemini calls share one loop instead of each thread running its own.
+    """
+    loop = MODEL_POOL.async_loop
+    if loop is not None and loop.is_running() and not MODEL_POOL.native_async():
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+    return asyncio.run(coro)
+
+def get_gemini_model(model_key: str = None):
+    """Get the shared, health-tracked handle for the configured Gemini model"""
+    return MODEL_POOL.select(model_key)
+
+def get_model_with_retry(model_key: str = None, max_retries: int = 3, hedge: bool = False):
+    """Get a router that sends each call to the healthiest model, skipping open breakers.
+
+    hedge=True opts latency-critical callers into hedged requests.
+    """
+    last_error = None
+    for handle in MODEL_POOL.ranked(model_key)[:max_retries]:
+        try:
+            handle.model  # Build it now so a bad model name falls through to the next one
+            return MODEL_POOL.router(model_key, hedge=hedge)
+        except Exception as e:
+            print(f"❌ Error loading model {handle.name}: {e}")
+            handle.record_failure(e)
+            last_error = e
     
-    # If we get here, all retries failed
-    raise Exception("All models are currently overloaded. Please try again later.") 
\ No newline at end of file
+    # If we get here, all candidates failed
+    raise Exception(f"All models are currently unavailable. Please try again later. ({last_error})")
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Deterministic offline stand-in for the Gemini models
+
+Selected with GEMINI_MODEL=offline. Every model handle then talks to an
+OfflineGenerativeModel instead of genai.GenerativeModel, so the whole call
+path (rate limiter, priority gate, breakers, hedging, cache) can be load
+tested on a machine with no network and no API key. Each prompt family the
+tools send gets a schema-valid canned or templated answer, and latency and
+errors are injected from a seeded generator so benchmark runs repeat.
+
+Set GEMINI_RPM_LIMIT / GEMINI_TPM_LIMIT high when the client-side quota
+should not be what a benchmark measures.
+"""
+
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+import time
+
+from rate_limiter import CHARS_PER_TOKEN
+
+OFFLINE_MODEL = "offline"
+
+# (symptom keywords, emergency type or None, specialty, severity, urgency); first match wins
+SYMPTOM_PROFILES = [
+    (("chest pain", "heart attack", "cardiac", "palpitation"), "Cardiac Emergency", "Cardiologist", "High", "Urgent"),
+    (("stroke", "seizure", "unconscious", "slurred", "numbness"), "Neurological Emergency", "Neurologist", "High", "Urgent"),
+    (("difficulty breathing", "shortness of breath", "can't breathe", "cannot breathe", "choking", "asthma attack"),
+     "Respiratory Emergency", "General Physician", "High", "Urgent"),
+    (("severe bleeding", "bleeding heavily", "fracture", "burn", "accident"), "Trauma Emergency", "Orthopedist", "High", "Urgent"),
+    (("anaphyla", "throat swelling", "severe allergic"), "Allergic Reaction Emergency", "General Physician", "High", "Urgent"),
+    (("overdose", "poison"), "Toxicology Emergency", "General Physician", "High", "Urgent"),
+    (("suicid", "self harm", "self-harm"), "Psychiatric Emergency", "Psychiatrist", "High", "Urgent"),
+    (("stomach", "abdominal", "vomit", "diarrh", "nausea"), None, "Gastroenterologist", "Medium", "Soon"),
+    (("migraine", "severe headache", "dizz"), None, "Neurologist", "Medium", "Soon"),
+    (("anxiety", "depress", "panic", "insomnia"), None, "Psychiatrist", "Medium", "Soon"),
+    (("pregnan",), None, "Gynecologist", "Medium", "Soon"),
+    (("diabet", "thyroid", "hormone"), None, "Endocrinologist", "Medium", "Routine"),
+    (("rash", "itch", "acne", "skin"), None, "Dermatologist", "Low", "Routine"),
+    (("joint", "knee", "back pain", "sprain"), None, "Orthopedist", "Low", "Routine"),
+]
+DEFAULT_PROFILE = ((), None, "General Physician", "Low", "Routine")
+
+# Only the patient's own data is classified, never the instructions around it
+_PATIENT_FIELDS = re.compile(r'(?:symptoms?|emergency type)\s*"?\s*:\s*"?([^"\n]*)', re.IGNORECASE)
+_PATIENT_NAME = re.compile(r'"name"\s*:\s*"([^"]*)"')
+_LOCATION = re.compile(r'(?:PATIENT LOCATION:|"location"\s*:)\s*"?([^"\n]*)', re.IGNORECASE)
+
+EMERGENCY_NUMBERS = [
+    (("india", "pune", "mumbai", "delhi", "nashik", "nagpur", "bangalore"),
+     {"ambulance": "108", "police": "100", "fire": "101", "poison_control": "1066", "local_emergency": "112", "country": "India"}),
+    (("usa", "united states", "new york", "los angeles", "chicago"),
+     {"ambulance": "911", "police": "911", "fire": "911", "poison_control": "1-800-222-1222", "local_emergency": "911", "country": "United States"}),
+    (("uk", "united kingdom", "london", "manchester"),
+     {"ambulance": "999", "police": "999", "fire": "999", "poison_control": "111", "local_emergency": "112", "country": "United Kingdom"}),
+]
+DEFAULT_NUMBERS = {"ambulance": "112", "police": "112", "fire": "112", "poison_control": "not available",
+                   "local_emergency": "112", "country": "Unknown"}
+
+
+def patient_profile(prompt: str) -> tuple:
+    """The symptom profile matching the patient data quoted in a prompt"""
+    data = " ".join(_PATIENT_FIELDS.findall(prompt)).lower()
+    for profile in SYMPTOM_PROFILES:
+        if any(keyword in data for keyword in profile[0]):
+            return profile
+    return DEFAULT_PROFILE
+
+
+def _patient_name(prompt: str) -> str:
+    match = _PATIENT_NAME.search(prompt)
+    return match.group(1) if match and match.group(1) else "there"
+
+
+def _severity(prompt: str) -> dict:
+    _, emergency_type, specialty, severity, urgency = patient_profile(prompt)
+    return {
+        "severity": severity,
+        "urgency": urgency,
+        "reasoning": f"Offline assessment: symptoms match the {specialty} profile"
+    }
+
+
+def _specialty(prompt: str) -> str:
+    return patient_profile(prompt)[2]
+
+
+def _emergency_check(prompt: str) -> dict:
+    emergency_type = patient_profile(prompt)[1]
+    is_emergency = emergency_type is not None
+    return {
+        "is_emergency": is_emergency,
+        "emergency_type": emergency_type or "none",
+        "confidence": "high",
+        "reasoning": "Offline check: " + ("life-threatening symptom profile" if is_emergency else "no critical symptoms"),
+        "ai_virtual_doctor_needed": is_emergency,
+        "ai_virtual_doctor_justified": is_emergency,
+        "recommended_action": "Activate emergency response" if is_emergency else "Continue with normal consultation workflow"
+    }
+
+
+def _emergency_type(prompt: str) -> str:
+    return patient_profile(prompt)[1] or "General Medical Emergency"
+
+
+def _emergency_contacts(prompt: str) -> dict:
+    match = _LOCATION.search(prompt)
+    location = match.group(1).lower() if match else ""
+    for keywords, numbers in EMERGENCY_NUMBERS:
+        if any(keyword in location for keyword in keywords):
+            return dict(numbers, note="Offline emergency numbers")
+    return dict(DEFAULT_NUMBERS, note="Offline emergency numbers")
+
+
+def _immediate_actions(prompt: str) -> list:
+    return [
+        "Call emergency services immediately",
+        "Keep the patient calm, seated or lying down",
+        "Loosen tight clothing and keep the airway clear",
+        "Monitor breathing and pulse every few minutes",
+        "Do not give food or drink",
+        "Stay with the patient until help arrives"
+    ]
+
+
+def _conversation_script(prompt: str) -> dict:
+    name = _patient_name(prompt)
+    return {
+        "opening_greeting": f"Hello {name}, I am here with you and help is on the way.",
+        "immediate_support": "Sit down, breathe slowly and stay still while we keep an eye on your symptoms.",
+        "symptom_specific_advice": "Take only the medicines you have been prescribed and avoid any exertion.",
+        "personalized_tips": "Keep your phone close and let someone near you know how you feel.",
+        "comforting_statements": ["You are doing the right thing.", "Help is on the way.", "I will stay with you."],
+        "stress_relief": "Breathe in for four counts, hold for four and breathe out for six.",
+        "next_steps": "If the symptoms get worse, call emergency services right away.",
+        "ongoing_support": "I will keep monitoring you until a doctor takes over.",
+        "closing_reassurance": "You are not alone, we are taking care of you."
+    }
+
+
+def _doctor_profile(prompt: str) -> dict:
+    return {
+        "doctor_name": "Dr. Offline Assistant",
+        "credentials": "MD, Emergency Medicine",
+        "specialization": "Emergency Medicine",
+        "experience_years": "15+ years",
+        "appearance": {
+            "age": "45",
+            "gender": "Female",
+            "professional_look": "calm and attentive",
+            "avatar_style": "professional medical attire"
+        },
+        "speaking_style": "calm, professional, reassuring",
+        "background": "Emergency physician (offline stand-in)",
+        "avatar_description": "Doctor in a white coat in a bright consultation room"
+    }
+
+
+def _real_time_responses(prompt: str) -> dict:
+    return {
+        "worsening_symptoms": "Tell me exactly what changed; if it is getting worse, call emergency services now.",
+        "medication_questions": "Only take medicines you have been prescribed until a doctor sees you.",
+        "fear_anxiety": "It is normal to feel scared. Breathe slowly with me, help is coming.",
+        "ambulance_questions": "The ambulance has been informed and is on its way.",
+        "new_symptoms": "Thank you for telling me. Please describe the new symptom in detail.",
+        "treatment_options": "The doctors will decide on treatment once they have examined you.",
+        "general_reassurance": "You are doing well. Stay with me."
+    }
+
+
+def _ambulance_decision(prompt: str) -> dict:
+    needed = patient_profile(prompt)[1] is not None or bool(re.search(r"SEVERITY LEVEL:\s*(critical|high)", prompt, re.IGNORECASE))
+    return {
+        "ambulance_needed": needed,
+        "urgency_level": "Immediate" if needed else "Low",
+        "reasoning": "Offline decision based on the severity level and emergency type",
+        "alternative_action": "Book a consultation with a doctor",
+        "estimated_response_time": "10-15 minutes" if needed else "not applicable",
+        "recommendations": ["Keep the patient still", "Monitor breathing and pulse"]
+    }
+
+
+def _video_call_setup(prompt: str) -> dict:
+    return {
+        "pre_call_checklist": ["Charge the phone", "Find a quiet, well lit place"],
+        "technical_requirements": ["Camera and microphone", "Stable internet connection"],
+        "patient_preparation": "Sit comfortably facing the camera and keep your medicines nearby.",
+        "emergency_protocols": ["Call emergency services if the call drops", "Keep the door unlocked for responders"],
+        "backup_methods": ["Phone call", "SMS"]
+    }
+
+
+def _text(prompt: str) -> str:
+    return ("This is a deterministic offline response used for testing and benchmarking. "
+            "Stay calm, follow the guidance of your doctor and call emergency services if symptoms get worse.")
+
+
+# (family, markers that must all appear in the prompt, answer builder); checked in order
+PROMPT_FAMILIES = [
+    ("emergency_check", ('"is_emergency"',), _emergency_check),
+    ("severity", ('"Routine | Soon | Urgent"',), _severity),
+    ("specialty", ("most appropriate medical specialty",), _specialty),
+    ("emergency_type", ("ONLY the emergency type name",), _emergency_type),
+    ("emergency_contacts", ('"ambulance"', '"poison_control"'), _emergency_contacts),
+    ("immediate_actions", ("JSON array of action strings",), _immediate_actions),
+    ("conversation_script", ('"opening_greeting"',), _conversation_script),
+    ("doctor_profile", ('"doctor_name"', '"avatar_description"'), _doctor_profile),
+    ("real_time_responses", ('"worsening_symptoms"',), _real_time_responses),
+    ("ambulance_decision", ('"ambulance_needed"',), _ambulance_decision),
+    ("video_call_setup", ('"pre_call_checklist"',), _video_call_setup),
+]
+
+
+def prompt_text(args, kwargs) -> str:
+    """The prompt of a generate_content call as one string"""
+    prompt = kwargs.get("contents", args[0] if args else "")
+    if isinstance(prompt, (list, tuple)):
+        prompt = "\n".join(str(part) for part in prompt)
+    return str(prompt)
+
+
+def prompt_family(prompt: str):
+    """(family name, answer builder) for a prompt; free text when no family matches"""
+    for family, markers, builder in PROMPT_FAMILIES:
+        if all(marker in prompt for marker in markers):
+            return family, builder
+    return "text", _text
+
+
+class OfflineUsage:
+    def __init__(self, prompt_token_count: int, candidates_token_count: int):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class OfflineResponse:
+    """The parts of a genai response the app reads: text and usage_metadata"""
+
+    def __init__(self, text: str, prompt_tokens: int, family: str):
+        self.text = text
+        self.family = family
+        self.usage_metadata = OfflineUsage(prompt_tokens, len(text) // CHARS_PER_TOKEN + 1)
+
+
+class OfflineGenerativeModel:
+    """Drop-in for genai.GenerativeModel that never leaves the process.
+
+    Each call waits latency_ms plus an exponentially distributed tail with
+    mean tail_ms (so p99 sits well above p50 like a real backend), then fails
+    with an overload error with probability error_rate or answers the prompt.
+    A call whose delay exceeds the request timeout fails with a 504 after the
+    timeout, as the real client does.
+    """
+
+    def __init__(self, model_name: str = OFFLINE_MODEL, latency_ms: float = None, tail_ms: float = None,
+                 error_rate: float = None, seed: int = None):
+        self.model_name = model_name
+        self.latency = (latency_ms if latency_ms is not None else float(os.getenv("OFFLINE_LLM_LATENCY_MS", "0"))) / 1000
+        self.tail = (tail_ms if tail_ms is not None else float(os.getenv("OFFLINE_LLM_LATENCY_TAIL_MS", "0"))) / 1000
+        self.error_rate = error_rate if error_rate is not None else float(os.getenv("OFFLINE_LLM_ERROR_RATE", "0"))
+        self._random = random.Random(seed if seed is not None else int(os.getenv("OFFLINE_LLM_SEED", "0")))
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.families = {}
+
+    def _plan(self, args, kwargs):
+        """Draw this call's delay and outcome, and build its answer"""
+        prompt = prompt_text(args, kwargs)
+        family, builder = prompt_family(prompt)
+        with self._lock:
+            self.calls += 1
+            self.families[family] = self.families.get(family, 0) + 1
+            delay = self.latency + (self._random.expovariate(1 / self.tail) if self.tail > 0 else 0.0)
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+
+        timeout = (kwargs.get("request_options") or {}).get("timeout")
+        if timeout is not None and delay > timeout:
+            return timeout, Exception(f"504 Deadline Exceeded (offline {self.model_name})")
+        if fail:
+            return delay, Exception(f"503 The offline model {self.model_name} is overloaded (injected error)")
+        answer = builder(prompt)
+        text = answer if isinstance(answer, str) else json.dumps(answer)
+        return delay, OfflineResponse(text, len(prompt) // CHARS_PER_TOKEN + 1, family)
+
+    def generate_content(self, *args, **kwargs):
+        delay, outcome = self._plan(args, kwargs)
+        if delay > 0:
+            time.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    async def generate_content_async(self, *args, **kwargs):
+        delay, outcome = self._plan(args, kwargs)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "injected_errors": self.errors,
+                "latency_ms": round(self.latency * 1000, 1),
+                "tail_ms": round(self.tail * 1000, 1),
+                "error_rate": self.error_rate,
+                "calls_by_family": dict(self.families)
+            }
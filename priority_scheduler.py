@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Priority lanes for crew runs and LLM calls so emergencies are served ahead of routine intakes
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+# Lower value = served first
+EMERGENCY = 0
+URGENT = 1
+ROUTINE = 2
+
+PRIORITY_NAMES = {EMERGENCY: "emergency", URGENT: "urgent", ROUTINE: "routine"}
+
+# Symptom assessment values that move a conversation out of the routine lane
+URGENT_SEVERITIES = {"high", "critical", "severe"}
+URGENT_URGENCIES = {"urgent", "emergency", "immediate"}
+
+
+def percentile(samples, pct: float) -> float:
+    """Nearest-rank percentile of a list of samples (0.0 when empty)"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class ConversationPriority:
+    """Mutable priority shared by everything running on behalf of one conversation.
+
+    The same object is reachable from the WebSocket handler and, through the
+    copied context, from the crew thread and its tools, so an escalation made
+    anywhere is seen by every queue the conversation is waiting in.
+    """
+
+    def __init__(self, conversation_id: str = None, level: int = ROUTINE):
+        self.conversation_id = conversation_id
+        self.level = level
+
+    @property
+    def name(self) -> str:
+        return PRIORITY_NAMES.get(self.level, str(self.level))
+
+    def escalate(self, level: int, reason: str = "") -> bool:
+        """Raise the priority; never lowers it. Returns True if it changed."""
+        if level >= self.level:
+            return False
+        self.level = level
+        print(f"🚑 Conversation {self.conversation_id} escalated to {self.name} priority"
+              + (f" ({reason})" if reason else ""))
+        return True
+
+
+_current_priority = contextvars.ContextVar("conversation_priority", default=None)
+
+
+def set_current_priority(priority: ConversationPriority):
+    """Bind a conversation priority to the current context"""
+    return _current_priority.set(priority)
+
+
+def get_current_priority():
+    """The conversation priority bound to the current context, if any"""
+    return _current_priority.get()
+
+
+def current_priority_level() -> int:
+    priority = _current_priority.get()
+    return priority.level if priority is not None else ROUTINE
+
+
+def escalate_current_priority(level: int, reason: str = "") -> bool:
+    """Escalate the conversation running in the current context (no-op outside a conversation)"""
+    priority = _current_priority.get()
+    if priority is None:
+        return False
+    return priority.escalate(level, reason)
+
+
+def level_for_assessment(symptom_assessment: dict) -> int:
+    """Map a symptom assessment to a priority level"""
+    severity = str(symptom_assessment.get("severity", "")).strip().lower()
+    urgency = str(symptom_assessment.get("urgency", "")).strip().lower()
+    if severity in URGENT_SEVERITIES or urgency in URGENT_URGENCIES:
+        return URGENT
+    return ROUTINE
+
+
+class LatencyByPriority:
+    """Rolling latency samples kept separately for each priority level"""
+
+    def __init__(self, sample_size: int = 1000):
+        self.sample_size = sample_size
+        self._samples = {level: deque(maxlen=sample_size) for level in PRIORITY_NAMES}
+        self._lock = threading.Lock()
+
+    def record(self, level: int, seconds: float):
+        with self._lock:
+            self._samples.setdefault(level, deque(maxlen=self.sample_size)).append(seconds)
+
+    def summary(self) -> dict:
+        with self._lock:
+            snapshot = {level: list(samples) for level, samples in self._samples.items()}
+        return {
+            PRIORITY_NAMES.get(level, str(level)): {
+                "count": len(samples),
+                "p50": round(percentile(samples, 50) * 1000, 1),
+                "p99": round(percentile(samples, 99) * 1000, 1),
+                "max": round(max(samples, default=0.0) * 1000, 1)
+            }
+            for level, samples in snapshot.items()
+        }
+
+
+class _LoopEvent:
+    """Wakes a coroutine waiting for a gate slot from whichever thread releases the slot"""
+
+    def __init__(self):
+        self._loop = asyncio.get_running_loop()
+        self.future = self._loop.create_future()
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+    def set(self):
+        self._loop.call_soon_threadsafe(self._resolve)
+
+
+class GateTimeoutError(TimeoutError):
+    """No slot in a PriorityGate was granted within the caller's timeout"""
+    pass
+
+
+class PriorityGate:
+    """Bounded concurrency for blocking calls with priority-ordered admission.
+
+    Worker threads call slot() around the work. When every slot is taken,
+    callers wait and the best (lowest level, then oldest) waiter gets the next
+    free slot. reserved slots are kept back for non-routine work so a burst of
+    routine calls can never occupy the whole gate.
+    """
+
+    def __init__(self, name: str, capacity: int, reserved: int = 0, sample_size: int = 1000):
+        self.name = name
+        self.capacity = max(1, capacity)
+        self.reserved = min(max(0, reserved), self.capacity - 1)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiting = []  # [priority holder, seq, event, level at enqueue]
+        self._seq = 0
+        self.timeouts = 0
+        self.wait_times = LatencyByPriority(sample_size)
+        self.call_times = LatencyByPriority(sample_size)
+
+    def _limit(self, level: int) -> int:
+        return self.capacity if level < ROUTINE else self.capacity - self.reserved
+
+    @staticmethod
+    def _level(entry) -> int:
+        holder = entry[0]
+        return holder.level if holder is not None else entry[3]
+
+    def _grant_next(self):
+        """Hand free slots to the best waiters (caller holds the lock)"""
+        while self._waiting:
+            best = min(self._waiting, key=lambda entry: (self._level(entry), entry[1]))
+            if self._active >= self._limit(self._level(best)):
+                break
+            self._waiting.remove(best)
+            self._active += 1
+            best[2].set()
+
+    def _enqueue(self, priority, make_event):
+        """Take a free slot or join the queue; returns the waiter entry or None if admitted"""
+        level = priority.level if priority is not None else ROUTINE
+        with self._lock:
+            if self._active < self._limit(level) and not any(self._level(w) <= level for w in self._waiting):
+                self._active += 1
+                return None
+            self._seq += 1
+            entry = [priority, self._seq, make_event(), level]
+            self._waiting.append(entry)
+            return entry
+
+    def _leave_queue(self, entry, timed_out: bool = False) -> bool:
+        """Drop a waiter; False if it was granted a slot in the meantime"""
+        with self._lock:
+            if entry not in self._waiting:
+                return False
+            self._waiting.remove(entry)
+            if timed_out:
+                self.timeouts += 1
+            return True
+
+    def acquire(self, priority: ConversationPriority = None, timeout: float = None) -> int:
+        """Block until a slot is free for this priority; returns the level it was admitted at.
+
+        Raises GateTimeoutError if no slot was granted within timeout seconds.
+        """
+        priority = priority if priority is not None else _current_priority.get()
+        enqueued_at = time.monotonic()
+        entry = self._enqueue(priority, threading.Event)
+        if entry is not None and not entry[2].wait(timeout) and self._leave_queue(entry, timed_out=True):
+            raise GateTimeoutError(f"No {self.name} slot within {timeout:.1f}s")
+        level = self._level(entry) if entry is not None else (priority.level if priority is not None else ROUTINE)
+        self.wait_times.record(level, time.monotonic() - enqueued_at)
+        return level
+
+    async def acquire_async(self, priority: ConversationPriority = None, timeout: float = None) -> int:
+        """acquire() for coroutines: waits on the event loop instead of blocking a thread"""
+        priority = priority if priority is not None else _current_priority.get()
+        enqueued_at = time.monotonic()
+        entry = self._enqueue(priority, _LoopEvent)
+        if entry is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(entry[2].future), timeout)
+            except asyncio.TimeoutError:
+                if self._leave_queue(entry, timed_out=True):
+                    raise GateTimeoutError(f"No {self.name} slot within {timeout:.1f}s")
+            except asyncio.CancelledError:
+                if not self._leave_queue(entry):
+                    # Granted while being cancelled; hand the slot straight back
+                    self.release()
+                raise
+        level = self._level(entry) if entry is not None else (priority.level if priority is not None else ROUTINE)
+        self.wait_times.record(level, time.monotonic() - enqueued_at)
+        return level
+
+    def release(self):
+        with self._lock:
+            self._active -= 1
+            self._grant_next()
+
+    @contextmanager
+    def slot(self, priority: ConversationPriority = None, timeout: float = None):
+        """Hold a slot for the duration of the with-block"""
+        level = self.acquire(priority, timeout)
+        started_at = time.monotonic()
+        try:
+            yield level
+        finally:
+            self.call_times.record(level, time.monotonic() - started_at)
+            self.release()
+
+    @asynccontextmanager
+    async def slot_async(self, priority: ConversationPriority = None, timeout: float = None):
+        """Async with-block version of slot()"""
+        level = await self.acquire_async(priority, timeout)
+        started_at = time.monotonic()
+        try:
+            yield level
+        finally:
+            self.call_times.record(level, time.monotonic() - started_at)
+            self.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            active = self._active
+            waiting = {}
+            for entry in self._waiting:
+                name = PRIORITY_NAMES.get(self._level(entry), "routine")
+                waiting[name] = waiting.get(name, 0) + 1
+        return {
+            "name": self.name,
+            "capacity": self.capacity,
+            "reserved_for_priority": self.reserved,
+            "active": active,
+            "waiting": waiting,
+            "timeouts": self.timeouts,
+            "wait_ms": self.wait_times.summary(),
+            "call_ms": self.call_times.summary()
+        }
+
+
+# Global gate in front of Gemini calls made by the tools
+llm_gate = PriorityGate(
+    "gemini",
+    capacity=int(os.getenv("LLM_MAX_CONCURRENCY", "4")),
+    reserved=int(os.getenv("LLM_RESERVED_SLOTS", "1"))
+)
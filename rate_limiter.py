@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Client-side token-bucket rate limiter for the Gemini quota
+
+Every model call takes one request and its estimated tokens from a per-model
+pair of buckets (requests/min and tokens/min) before it is sent, so the app
+slows down just under the quota instead of running into 429s. The buckets live
+in a SQLite file so all threads and all API workers on a host draw from the
+same budget.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from priority_scheduler import ROUTINE, PRIORITY_NAMES, current_priority_level
+
+# Rough prompt size in tokens when the API has not told us the real count
+CHARS_PER_TOKEN = 4
+
+
+class RateLimitExceededError(Exception):
+    """Raised when a call could not get quota within the limiter's max wait"""
+    pass
+
+
+def estimate_tokens(args, kwargs, expected_output: int = None) -> int:
+    """Estimate the tokens a generate_content call will consume (prompt plus output)"""
+    contents = kwargs.get("contents", args[0] if args else "")
+    if isinstance(contents, (list, tuple)):
+        prompt_chars = sum(len(str(part)) for part in contents)
+    else:
+        prompt_chars = len(str(contents))
+
+    output_tokens = None
+    generation_config = kwargs.get("generation_config")
+    if isinstance(generation_config, dict):
+        output_tokens = generation_config.get("max_output_tokens")
+    elif generation_config is not None:
+        output_tokens = getattr(generation_config, "max_output_tokens", None)
+    if not output_tokens:
+        output_tokens = expected_output or int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "512"))
+    return prompt_chars // CHARS_PER_TOKEN + 1 + output_tokens
+
+
+def tokens_used(response):
+    """Total tokens the API reports for a response, or None when it does not say"""
+    usage = getattr(response, "usage_metadata", None)
+    total = getattr(usage, "total_token_count", None)
+    return total if isinstance(total, int) and total > 0 else None
+
+
+class RateLimiter:
+    """Requests/min and tokens/min buckets per model, shared through SQLite.
+
+    Buckets refill continuously at headroom x the configured per-minute limit
+    and hold only burst seconds' worth of it, so any minute sees at most
+    (60 + burst) seconds of refill: 97.5% of the quota at the defaults. Routine
+    calls may not take the last reserve fraction of a bucket, which is kept for urgent and emergency calls from any worker, and
+    within a process a waiting caller never takes quota while a
+    higher-priority caller is still waiting for it. A caller that cannot get
+    quota within max_wait seconds gets a RateLimitExceededError, which the
+    model router treats like a 429 and routes to the next model.
+    """
+
+    def __init__(self, rpm: float = None, tpm: float = None, path: str = None, headroom: float = None,
+                 reserve: float = None, max_wait: float = None, burst: float = None, poll_interval: float = 0.25):
+        self.rpm = rpm or float(os.getenv("GEMINI_RPM_LIMIT", "60"))
+        self.tpm = tpm or float(os.getenv("GEMINI_TPM_LIMIT", "1000000"))
+        self.path = path or os.getenv("LLM_RATE_LIMIT_PATH", "gemini_rate_limit.db")
+        self.headroom = headroom or float(os.getenv("LLM_RATE_HEADROOM", "0.9"))
+        self.reserve = reserve if reserve is not None else float(os.getenv("LLM_RATE_ROUTINE_RESERVE", "0.2"))
+        self.max_wait = max_wait or float(os.getenv("LLM_RATE_MAX_WAIT_SECONDS", "30"))
+        self.burst = burst or float(os.getenv("LLM_RATE_BURST_SECONDS", "5"))
+        self.poll_interval = poll_interval
+        self._conn = None
+        self._lock = threading.Lock()
+        self._cond = threading.Condition()
+        # Database work for async callers; one thread is enough since _lock serializes it anyway
+        self._db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rate-limiter")
+        self._waiting = {}  # (model, priority level) -> callers of this process waiting for quota
+        self.calls = 0
+        self.throttled = {}  # priority name -> calls that had to wait
+        self.wait_seconds = {}  # priority name -> total seconds spent waiting
+        self.timeouts = 0
+
+    def _rate(self, kind: str) -> float:
+        """Refill rate per second"""
+        return (self.rpm if kind == "requests" else self.tpm) * self.headroom / 60
+
+    def _capacity(self, kind: str) -> float:
+        return self._rate(kind) * self.burst
+
+    def _connect(self):
+        """Open the shared database on first use (caller holds the lock)"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            if self.path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "model TEXT NOT NULL, kind TEXT NOT NULL, level REAL NOT NULL, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (model, kind))"
+            )
+        return self._conn
+
+    def _levels(self, model: str, now: float) -> dict:
+        """Current bucket levels for a model after refilling (caller holds the lock)"""
+        levels = {}
+        for kind in ("requests", "tokens"):
+            capacity = self._capacity(kind)
+            row = self._conn.execute(
+                "SELECT level, updated_at FROM buckets WHERE model = ? AND kind = ?", (model, kind)
+            ).fetchone()
+            if row is None:
+                levels[kind] = capacity
+            else:
+                levels[kind] = min(capacity, row[0] + max(0.0, now - row[1]) * self._rate(kind))
+        return levels
+
+    def _try_take(self, model: str, tokens: int, level: int) -> float:
+        """Take quota if there is enough; return 0 on success or the seconds until there should be"""
+        needs = {"requests": 1, "tokens": tokens}
+        with self._lock:
+            conn = self._connect()
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                levels = self._levels(model, now)
+                wait = 0.0
+                for kind, need in needs.items():
+                    capacity = self._capacity(kind)
+                    floor = capacity * self.reserve if level >= ROUTINE else 0.0
+                    need = min(need, capacity - floor)  # A prompt bigger than the bucket still gets through
+                    needs[kind] = need
+                    if levels[kind] - need < floor:
+                        wait = max(wait, (need + floor - levels[kind]) / self._rate(kind))
+                if wait > 0:
+                    conn.execute("ROLLBACK")
+                    return wait
+                for kind, need in needs.items():
+                    conn.execute(
+                        "INSERT OR REPLACE INTO buckets (model, kind, level, updated_at) VALUES (?, ?, ?, ?)",
+                        (model, kind, levels[kind] - need, now)
+                    )
+                conn.execute("COMMIT")
+                return 0.0
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _attempt(self, model: str, tokens: int, level: int, started: float, max_wait: float) -> float:
+        """One try at taking quota; 0 when taken, else how long to sleep before the next try"""
+        with self._cond:
+            outranked = any(
+                count for (waiting_model, waiting_level), count in self._waiting.items()
+                if waiting_model == model and waiting_level < level
+            )
+        wait = self.poll_interval if outranked else self._try_take(model, tokens, level)
+        waited = time.monotonic() - started
+        name = PRIORITY_NAMES.get(level, str(level))
+        if wait == 0:
+            with self._cond:
+                self.calls += 1
+                if waited > 0.001:
+                    self.throttled[name] = self.throttled.get(name, 0) + 1
+                    self.wait_seconds[name] = self.wait_seconds.get(name, 0.0) + waited
+            if waited > 1:
+                print(f"🚦 {name} call to {model} waited {waited:.1f}s for Gemini quota")
+            return 0.0
+        if waited + wait > max_wait:
+            with self._cond:
+                self.timeouts += 1
+            raise RateLimitExceededError(
+                f"429 client-side rate limit: no {model} quota within {max_wait:g}s"
+            )
+        return min(wait, self.poll_interval, max(0.0, max_wait - waited))
+
+    @contextmanager
+    def _waiting_as(self, model: str, level: int):
+        """Register a waiter so lower-priority callers of this process step aside"""
+        with self._cond:
+            self._waiting[(model, level)] = self._waiting.get((model, level), 0) + 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._waiting[(model, level)] -= 1
+                self._cond.notify_all()
+
+    def acquire(self, model: str, tokens: int, level: int = None, timeout: float = None) -> float:
+        """Block until the call fits in the model's quota; returns the seconds waited.
+
+        timeout shortens max_wait, e.g. to the caller's remaining deadline.
+        """
+        level = current_priority_level() if level is None else level
+        max_wait = min(self.max_wait, timeout) if timeout is not None else self.max_wait
+        started = time.monotonic()
+        with self._waiting_as(model, level):
+            while True:
+                sleep_for = self._attempt(model, tokens, level, started, max_wait)
+                if sleep_for == 0:
+                    return time.monotonic() - started
+                with self._cond:
+                    # Woken early when another caller stops waiting, otherwise poll for quota freed by other workers
+                    self._cond.wait(sleep_for)
+
+    async def acquire_async(self, model: str, tokens: int, level: int = None, timeout: float = None) -> float:
+        """acquire() for coroutines: tries on the limiter's thread, sleeps on the event loop between tries"""
+        level = current_priority_level() if level is None else level
+        max_wait = min(self.max_wait, timeout) if timeout is not None else self.max_wait
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        with self._waiting_as(model, level):
+            while True:
+                # Each try is a BEGIN IMMEDIATE on the shared file, which can wait on other workers
+                sleep_for = await loop.run_in_executor(self._db_executor, self._attempt, model, tokens, level, started, max_wait)
+                if sleep_for == 0:
+                    return time.monotonic() - started
+                await asyncio.sleep(sleep_for)
+
+    def settle(self, model: str, charged: int, actual: int = None):
+        """Correct the token bucket once the real usage is known (actual=0 refunds a failed call)"""
+        if actual is None or actual == charged:
+            return
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "UPDATE buckets SET level = level + ? WHERE model = ? AND kind = 'tokens'",
+                (charged - actual, model)
+            )
+
+    async def settle_async(self, model: str, charged: int, actual: int = None):
+        """settle() for coroutines: the database write happens on the limiter's thread"""
+        if actual is None or actual == charged:
+            return
+        await asyncio.get_running_loop().run_in_executor(self._db_executor, self.settle, model, charged, actual)
+
+    def stats(self) -> dict:
+        with self._lock:
+            buckets = {}
+            if self._conn is not None:
+                now = time.time()
+                models = [row[0] for row in self._conn.execute("SELECT DISTINCT model FROM buckets")]
+                for model in models:
+                    levels = self._levels(model, now)
+                    buckets[model] = {
+                        "requests_available": round(levels["requests"], 1),
+                        "tokens_available": round(levels["tokens"])
+                    }
+        with self._cond:
+            waiting = {}
+            for (model, level), count in self._waiting.items():
+                if count:
+                    name = PRIORITY_NAMES.get(level, str(level))
+                    waiting[name] = waiting.get(name, 0) + count
+            return {
+                "rpm_limit": self.rpm,
+                "tpm_limit": self.tpm,
+                "headroom": self.headroom,
+                "routine_reserve": self.reserve,
+                "burst_seconds": self.burst,
+                "shared_path": self.path,
+                "calls": self.calls,
+                "timeouts": self.timeouts,
+                "waiting": waiting,
+                "throttled_by_priority": dict(self.throttled),
+                "wait_seconds_by_priority": {name: round(total, 2) for name, total in self.wait_seconds.items()},
+                "buckets": buckets
+            }
+
+
+# Global Gemini rate limiter shared by every model handle
+rate_limiter = RateLimiter()
@@ -5,6 +5,7 @@ Reminder Scheduler Service using APScheduler
 
 import os
 import json
+import threading
 from datetime import datetime
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.date import DateTrigger
@@ -16,6 +17,9 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Bookings run in worker threads, so guard the read-modify-write of scheduled_reminders.json
+reminders_file_lock = threading.Lock()
+
 class ReminderScheduler:
     """Background scheduler for sending appointment reminders"""
     
@@ -158,12 +162,6 @@ class ReminderScheduler:
         try:
             filename = "scheduled_reminders.json"
             
-            # Load existing reminders
-            existing_reminders = []
-            if os.path.exists(filename):
-                with open(filename, 'r') as f:
-                    existing_reminders = json.load(f)
-            
             # Debug logging to see what data we're getting
             logger.info(f"📋 Saving reminder info for appointment: {appointment_data.get('appointment_id')}")
             logger.info(f"📋 Doctor name: {appointment_data.get('doctor_name')}")
@@ -197,11 +195,18 @@ class ReminderScheduler:
             
             logger.info(f"📋 Final reminder_info being saved: {reminder_info}")
             
-            existing_reminders.append(reminder_info)
-            
-            # Save updated list
-            with open(filename, 'w') as f:
-                json.dump(existing_reminders, f, indent=2)
+            with reminders_file_lock:
+                # Load existing reminders
+                existing_reminders = []
+                if os.path.exists(filename):
+                    with open(filename, 'r') as f:
+                        existing_reminders = json.load(f)
+                
+                existing_reminders.append(reminder_info)
+                
+                # Save updated list
+                with open(filename, 'w') as f:
+                    json.dump(existing_reminders, f, indent=2)
             
             logger.info(f"💾 Reminder info saved to {filename}")
             
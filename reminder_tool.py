@@ -3,6 +3,7 @@
 Comprehensive reminder tool for appointment reminders
 """
 
+import asyncio
 import json
 import os
 from typing import Type
@@ -11,9 +12,9 @@ from crewai.tools import BaseTool
 from datetime import datetime, timedelta
 from .date_utils import parse_appointment_time, calculate_reminder_time, format_appointment_date
 from .notification_tool import PushNotificationTool
-from .reminder_scheduler import reminder_scheduler
+from .reminder_scheduler import reminder_scheduler, reminders_file_lock
 import google.generativeai as genai
-from model_config import get_model_with_retry
+from model_config import get_model_with_retry, run_coroutine
 
 # Initialize Google Gemini for message generation
 genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
@@ -28,6 +29,9 @@ class CompleteReminderTool(BaseTool):
     args_schema: Type[BaseModel] = ReminderInput
 
     def _run(self, appointment_data: dict, patient_data: dict) -> str:
+        return run_coroutine(self._arun(appointment_data, patient_data))
+
+    async def _arun(self, appointment_data: dict, patient_data: dict) -> str:
         """
         Complete reminder workflow:
         1. Calculate reminder time (30 minutes before appointment)
@@ -51,11 +55,12 @@ class CompleteReminderTool(BaseTool):
             print(f"⏰ Reminder scheduled for: {format_appointment_date(reminder_time)}")
             
             # Step 2: Generate personalized reminder message
-            reminder_message = self._generate_personalized_message(appointment_data, patient_data)
+            reminder_message = await self._generate_personalized_message(appointment_data, patient_data)
             print(f"💬 Generated reminder message: {reminder_message[:100]}...")
             
             # Step 3: Schedule the reminder (in a real system, this would use a scheduler)
-            reminder_scheduled = self._schedule_reminder(
+            reminder_scheduled = await asyncio.to_thread(
+                self._schedule_reminder,
                 appointment_data.get('appointment_id'),
                 reminder_time,
                 reminder_message,
@@ -71,7 +76,7 @@ class CompleteReminderTool(BaseTool):
             })
             
             # Step 5: Save updated appointment data
-            self._save_appointment_data(appointment_data)
+            await asyncio.to_thread(self._save_appointment_data, appointment_data)
             
             result = {
                 "status": "success",
@@ -94,7 +99,7 @@ class CompleteReminderTool(BaseTool):
             }
             return json.dumps(error_result, indent=2)
 
-    def _generate_personalized_message(self, appointment_data: dict, patient_data: dict) -> str:
+    async def _generate_personalized_message(self, appointment_data: dict, patient_data: dict) -> str:
         """Generate personalized reminder message using LLM"""
         try:
             # Prepare context for LLM
@@ -137,7 +142,7 @@ class CompleteReminderTool(BaseTool):
             
             # Generate message using stable Gemini model
             model = get_model_with_retry()
-            response = model.generate_content(prompt)
+            response = await model.generate_content_async(prompt)
             message = response.text.strip()
             
             # Add appointment ID if not already included
@@ -228,18 +233,19 @@ class CompleteReminderTool(BaseTool):
         try:
             filename = "scheduled_reminders.json"
             
-            # Load existing reminders
-            existing_reminders = []
-            if os.path.exists(filename):
-                with open(filename, 'r') as f:
-                    existing_reminders = json.load(f)
-            
-            # Add new reminder
-            existing_reminders.append(reminder_info)
-            
-            # Save updated list
-            with open(filename, 'w') as f:
-                json.dump(existing_reminders, f, indent=2)
+            with reminders_file_lock:
+                # Load existing reminders
+                existing_reminders = []
+                if os.path.exists(filename):
+                    with open(filename, 'r') as f:
+                        existing_reminders = json.load(f)
+                
+                # Add new reminder
+                existing_reminders.append(reminder_info)
+                
+                # Save updated list
+                with open(filename, 'w') as f:
+                    json.dump(existing_reminders, f, indent=2)
             
             print(f"💾 Reminder data saved to {filename}")
             
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Bounded in-memory session store with LRU and idle-TTL eviction
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Defaults can be tuned per deployment through the environment
+DEFAULT_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+DEFAULT_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL_SECONDS", "3600"))
+
+
+class SessionStore:
+    """Thread-safe mapping of session id to value with a size bound and idle expiry.
+
+    Entries are kept in least-recently-used order, so expired sessions are always
+    at the front and can be swept without scanning the whole store. When the store
+    is full the least recently used session is evicted to make room.
+    """
+
+    def __init__(self, name: str, max_sessions: int = None, idle_ttl: float = None, on_evict=None):
+        self.name = name
+        self.max_sessions = max_sessions or DEFAULT_MAX_SESSIONS
+        self.idle_ttl = idle_ttl if idle_ttl is not None else DEFAULT_IDLE_TTL
+        self.on_evict = on_evict
+        self._entries = OrderedDict()  # key -> [value, last_access]
+        self._lock = threading.RLock()
+        self.created = 0
+        self.removed = 0
+        self.evicted_idle = 0
+        self.evicted_capacity = 0
+
+    def _expire(self, now: float):
+        """Drop sessions idle for longer than the TTL (caller holds the lock)"""
+        expired = []
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if now - entry[1] < self.idle_ttl:
+                break
+            self._entries.popitem(last=False)
+            self.evicted_idle += 1
+            expired.append((key, entry[0]))
+        return expired
+
+    def _notify(self, evicted):
+        if self.on_evict:
+            for key, value in evicted:
+                try:
+                    self.on_evict(key, value)
+                except Exception as e:
+                    print(f"⚠️ Error evicting session {key} from {self.name}: {e}")
+
+    def get(self, key, default=None):
+        """Return the session value and mark it as recently used"""
+        with self._lock:
+            now = time.monotonic()
+            evicted = self._expire(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[1] = now
+                self._entries.move_to_end(key)
+        self._notify(evicted)
+        return entry[0] if entry is not None else default
+
+    def set(self, key, value):
+        """Insert or replace a session, evicting the least recently used one if full"""
+        with self._lock:
+            now = time.monotonic()
+            evicted = self._expire(now)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            else:
+                self.created += 1
+                while len(self._entries) >= self.max_sessions:
+                    old_key, old_entry = self._entries.popitem(last=False)
+                    evicted.append((old_key, old_entry[0]))
+                    self.evicted_capacity += 1
+            self._entries[key] = [value, now]
+        self._notify(evicted)
+
+    def pop(self, key, default=None):
+        """Remove a session and return its value"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.removed += 1
+        return entry[0] if entry is not None else default
+
+    def touch(self, key) -> bool:
+        """Refresh a session's idle timer without reading it"""
+        return self.get(key, _MISSING) is not _MISSING
+
+    def most_recent(self):
+        """Return (key, value) of the most recently used session, or None"""
+        with self._lock:
+            evicted = self._expire(time.monotonic())
+            item = next(reversed(self._entries.items()), None)
+        self._notify(evicted)
+        return (item[0], item[1][0]) if item else None
+
+    def evict_expired(self) -> int:
+        """Sweep idle sessions now and return how many were evicted"""
+        with self._lock:
+            evicted = self._expire(time.monotonic())
+        self._notify(evicted)
+        return len(evicted)
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        if self.pop(key, _MISSING) is _MISSING:
+            raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            evicted = self._expire(time.monotonic())
+            found = key in self._entries
+        self._notify(evicted)
+        return found
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> dict:
+        """Counters for live and evicted sessions"""
+        with self._lock:
+            return {
+                "name": self.name,
+                "live_sessions": len(self._entries),
+                "max_sessions": self.max_sessions,
+                "idle_ttl_seconds": self.idle_ttl,
+                "created": self.created,
+                "removed": self.removed,
+                "evicted_idle": self.evicted_idle,
+                "evicted_capacity": self.evicted_capacity,
+                "evicted_total": self.evicted_idle + self.evicted_capacity
+            }
+
+
+_MISSING = object()
@@ -0,0 +1,603 @@
+#!/usr/bin/env python3
+"""
+Shared state backends for conversation state, pending user answers and AI doctor scripts
+
+The API keeps per-conversation data behind the StateBackend interface so that the
+/respond POST and the /ws connection do not have to land on the same worker:
+
+- memory: per-process SessionStores (single worker, the default)
+- sqlite: one database file shared by all workers on a host
+- redis:  any Redis-protocol server, shared across workers and nodes
+
+Select a backend with STATE_BACKEND=memory|sqlite|redis (STATE_SQLITE_PATH, REDIS_URL).
+"""
+
+import asyncio
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from session_store import SessionStore, DEFAULT_MAX_SESSIONS, DEFAULT_IDLE_TTL
+
+# Optional Redis client
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+# Key of the marker a channel pushes to its conversation's answer queue when it closes; the value is
+# the channel's own random token, so neither a later channel nor a client posting to /respond can fake it
+CLOSED_MARKER_KEY = "__conversation_closed__"
+
+
+class StateBackend:
+    """Interface for conversation data shared between API workers.
+
+    Values must be JSON-serializable. Callers update stored dicts through
+    update() rather than mutating what get() returned, because remote
+    backends hand back copies.
+    """
+
+    def get(self, namespace: str, key: str, default=None):
+        raise NotImplementedError
+
+    def set(self, namespace: str, key: str, value):
+        raise NotImplementedError
+
+    def delete(self, namespace: str, key: str):
+        raise NotImplementedError
+
+    def update(self, namespace: str, key: str, fields: dict) -> dict:
+        """Merge fields into a stored dict and return the merged value"""
+        return self.modify(namespace, key, lambda value: {**(value or {}), **fields})
+
+    def modify(self, namespace: str, key: str, fn):
+        """Atomically replace the stored value with fn(value) and return the new value.
+
+        fn gets None for a missing key and may return None to leave the key untouched.
+        """
+        raise NotImplementedError
+
+    def claim(self, namespace: str, key: str, flag: str, value: dict) -> bool:
+        """Atomically store value with flag set unless the stored dict already has flag set.
+
+        Returns True for the one caller that claimed the key.
+        """
+        raise NotImplementedError
+
+    def most_recent(self, namespace: str):
+        """Return (key, value) of the most recently written entry, or None"""
+        raise NotImplementedError
+
+    def push_response(self, conversation_id: str, message):
+        """Queue a user's answer for the worker running that conversation's crew"""
+        raise NotImplementedError
+
+    def wait_for_response(self, conversation_id: str, timeout: float):
+        """Block until an answer is queued for the conversation; None on timeout"""
+        raise NotImplementedError
+
+    def clear_responses(self, conversation_id: str):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        raise NotImplementedError
+
+    def namespace(self, name: str) -> "StateNamespace":
+        return StateNamespace(self, name)
+
+
+class StateNamespace:
+    """Dict-like view of one namespace in a StateBackend"""
+
+    def __init__(self, backend: StateBackend, name: str):
+        self.backend = backend
+        self.name = name
+
+    def get(self, key, default=None):
+        return self.backend.get(self.name, key, default)
+
+    def set(self, key, value):
+        self.backend.set(self.name, key, value)
+
+    def update(self, key, fields: dict) -> dict:
+        return self.backend.update(self.name, key, fields)
+
+    def claim(self, key, flag: str, value: dict) -> bool:
+        return self.backend.claim(self.name, key, flag, value)
+
+    def modify(self, key, fn):
+        return self.backend.modify(self.name, key, fn)
+
+    def pop(self, key, default=None):
+        value = self.backend.get(self.name, key, _MISSING)
+        if value is _MISSING:
+            return default
+        self.backend.delete(self.name, key)
+        return value
+
+    def most_recent(self):
+        return self.backend.most_recent(self.name)
+
+    def __getitem__(self, key):
+        value = self.backend.get(self.name, key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.backend.set(self.name, key, value)
+
+    def __delitem__(self, key):
+        if self.pop(key, _MISSING) is _MISSING:
+            raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        return self.backend.get(self.name, key, _MISSING) is not _MISSING
+
+    # Event-loop variants: SQLite and Redis calls block, so they run in a worker thread
+
+    async def get_async(self, key, default=None):
+        return await asyncio.to_thread(self.get, key, default)
+
+    async def set_async(self, key, value):
+        await asyncio.to_thread(self.set, key, value)
+
+    async def update_async(self, key, fields: dict) -> dict:
+        return await asyncio.to_thread(self.update, key, fields)
+
+    async def claim_async(self, key, flag: str, value: dict) -> bool:
+        return await asyncio.to_thread(self.claim, key, flag, value)
+
+    async def modify_async(self, key, fn):
+        return await asyncio.to_thread(self.modify, key, fn)
+
+    async def pop_async(self, key, default=None):
+        return await asyncio.to_thread(self.pop, key, default)
+
+    async def contains_async(self, key) -> bool:
+        return await asyncio.to_thread(self.__contains__, key)
+
+    async def most_recent_async(self):
+        return await asyncio.to_thread(self.most_recent)
+
+
+class InMemoryStateBackend(StateBackend):
+    """Per-process backend built on SessionStore (only valid with a single worker)"""
+
+    def __init__(self, max_sessions: int = None, idle_ttl: float = None):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._stores = {}
+        self._responses = SessionStore("pending_responses", max_sessions, idle_ttl)
+        self._lock = threading.Lock()
+
+    def _store(self, namespace: str) -> SessionStore:
+        with self._lock:
+            if namespace not in self._stores:
+                self._stores[namespace] = SessionStore(namespace, self.max_sessions, self.idle_ttl)
+            return self._stores[namespace]
+
+    def get(self, namespace, key, default=None):
+        return self._store(namespace).get(key, default)
+
+    def set(self, namespace, key, value):
+        self._store(namespace).set(key, value)
+
+    def delete(self, namespace, key):
+        self._store(namespace).pop(key)
+
+    def update(self, namespace, key, fields):
+        store = self._store(namespace)
+        with self._lock:
+            value = store.get(key) or {}
+            value.update(fields)
+            store.set(key, value)
+        return value
+
+    def claim(self, namespace, key, flag, value):
+        store = self._store(namespace)
+        with self._lock:
+            if (store.get(key) or {}).get(flag):
+                return False
+            store.set(key, {**value, flag: True})
+        return True
+
+    def modify(self, namespace, key, fn):
+        store = self._store(namespace)
+        with self._lock:
+            value = fn(store.get(key))
+            if value is not None:
+                store.set(key, value)
+        return value
+
+    def most_recent(self, namespace):
+        return self._store(namespace).most_recent()
+
+    def _answers(self, conversation_id: str) -> queue.Queue:
+        with self._lock:
+            answers = self._responses.get(conversation_id)
+            if answers is None:
+                answers = queue.Queue()
+                self._responses.set(conversation_id, answers)
+            return answers
+
+    def push_response(self, conversation_id, message):
+        self._answers(conversation_id).put_nowait(message)
+
+    def wait_for_response(self, conversation_id, timeout):
+        try:
+            return self._answers(conversation_id).get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def clear_responses(self, conversation_id):
+        self._responses.pop(conversation_id)
+
+    def stats(self):
+        with self._lock:
+            stores = list(self._stores.values())
+        return {
+            "backend": "memory",
+            "namespaces": {store.name: store.stats() for store in stores},
+            "pending_responses": self._responses.stats()
+        }
+
+
+class SQLiteStateBackend(StateBackend):
+    """Backend on a shared SQLite file, for several workers on one host.
+
+    SQLite has no change notifications, so waiting for an answer polls the
+    responses table every poll_interval seconds. Patients take seconds to
+    answer, so a fraction of a second of extra latency is not noticed.
+    """
+
+    def __init__(self, path: str = None, max_sessions: int = None, idle_ttl: float = None, poll_interval: float = 0.25):
+        self.path = path or os.getenv("STATE_SQLITE_PATH", "conversation_state.db")
+        self.max_sessions = max_sessions or DEFAULT_MAX_SESSIONS
+        self.idle_ttl = idle_ttl if idle_ttl is not None else DEFAULT_IDLE_TTL
+        self.poll_interval = poll_interval
+        self.evicted_idle = 0
+        self.evicted_capacity = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_state_updated ON state (namespace, updated_at)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, conversation_id TEXT NOT NULL, message TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_conversation ON responses (conversation_id, id)")
+
+    def _evict(self, namespace: str, now: float):
+        """Drop idle entries and trim the namespace to max_sessions (caller holds the lock)"""
+        cursor = self._conn.execute(
+            "DELETE FROM state WHERE namespace = ? AND updated_at < ?", (namespace, now - self.idle_ttl)
+        )
+        self.evicted_idle += max(cursor.rowcount, 0)
+        self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.idle_ttl,))
+        cursor = self._conn.execute(
+            "DELETE FROM state WHERE namespace = ? AND key IN ("
+            "SELECT key FROM state WHERE namespace = ? ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (namespace, namespace, self.max_sessions)
+        )
+        self.evicted_capacity += max(cursor.rowcount, 0)
+
+    def get(self, namespace, key, default=None):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, updated_at FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            if row is None or time.time() - row[1] >= self.idle_ttl:
+                return default
+            self._conn.execute(
+                "UPDATE state SET updated_at = ? WHERE namespace = ? AND key = ?", (time.time(), namespace, key)
+            )
+        return json.loads(row[0])
+
+    def set(self, namespace, key, value):
+        with self._lock:
+            now = time.time()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO state (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                    (namespace, key, json.dumps(value), now)
+                )
+                self._evict(namespace, now)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def update(self, namespace, key, fields):
+        with self._lock:
+            now = time.time()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT value FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+                ).fetchone()
+                value = json.loads(row[0]) if row else {}
+                value.update(fields)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO state (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                    (namespace, key, json.dumps(value), now)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return value
+
+    def claim(self, namespace, key, flag, value):
+        with self._lock:
+            now = time.time()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT value, updated_at FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+                ).fetchone()
+                claimed = not (row and now - row[1] < self.idle_ttl and json.loads(row[0]).get(flag))
+                if claimed:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO state (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                        (namespace, key, json.dumps({**value, flag: True}), now)
+                    )
+                    self._evict(namespace, now)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return claimed
+
+    def modify(self, namespace, key, fn):
+        with self._lock:
+            now = time.time()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT value, updated_at FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+                ).fetchone()
+                value = fn(json.loads(row[0]) if row and now - row[1] < self.idle_ttl else None)
+                if value is not None:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO state (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                        (namespace, key, json.dumps(value), now)
+                    )
+                    self._evict(namespace, now)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return value
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def most_recent(self, namespace):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT key, value FROM state WHERE namespace = ? AND updated_at >= ? ORDER BY updated_at DESC LIMIT 1",
+                (namespace, time.time() - self.idle_ttl)
+            ).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def push_response(self, conversation_id, message):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO responses (conversation_id, message, created_at) VALUES (?, ?, ?)",
+                (conversation_id, json.dumps(message), time.time())
+            )
+
+    def _pop_response(self, conversation_id: str):
+        with self._lock:
+            # Most polls find nothing; only take the database write lock when there is a row to pop
+            pending = self._conn.execute(
+                "SELECT 1 FROM responses WHERE conversation_id = ? LIMIT 1", (conversation_id,)
+            ).fetchone()
+            if pending is None:
+                return _MISSING
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, message FROM responses WHERE conversation_id = ? ORDER BY id LIMIT 1", (conversation_id,)
+                ).fetchone()
+                if row:
+                    self._conn.execute("DELETE FROM responses WHERE id = ?", (row[0],))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return json.loads(row[1]) if row else _MISSING
+
+    def wait_for_response(self, conversation_id, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            message = self._pop_response(conversation_id)
+            if message is not _MISSING:
+                return message
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            time.sleep(min(self.poll_interval, remaining))
+
+    def clear_responses(self, conversation_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE conversation_id = ?", (conversation_id,))
+
+    def stats(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT namespace, COUNT(*) FROM state WHERE updated_at >= ? GROUP BY namespace",
+                (time.time() - self.idle_ttl,)
+            ).fetchall()
+            pending = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "namespaces": {namespace: {"live_sessions": count} for namespace, count in rows},
+            "pending_responses": pending,
+            "max_sessions": self.max_sessions,
+            "idle_ttl_seconds": self.idle_ttl,
+            "evicted_idle": self.evicted_idle,
+            "evicted_capacity": self.evicted_capacity
+        }
+
+
+class RedisStateBackend(StateBackend):
+    """Backend on a Redis-protocol server, for workers spread across nodes.
+
+    Entries expire through Redis TTLs; answers are delivered with BLPOP so a
+    waiting crew thread wakes as soon as any worker pushes the answer. Pass
+    client= to use an existing client or a local stand-in.
+    """
+
+    def __init__(self, url: str = None, client=None, prefix: str = "healthcare", idle_ttl: float = None, max_sessions: int = None):
+        if client is None:
+            if not REDIS_AVAILABLE:
+                raise ImportError("Redis state backend requires the redis package. Install with: pip install redis")
+            client = redis.Redis.from_url(url or os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        self.client = client
+        self.prefix = prefix
+        self.idle_ttl = int(idle_ttl if idle_ttl is not None else DEFAULT_IDLE_TTL)
+        self.max_sessions = max_sessions or DEFAULT_MAX_SESSIONS
+        self.evicted_capacity = 0
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{self.prefix}:{namespace}:{key}"
+
+    def _index(self, namespace: str) -> str:
+        return f"{self.prefix}:{namespace}:__index__"
+
+    def _responses_key(self, conversation_id: str) -> str:
+        return f"{self.prefix}:responses:{conversation_id}"
+
+    def _touch_index(self, namespace: str, key: str):
+        index = self._index(namespace)
+        now = time.time()
+        self.client.zadd(index, {key: now})
+        # Forget index entries whose values have expired, then enforce the size bound
+        self.client.zremrangebyscore(index, 0, now - self.idle_ttl)
+        overflow = self.client.zcard(index) - self.max_sessions
+        if overflow > 0:
+            for old_key in self.client.zrange(index, 0, overflow - 1):
+                old_key = old_key.decode() if isinstance(old_key, bytes) else old_key
+                self.client.delete(self._key(namespace, old_key))
+            self.client.zremrangebyrank(index, 0, overflow - 1)
+            self.evicted_capacity += overflow
+        self.client.expire(index, self.idle_ttl)
+
+    def get(self, namespace, key, default=None):
+        raw = self.client.get(self._key(namespace, key))
+        if raw is None:
+            return default
+        self.client.expire(self._key(namespace, key), self.idle_ttl)
+        self.client.zadd(self._index(namespace), {key: time.time()})
+        return json.loads(raw)
+
+    def set(self, namespace, key, value):
+        self.client.set(self._key(namespace, key), json.dumps(value), ex=self.idle_ttl)
+        self._touch_index(namespace, key)
+
+    def claim(self, namespace, key, flag, value):
+        redis_key = self._key(namespace, key)
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    # Retry if another worker writes the key between our read and our write
+                    pipe.watch(redis_key)
+                    raw = pipe.get(redis_key)
+                    if raw is not None and json.loads(raw).get(flag):
+                        pipe.unwatch()
+                        return False
+                    pipe.multi()
+                    pipe.set(redis_key, json.dumps({**value, flag: True}), ex=self.idle_ttl)
+                    pipe.execute()
+                    break
+                except redis.WatchError:
+                    continue
+        self._touch_index(namespace, key)
+        return True
+
+    def modify(self, namespace, key, fn):
+        redis_key = self._key(namespace, key)
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    # Retry if another worker writes the key between our read and our write
+                    pipe.watch(redis_key)
+                    raw = pipe.get(redis_key)
+                    value = fn(json.loads(raw) if raw is not None else None)
+                    if value is None:
+                        pipe.unwatch()
+                        return None
+                    pipe.multi()
+                    pipe.set(redis_key, json.dumps(value), ex=self.idle_ttl)
+                    pipe.execute()
+                    break
+                except redis.WatchError:
+                    continue
+        self._touch_index(namespace, key)
+        return value
+
+    def delete(self, namespace, key):
+        self.client.delete(self._key(namespace, key))
+        self.client.zrem(self._index(namespace), key)
+
+    def most_recent(self, namespace):
+        for key in self.client.zrevrange(self._index(namespace), 0, 0):
+            key = key.decode() if isinstance(key, bytes) else key
+            value = self.get(namespace, key, _MISSING)
+            if value is not _MISSING:
+                return key, value
+        return None
+
+    def push_response(self, conversation_id, message):
+        responses_key = self._responses_key(conversation_id)
+        self.client.rpush(responses_key, json.dumps(message))
+        self.client.expire(responses_key, self.idle_ttl)
+
+    def wait_for_response(self, conversation_id, timeout):
+        # BLPOP takes whole seconds; 0 would block forever
+        result = self.client.blpop([self._responses_key(conversation_id)], timeout=max(1, int(round(timeout))))
+        if result is None:
+            return None
+        return json.loads(result[1])
+
+    def clear_responses(self, conversation_id):
+        self.client.delete(self._responses_key(conversation_id))
+
+    def stats(self):
+        return {
+            "backend": "redis",
+            "prefix": self.prefix,
+            "idle_ttl_seconds": self.idle_ttl,
+            "max_sessions": self.max_sessions,
+            "evicted_capacity": self.evicted_capacity
+        }
+
+
+def create_state_backend(kind: str = None) -> StateBackend:
+    """Create the backend selected by STATE_BACKEND (memory, sqlite or redis)"""
+    kind = (kind or os.getenv("STATE_BACKEND", "memory")).lower()
+    if kind == "sqlite":
+        return SQLiteStateBackend()
+    if kind == "redis":
+        return RedisStateBackend()
+    if kind != "memory":
+        print(f"⚠️ Unknown STATE_BACKEND '{kind}', using in-memory state")
+    return InMemoryStateBackend()
+
+
+_MISSING = object()
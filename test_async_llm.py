@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Test the native async Gemini path used by the tools
+"""
+
+import asyncio
+import os
+import threading
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+
+from deadlines import deadline, remaining_time
+from model_config import ModelPool, ModelConfig, RequestHedger, MODEL_POOL, run_coroutine
+from priority_scheduler import (
+    ConversationPriority, PriorityGate, GateTimeoutError, EMERGENCY, set_current_priority, current_priority_level
+)
+from rate_limiter import RateLimiter
+
+
+class AsyncModel:
+    """Stand-in for genai.GenerativeModel with both the blocking and the async client"""
+
+    def __init__(self, latency: float = 0.0, label: str = "answer"):
+        self.latency = latency
+        self.label = label
+        self.async_calls = 0
+        self.sync_threads = []
+        self.cancelled = 0
+
+    def generate_content(self, prompt, **kwargs):
+        self.sync_threads.append(threading.current_thread())
+        time.sleep(self.latency)
+        return f"{self.label} to {prompt}"
+
+    async def generate_content_async(self, prompt, **kwargs):
+        self.async_calls += 1
+        try:
+            await asyncio.sleep(self.latency)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return f"{self.label} to {prompt}"
+
+
+def async_pool(capacity: int = 100, **models) -> ModelPool:
+    pool = ModelPool(ModelConfig(), limiter=RateLimiter(rpm=10 ** 6, path=":memory:"))
+    gate = PriorityGate("test", capacity=capacity)
+    for name in ModelConfig.FALLBACK_MODELS:
+        handle = pool.get(name)
+        handle._model = models.get(name, AsyncModel())
+        handle._gate = gate
+    return pool
+
+
+def test_native_calls_share_the_loop():
+    """Test 1: Many concurrent calls on the registered loop run without a thread each"""
+    print("🧪 TEST 1: Native async fan-out")
+    model = AsyncModel(latency=0.2)
+    pool = async_pool(**{"gemini-1.5-flash": model})
+    router = pool.router("gemini-1.5-flash")
+
+    async def scenario():
+        pool.enable_native_async()
+        threads_before = threading.active_count()
+        started = time.monotonic()
+        answers = await asyncio.gather(*(router.generate_content_async(f"prompt {i}") for i in range(50)))
+        return answers, time.monotonic() - started, threading.active_count() - threads_before
+
+    answers, elapsed, extra_threads = asyncio.run(scenario())
+    assert answers[7] == "answer to prompt 7"
+    assert model.async_calls == 50 and not model.sync_threads
+    # Quota bookkeeping runs on the rate limiter's single thread, never a thread per call
+    assert elapsed < 1.0 and extra_threads <= 1
+    print(f"✅ 50 calls in {elapsed:.2f}s with {extra_threads} extra thread")
+
+
+def test_other_loops_fall_back_to_threads():
+    """Test 2: Off the registered loop the blocking client runs in a worker thread"""
+    print("🧪 TEST 2: Fallback off the API loop")
+    model = AsyncModel()
+    router = async_pool(**{"gemini-1.5-flash": model}).router("gemini-1.5-flash")
+
+    assert asyncio.run(router.generate_content_async("fever")) == "answer to fever"
+    assert model.async_calls == 0
+    assert model.sync_threads[0] is not threading.main_thread()
+    print("✅ Unregistered loop used the blocking client off-loop")
+
+
+def test_async_hedge_cancels_the_loser():
+    """Test 3: A slow primary is hedged and the losing call is cancelled"""
+    print("🧪 TEST 3: Async hedging")
+    primary = AsyncModel(latency=1.0, label="primary")
+    pool = async_pool(**{
+        "gemini-1.5-flash": primary,
+        "gemini-1.5-pro": AsyncModel(latency=0.02, label="hedge")
+    })
+    pool.hedger = RequestHedger(min_delay=0.05, default_delay=0.1)
+    router = pool.router("gemini-1.5-flash", hedge=True)
+
+    async def scenario():
+        pool.enable_native_async()
+        started = time.monotonic()
+        answer = await router.generate_content_async("chest pain")
+        await asyncio.sleep(0)  # Let the cancellation reach the loser
+        return answer, time.monotonic() - started
+
+    answer, elapsed = asyncio.run(scenario())
+    assert answer == "hedge to chest pain" and elapsed < 0.5
+    assert primary.cancelled == 1
+    # A cancelled hedge loser is not a failure of the model
+    assert pool.get("gemini-1.5-flash").breaker.state == "closed"
+    assert pool.stats()["hedging"]["hedge_wins"] == 1
+    print(f"✅ Hedge answered in {elapsed:.2f}s and the slow call was cancelled")
+
+
+def test_async_single_flight():
+    """Test 4: Identical prompts awaited together share one call"""
+    print("🧪 TEST 4: Async coalescing")
+    model = AsyncModel(latency=0.1)
+    pool = async_pool(**{"gemini-1.5-flash": model})
+    router = pool.router("gemini-1.5-flash")
+
+    async def scenario():
+        pool.enable_native_async()
+        return await asyncio.gather(*(router.generate_content_async("headache") for _ in range(5)))
+
+    answers = asyncio.run(scenario())
+    assert set(answers) == {"answer to headache"}
+    assert model.async_calls == 1
+    assert pool.stats()["single_flight"]["calls_coalesced"] == 4
+    print("✅ Five awaits, one Gemini call")
+
+
+def test_async_gate_priority_and_timeout():
+    """Test 5: Awaiting the gate serves emergencies first and gives up at the timeout"""
+    print("🧪 TEST 5: Async priority gate")
+    gate = PriorityGate("test", capacity=1)
+    order = []
+
+    async def call(name, priority):
+        async with gate.slot_async(priority):
+            order.append(name)
+
+    async def scenario():
+        await gate.acquire_async(ConversationPriority("holder"))
+        try:
+            await gate.acquire_async(ConversationPriority("late"), timeout=0.05)
+            assert False, "expected the gate wait to time out"
+        except GateTimeoutError:
+            pass
+        waiters = [asyncio.ensure_future(call(f"routine-{i}", ConversationPriority(f"routine-{i}"))) for i in range(2)]
+        await asyncio.sleep(0.02)
+        waiters.append(asyncio.ensure_future(call("emergency", ConversationPriority("emergency", EMERGENCY))))
+        await asyncio.sleep(0.02)
+        gate.release()
+        await asyncio.gather(*waiters)
+
+    asyncio.run(scenario())
+    assert order == ["emergency", "routine-0", "routine-1"]
+    assert gate.stats()["timeouts"] == 1 and gate.stats()["active"] == 0
+    print("✅ Emergency admitted first, late waiter timed out")
+
+
+def test_tool_coroutines_run_on_the_api_loop():
+    """Test 6: A sync tool entry point in a crew thread runs its coroutine on the API loop"""
+    print("🧪 TEST 6: Tools on the API loop")
+    original = MODEL_POOL.async_loop
+    seen = {}
+
+    async def tool_body():
+        seen["loop"] = asyncio.get_running_loop()
+        seen["level"] = current_priority_level()
+        seen["budget"] = remaining_time()
+        return "done"
+
+    def crew_thread():
+        set_current_priority(ConversationPriority("c1", EMERGENCY))
+        with deadline(5):
+            return run_coroutine(tool_body())
+
+    async def scenario():
+        MODEL_POOL.enable_native_async()
+        return asyncio.get_running_loop(), await asyncio.to_thread(crew_thread)
+
+    try:
+        api_loop, result = asyncio.run(scenario())
+    finally:
+        MODEL_POOL.async_loop = original
+    assert result == "done" and seen["loop"] is api_loop
+    # The conversation's priority and deadline come along
+    assert seen["level"] == EMERGENCY and 0 < seen["budget"] <= 5
+    # Without a running API loop the tool gets a loop of its own
+    assert run_coroutine(tool_body()) == "done" and seen["loop"] is not api_loop
+    print("✅ Tool ran on the API loop with its conversation context")
+
+
+def main():
+    print("🧪 Async LLM Test Suite")
+    print("=" * 50)
+    test_native_calls_share_the_loop()
+    test_other_loops_fall_back_to_threads()
+    test_async_hedge_cancels_the_loser()
+    test_async_single_flight()
+    test_async_gate_priority_and_timeout()
+    test_tool_coroutines_run_on_the_api_loop()
+    print("\n🎉 All async LLM tests passed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Test that appointment bookings confirm immediately and don't block the event loop or each other
+"""
+
+import asyncio
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+# The crew imports its tools as tools.* and the API as doccrew.research_crew.src.research_crew.tools.*,
+# while this checkout keeps those modules next to the API, so point both packages at this directory
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+TOOL_PACKAGES = [
+    ("tools",),
+    ("doccrew", "doccrew.research_crew", "doccrew.research_crew.src",
+     "doccrew.research_crew.src.research_crew", "doccrew.research_crew.src.research_crew.tools"),
+]
+for package_names in TOOL_PACKAGES:
+    if package_names[0] in sys.modules or importlib.util.find_spec(package_names[0]) is not None:
+        continue
+    for package_name in package_names:
+        package = types.ModuleType(package_name)
+        package.__path__ = [PROJECT_DIR] if package_name.endswith("tools") else []
+        sys.modules[package_name] = package
+
+# The API mounts ./static when it is imported, so import it from a directory laid out like the deployment
+with tempfile.TemporaryDirectory() as import_dir:
+    os.makedirs(os.path.join(import_dir, "static"))
+    original_cwd = os.getcwd()
+    os.chdir(import_dir)
+    try:
+        import api
+    finally:
+        os.chdir(original_cwd)
+from doccrew.research_crew.src.research_crew.tools.notification_tool import PushNotificationTool
+from doccrew.research_crew.src.research_crew.tools.reminder_tool import CompleteReminderTool
+from booking_jobs import BookingJobs
+from state_backend import InMemoryStateBackend
+
+# Stand-in for the notification round trip and the Gemini reminder message
+SLOW_CALL_SECONDS = 0.5
+
+
+def slow_notification(self, message: str) -> str:
+    time.sleep(SLOW_CALL_SECONDS)
+    return '{"notification_sent": true}'
+
+
+def slow_reminder(self, appointment_data: dict, patient_data: dict) -> str:
+    time.sleep(SLOW_CALL_SECONDS)
+    return '{"reminder_scheduled": true}'
+
+
+def booking_request(index: int) -> dict:
+    return {
+        "doctor_name": f"Dr. Test {index}",
+        "doctor_specialty": "General Physician",
+        "doctor_hospital": "City Hospital",
+        "appointment_date": "Monday 10:00 AM",
+        "conversation_id": f"booking-{index}"
+    }
+
+
+async def book_concurrently(count: int):
+    """Book count appointments at once and wait for their background jobs, measuring the longest event loop stall"""
+    longest_stall = 0.0
+    done = False
+
+    async def heartbeat():
+        nonlocal longest_stall
+        while not done:
+            started = time.monotonic()
+            await asyncio.sleep(0.01)
+            longest_stall = max(longest_stall, time.monotonic() - started - 0.01)
+
+    monitor = asyncio.ensure_future(heartbeat())
+    started = time.monotonic()
+    results = await asyncio.gather(*(api.book_appointment(booking_request(i)) for i in range(count)))
+    confirmed = time.monotonic() - started
+    await api.booking_jobs.drain()
+    elapsed = time.monotonic() - started
+    done = True
+    await monitor
+    jobs = [(await api.booking_status(result["job_id"]))["job"] for result in results]
+    return results, jobs, confirmed, elapsed, longest_stall
+
+
+def run_bookings(count: int, notification=slow_notification):
+    """Run concurrent bookings in a scratch directory with slow tool stand-ins"""
+    original_notification = PushNotificationTool._run
+    original_reminder = CompleteReminderTool._run
+    original_cwd = os.getcwd()
+    PushNotificationTool._run = notification
+    CompleteReminderTool._run = slow_reminder
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            os.chdir(tmp_dir)
+            try:
+                return asyncio.run(book_concurrently(count))
+            finally:
+                os.chdir(original_cwd)
+    finally:
+        PushNotificationTool._run = original_notification
+        CompleteReminderTool._run = original_reminder
+
+
+def test_concurrent_bookings():
+    """Test 1: Bookings confirm at once and their jobs overlap instead of queueing behind each other"""
+    print("🧪 TEST 1: Concurrent bookings")
+    count = 5
+    results, jobs, confirmed, elapsed, longest_stall = run_bookings(count)
+
+    serialized = count * 2 * SLOW_CALL_SECONDS
+    print(f"⏱️ {count} bookings confirmed in {confirmed:.2f}s, jobs finished in {elapsed:.2f}s "
+          f"(serialized would be {serialized:.1f}s), longest event loop stall {longest_stall * 1000:.0f}ms")
+    assert all(result["status"] == "success" for result in results)
+    assert confirmed < SLOW_CALL_SECONDS
+    assert elapsed < serialized / 2
+    assert longest_stall < SLOW_CALL_SECONDS / 2
+    for job in jobs:
+        assert job["status"] == "completed"
+        assert job["steps"]["notification"]["result"]["notification_sent"] is True
+        assert job["steps"]["reminder"]["status"] == "completed"
+    print("✅ Bookings confirmed immediately and jobs ran concurrently")
+
+
+def test_failed_notification_is_reported():
+    """Test 2: A notification that could not be delivered marks the job as failed"""
+    print("🧪 TEST 2: Failed notification")
+
+    def failing_notification(self, message: str) -> str:
+        return '{"notification_sent": false, "error": "push service unavailable"}'
+
+    results, jobs, _, _, _ = run_bookings(1, notification=failing_notification)
+    assert results[0]["status"] == "success"
+    assert jobs[0]["status"] == "failed"
+    assert jobs[0]["steps"]["notification"]["status"] == "failed"
+    assert jobs[0]["steps"]["reminder"]["status"] == "completed"
+    print("✅ Failed notification reported on the booking job")
+
+
+def test_job_steps_leave_default_executor_free():
+    """Test 3: Slow job steps never hold the threads request handlers use for their own I/O"""
+    print("🧪 TEST 3: Job steps on their own threads")
+
+    async def scenario():
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=2))
+        jobs = BookingJobs(InMemoryStateBackend().namespace("booking_jobs"), max_workers=8)
+        for i in range(4):
+            job = await jobs.create(f"APT{i}")
+            jobs.run_step(job["job_id"], "notification", time.sleep, SLOW_CALL_SECONDS)
+            jobs.run_step(job["job_id"], "reminder", time.sleep, SLOW_CALL_SECONDS)
+        await asyncio.sleep(0.05)
+
+        # What a booking does while the jobs run: a quick file or state call in the default executor
+        started = time.monotonic()
+        await asyncio.to_thread(lambda: None)
+        waited = time.monotonic() - started
+        await jobs.drain()
+        return waited
+
+    waited = asyncio.run(scenario())
+    print(f"⏱️ Request I/O waited {waited * 1000:.0f}ms for a thread while 8 job steps ran")
+    assert waited < SLOW_CALL_SECONDS / 2
+    print("✅ Request I/O was not queued behind job steps")
+
+
+def main():
+    print("🧪 Concurrent Booking Test Suite")
+    print("=" * 50)
+    test_concurrent_bookings()
+    test_failed_notification_is_reported()
+    test_job_steps_leave_default_executor_free()
+    print("\n🎉 All concurrent booking tests passed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Test admission control on the bounded crew executor
+"""
+
+import asyncio
+import threading
+
+from priority_scheduler import ConversationPriority, EMERGENCY, URGENT
+from crew_executor import CrewExecutor, CrewQueueFullError
+
+
+def test_admission_and_queue_positions():
+    """Test 1: At most max_workers crews run and waiters are told their place in line"""
+    print("🧪 TEST 1: Admission")
+
+    async def scenario():
+        executor = CrewExecutor(max_workers=2, max_queue=5, reserved_workers=0)
+        release = threading.Event()
+        positions = {}
+
+        def tracker(name):
+            async def on_queued(position):
+                positions.setdefault(name, []).append(position)
+            return on_queued
+
+        runs = [asyncio.ensure_future(executor.run(release.wait, on_queued=tracker(i), priority=ConversationPriority(f"c{i}")))
+                for i in range(4)]
+        await asyncio.sleep(0.05)
+        stats = executor.stats()
+        assert stats["running"] == 2 and stats["queued"] == 2
+        assert positions == {2: [1], 3: [2]}
+
+        release.set()
+        assert await asyncio.gather(*runs) == [True] * 4
+        stats = executor.stats()
+        assert stats["running"] == 0 and stats["completed"] == 4 and stats["submitted"] == 4
+        executor.shutdown()
+
+    asyncio.run(scenario())
+    print("✅ Two crews ran, two waited and were admitted in turn")
+
+
+def test_priority_ordering():
+    """Test 2: Freed slots go to the most urgent waiter, then to the earliest arrival"""
+    print("🧪 TEST 2: Priority ordering")
+
+    async def scenario():
+        executor = CrewExecutor(max_workers=1, max_queue=5, reserved_workers=0)
+        release = threading.Event()
+        order = []
+
+        def crew(name):
+            return lambda: order.append(name)
+
+        holder = asyncio.ensure_future(executor.run(release.wait, priority=ConversationPriority("holder")))
+        await asyncio.sleep(0.05)
+        waiters = []
+        for name, level in [("routine-1", None), ("urgent", URGENT), ("routine-2", None), ("emergency", EMERGENCY)]:
+            priority = ConversationPriority(name) if level is None else ConversationPriority(name, level)
+            waiters.append(asyncio.ensure_future(executor.run(crew(name), priority=priority)))
+            await asyncio.sleep(0.01)
+
+        release.set()
+        await holder
+        await asyncio.gather(*waiters)
+        assert order == ["emergency", "urgent", "routine-1", "routine-2"]
+        executor.shutdown()
+
+    asyncio.run(scenario())
+    print("✅ Emergency, urgent, then routine crews in arrival order")
+
+
+def test_queue_full_rejection():
+    """Test 3: A caller arriving at a full line is rejected instead of queueing"""
+    print("🧪 TEST 3: Queue-full rejection")
+
+    async def scenario():
+        executor = CrewExecutor(max_workers=1, max_queue=1, reserved_workers=0)
+        release = threading.Event()
+        running = asyncio.ensure_future(executor.run(release.wait, priority=ConversationPriority("a")))
+        await asyncio.sleep(0.05)
+        waiting = asyncio.ensure_future(executor.run(release.wait, priority=ConversationPriority("b")))
+        await asyncio.sleep(0.05)
+
+        try:
+            await executor.run(release.wait, priority=ConversationPriority("c"))
+            assert False, "expected the full queue to reject the run"
+        except CrewQueueFullError:
+            pass
+        assert executor.stats()["rejected"] == 1 and executor.stats()["queued"] == 1
+
+        release.set()
+        await asyncio.gather(running, waiting)
+        executor.shutdown()
+
+    asyncio.run(scenario())
+    print("✅ Third caller rejected with CrewQueueFullError")
+
+
+def test_cancelled_caller_keeps_slot_until_thread_finishes():
+    """Test 4: Cancelling a running caller does not free its worker before the crew thread ends"""
+    print("🧪 TEST 4: Cancelled caller")
+
+    async def scenario():
+        executor = CrewExecutor(max_workers=1, max_queue=5, reserved_workers=0)
+        release = threading.Event()
+        running = asyncio.ensure_future(executor.run(release.wait, priority=ConversationPriority("a")))
+        await asyncio.sleep(0.05)
+        waiting = asyncio.ensure_future(executor.run(lambda: "ran", priority=ConversationPriority("b")))
+        await asyncio.sleep(0.05)
+
+        running.cancel()
+        await asyncio.sleep(0.1)
+        try:
+            # The crew thread is still blocked, so the waiter must not have been admitted
+            stats = executor.stats()
+            assert stats["running"] == 1 and stats["queued"] == 1 and not waiting.done()
+        finally:
+            release.set()
+        assert await asyncio.wait_for(waiting, 2) == "ran"
+        assert executor.stats()["running"] == 0
+        executor.shutdown()
+
+    asyncio.run(scenario())
+    print("✅ Slot released only when the crew thread returned")
+
+
+def main():
+    print("🧪 Crew Executor Test Suite")
+    print("=" * 50)
+    test_admission_and_queue_positions()
+    test_priority_ordering()
+    test_queue_full_rejection()
+    test_cancelled_caller_keeps_slot_until_thread_finishes()
+    print("\n🎉 All crew executor tests passed!")
+
+
+if __name__ == "__main__":
+    main()
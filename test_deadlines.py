@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Test request deadlines flowing into Gemini calls
+"""
+
+import contextvars
+import os
+import threading
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+
+import gemini
+from deadlines import deadline, set_deadline, remaining_time, DeadlineExceededError
+from model_config import ModelPool, ModelConfig, MODEL_POOL
+from priority_scheduler import PriorityGate
+from rate_limiter import RateLimiter
+
+
+class TimedModel:
+    """Stand-in for genai.GenerativeModel that honours the request timeout like the real client"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.timeouts = []
+
+    def generate_content(self, prompt, request_options=None, **kwargs):
+        timeout = (request_options or {}).get("timeout")
+        self.timeouts.append(timeout)
+        if timeout is not None and self.latency > timeout:
+            time.sleep(timeout)
+            raise Exception("504 Deadline Exceeded")
+        time.sleep(self.latency)
+        return f"answer to {prompt}"
+
+
+def timed_pool(gate=None, **models) -> ModelPool:
+    pool = ModelPool(ModelConfig(), limiter=RateLimiter(rpm=100000, path=":memory:"))
+    for name in ModelConfig.FALLBACK_MODELS:
+        handle = pool.get(name)
+        handle._model = models.get(name, TimedModel())
+        if gate is not None:
+            handle._gate = gate
+    return pool
+
+
+def test_remaining_budget_is_the_timeout():
+    """Test 1: Each call's timeout is the remaining budget, capped per call"""
+    print("🧪 TEST 1: Budget becomes the call timeout")
+    model = TimedModel()
+    router = timed_pool(**{"gemini-1.5-flash": model}).router("gemini-1.5-flash")
+
+    router.generate_content("no deadline")
+    assert model.timeouts[-1] == 30
+
+    with deadline(5):
+        with deadline(60):  # An inner, looser deadline cannot extend the outer one
+            assert remaining_time() <= 5
+            router.generate_content("inside deadline")
+    assert 4 < model.timeouts[-1] <= 5
+    assert remaining_time() is None
+    print(f"✅ Call timeout {model.timeouts[-1]:.2f}s taken from the deadline")
+
+
+def test_expired_deadline_fails_fast():
+    """Test 2: Once the budget is gone calls fail at once without blaming the model"""
+    print("🧪 TEST 2: Expired deadline")
+    slow = TimedModel(latency=5)
+    pool = timed_pool(**{"gemini-1.5-flash": slow})
+    router = pool.router("gemini-1.5-flash")
+
+    started = time.monotonic()
+    with deadline(0.3):
+        try:
+            router.generate_content("chest pain")
+            assert False, "expected the deadline to be exceeded"
+        except DeadlineExceededError:
+            pass
+        # The timed-out call used the whole budget, the next one never reaches a model
+        try:
+            router.generate_content("chest pain again")
+            assert False, "expected the deadline to be exceeded"
+        except DeadlineExceededError:
+            pass
+    elapsed = time.monotonic() - started
+    assert elapsed < 1.0
+    # No other model was tried after the budget ran out
+    assert all(not pool.get(name)._model.timeouts for name in ModelConfig.FALLBACK_MODELS[1:])
+    assert len(slow.timeouts) == 1
+    print(f"✅ Gave up after {elapsed:.2f}s instead of {slow.latency}s")
+
+
+def test_gate_wait_is_bounded():
+    """Test 3: Waiting for a busy LLM gate stops at the deadline"""
+    print("🧪 TEST 3: Bounded gate wait")
+    gate = PriorityGate("test", capacity=1)
+    router = timed_pool(gate=gate).router("gemini-1.5-flash")
+    gate.acquire()
+    try:
+        started = time.monotonic()
+        with deadline(0.2):
+            try:
+                router.generate_content("fever")
+                assert False, "expected the deadline to be exceeded"
+            except DeadlineExceededError:
+                pass
+        assert time.monotonic() - started < 0.5
+    finally:
+        gate.release()
+    assert gate.stats()["timeouts"] == 1 and gate.stats()["active"] == 0
+    print("✅ Gate wait cut off at the deadline")
+
+
+def test_deadline_flows_to_worker_threads_and_retries():
+    """Test 4: A conversation deadline reaches threads started from its context and stops tenacity retries"""
+    print("🧪 TEST 4: Propagation and retries")
+    seen = []
+
+    def conversation():
+        set_deadline(2)
+        thread = threading.Thread(target=contextvars.copy_context().run, args=(lambda: seen.append(remaining_time()),))
+        thread.start()
+        thread.join()
+
+    contextvars.copy_context().run(conversation)
+    assert seen[0] is not None and 0 < seen[0] <= 2
+    assert remaining_time() is None
+
+    # With no budget left the safe wrapper returns its fallback instead of backing off for ~30s
+    flash = MODEL_POOL.get(ModelConfig.get_model_name())
+    original = flash._model
+    flash._model = TimedModel()
+    try:
+        started = time.monotonic()
+        with deadline(0):
+            assert gemini.call_gemini_safe("fever", fallback_response="Rest and drink fluids") == "Rest and drink fluids"
+        assert time.monotonic() - started < 1.0
+    finally:
+        flash._model = original
+    print("✅ Deadline propagated and retries stopped")
+
+
+def main():
+    print("🧪 Deadline Test Suite")
+    print("=" * 50)
+    test_remaining_budget_is_the_timeout()
+    test_expired_deadline_fails_fast()
+    test_gate_wait_is_bounded()
+    test_deadline_flows_to_worker_threads_and_retries()
+    print("\n🎉 All deadline tests passed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Test the indexed doctor catalog and its hot reload
+"""
+
+import os
+import random
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+from doctor_catalog import DoctorCatalog, InsurerRegistry, normalize, encode_slot, decode_slot, footprint
+
+HEADER = "name,specialty,location,hospital,cost,insurance,available_slots\n"
+ROWS = [
+    'Dr. A,Cardiologist,Pune,Ruby Hall,1500,"Star Health,ICICI Lombard","Monday 9:00 AM"\n',
+    'Dr. B,General Physician,pune ,Apollo,500,HDFC Ergo,"Tuesday 10:00 AM"\n',
+    'Dr. C,Cardiologist,Mumbai,Lilavati,2000,Star Health,"Friday 2:00 PM"\n',
+    'Dr. D,Dermatologist,Delhi,AIIMS,800,,\n'
+]
+
+
+def write_csv(path: str, rows, mtime: int = None):
+    with open(path, "w") as f:
+        f.write(HEADER + "".join(rows))
+    if mtime is not None:
+        os.utime(path, ns=(mtime, mtime))
+
+
+def test_indexed_lookups():
+    """Test 1: Lookups go through normalized indexes with the four fallback stages"""
+    print("🧪 TEST 1: Indexed lookups")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "doctors.csv")
+        write_csv(path, ROWS)
+        catalog = DoctorCatalog(path)
+
+        doctors, stage = catalog.find("PUNE", "cardiologist ")
+        assert stage == "location_specialty" and list(doctors["name"]) == ["Dr. A"]
+        doctors, stage = catalog.find("Pune", "Neurologist")
+        assert stage == "location" and list(doctors["name"]) == ["Dr. A", "Dr. B"]
+        doctors, stage = catalog.find("Chennai", "Cardiologist")
+        assert stage == "specialty" and list(doctors["name"]) == ["Dr. A", "Dr. C"]
+        doctors, stage = catalog.find("Chennai", "Neurologist")
+        assert stage == "all" and len(doctors) == 4
+
+        snapshot = catalog.current
+        assert snapshot.by_location_specialty[("pune", "general physician")] == (1,)
+        assert normalize(float("nan")) == ""
+        stats = catalog.stats()
+        assert stats["loads"] == 1 and stats["lookups"] == 4 and stats["locations"] == 3
+        assert stats["lookups_by_stage"] == {"location_specialty": 1, "location": 1, "specialty": 1, "all": 1}
+    print("✅ Every stage answered from the indexes after one load")
+
+
+def test_reload_on_change():
+    """Test 2: The CSV is re-read only when its mtime changes, and a broken file keeps the old snapshot"""
+    print("🧪 TEST 2: Hot reload")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "doctors.csv")
+        write_csv(path, ROWS, mtime=1_000_000_000)
+        catalog = DoctorCatalog(path)
+        first = catalog.snapshot()
+        for _ in range(20):
+            catalog.find("Pune", "Cardiologist")
+        assert catalog.snapshot() is first and catalog.stats()["loads"] == 1
+
+        write_csv(path, ROWS + ['Dr. E,Neurologist,Pune,KEM,900,Star Health,"Monday 4:00 PM"\n'],
+                  mtime=2_000_000_000)
+        assert catalog.is_stale()
+        doctors, stage = catalog.find("pune", "neurologist")
+        assert stage == "location_specialty" and list(doctors["name"]) == ["Dr. E"]
+        assert catalog.stats()["loads"] == 2
+
+        # A request holding the old snapshot keeps answering from it
+        assert first.find("pune", "neurologist")[1] == "location"
+
+        with open(path, "wb") as f:
+            f.write(b"\x00not,a\ncsv")
+        os.utime(path, ns=(3_000_000_000, 3_000_000_000))
+        doctors, stage = catalog.find("pune", "neurologist")
+        assert stage == "location_specialty"
+        assert catalog.stats()["load_errors"] == 1
+    print("✅ Reloaded once on change, unchanged file never re-read, bad file ignored")
+
+
+def test_concurrent_reload():
+    """Test 3: Threads hitting a changed file trigger one reload and always see a full snapshot"""
+    print("🧪 TEST 3: Concurrent reload")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "doctors.csv")
+        write_csv(path, ROWS * 250, mtime=1_000_000_000)
+        catalog = DoctorCatalog(path)
+        catalog.snapshot()
+        write_csv(path, ROWS * 500, mtime=2_000_000_000)
+
+        sizes = []
+        barrier = threading.Barrier(8)
+
+        def lookup():
+            barrier.wait()
+            sizes.append(len(catalog.find("Chennai", "Neurologist")[0]))
+
+        threads = [threading.Thread(target=lookup) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert set(sizes) <= {1000, 2000} and catalog.stats()["loads"] == 2
+    print("✅ One reload served every thread")
+
+
+def test_missing_database():
+    """Test 4: A missing CSV yields no snapshot instead of an exception"""
+    print("🧪 TEST 4: Missing database")
+    catalog = DoctorCatalog(os.path.join(tempfile.gettempdir(), "no_such_doctors.csv"))
+    assert catalog.snapshot() is None
+    assert catalog.find("Pune", "Cardiologist") == (None, None)
+    print("✅ Missing database reported cleanly")
+
+
+def test_ranking():
+    """Test 5: Vectorized insurance matching ranks like the old per-row loop and sort"""
+    print("🧪 TEST 5: Insurance ranking")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "doctors.csv")
+        write_csv(path, ROWS)
+        catalog = DoctorCatalog(path)
+
+        ranking = catalog.recommend("Pune", "Neurologist", " hdfc  ERGO")
+        assert ranking.stage == "location" and ranking.matched == 2
+        assert list(ranking.positions) == [1, 0] and list(ranking.accepted) == [True, False]
+        assert ranking.insurance_matched
+        assert catalog.current.insurers(0) == ("star health", "icici lombard")
+
+        ranking = catalog.recommend("Delhi", "Dermatologist", "")
+        assert list(ranking.positions) == [3] and not ranking.insurance_matched
+
+        # Random catalogs rank exactly as the per-row loop followed by a stable sort did
+        rng = random.Random(3)
+        insurers = ["Star Health", "HDFC Ergo", "ICICI Lombard", "Max Bupa"]
+        rows = []
+        for i in range(3000):
+            names = ",".join(rng.sample(insurers, rng.randint(0, 3)))
+            rows.append(f'Dr. {i},Cardiologist,Pune,H,{rng.choice([500, 800, 800, 1500])},"{names}",\n')
+        write_csv(path, rows, mtime=5_000_000_000)
+        frame = pd.read_csv(path)
+        for insurance in insurers + ["Unknown"]:
+            expected = []
+            for position, doctor in frame.iterrows():
+                accepted_by = [ins.strip().lower() for ins in str(doctor["insurance"]).split(",")] \
+                    if pd.notna(doctor["insurance"]) else []
+                expected.append((insurance.lower() in accepted_by, int(doctor["cost"]), position))
+            expected.sort(key=lambda row: (not row[0], row[1]))
+            ranking = catalog.recommend("pune", "cardiologist", insurance)
+            assert list(ranking.positions) == [row[2] for row in expected[:5]], insurance
+            assert list(ranking.accepted) == [row[0] for row in expected[:5]]
+    print("✅ Top 5 by insurance acceptance and cost, same order as before")
+
+
+def test_insurer_bitmasks():
+    """Test 6: Each insurer owns a bit and multi-plan patients match in one pass"""
+    print("🧪 TEST 6: Insurer bitmasks")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "doctors.csv")
+        write_csv(path, ROWS)
+        snapshot = DoctorCatalog(path).snapshot()
+
+        registry = snapshot.registry
+        assert registry.names == ["star health", "icici lombard", "hdfc ergo"]
+        assert snapshot.insurance_bits.dtype == np.uint8
+        assert list(snapshot.insurance_bits) == [0b011, 0b100, 0b001, 0]
+        assert registry.names_for(snapshot.insurance_bits[0]) == snapshot.insurers(0)
+
+        everyone = snapshot.all_positions
+        assert list(snapshot.accepts(everyone, "ICICI Lombard")) == [True, False, False, False]
+        assert list(snapshot.accepts(everyone, "icici lombard, HDFC Ergo")) == [True, True, False, False]
+        assert list(snapshot.accepts(everyone, ["Unknown", "hdfc ergo"])) == [False, True, False, False]
+        assert not snapshot.accepts(everyone, "").any()
+
+        positions, accepted, matched = snapshot.rank(snapshot.by_location["pune"], ["Max Bupa", "Star Health"])
+        assert list(positions) == [0, 1] and list(accepted) == [True, False] and matched
+
+    # Past 64 insurers the masks keep working as Python ints
+    wide = InsurerRegistry(f"Plan {i}" for i in range(70))
+    assert wide.dtype is object and wide.mask("plan 69, plan 0") == (1 << 69) | 1
+    print("✅ Any-of-these-plans queries answered with one AND per doctor")
+
+
+def test_compact_columns():
+    """Test 7: The compact table gives back every value of the real doctor file"""
+    print("🧪 TEST 7: Compact columns")
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "doctor_database.csv")
+    frame = pd.read_csv(path)
+    snapshot = DoctorCatalog(path).snapshot()
+    table = snapshot.table
+    assert table.location.codes.dtype == np.int8 and table.costs.dtype == np.int16
+
+    for position, doctor in frame.iterrows():
+        row = snapshot.row(position)
+        for column in ("name", "specialty", "location", "hospital", "cost"):
+            assert row[column] == doctor[column], (position, column)
+        assert row["insurance"] == tuple(ins.strip().lower() for ins in doctor["insurance"].split(","))
+        assert row["available_slots"].split(",") == [slot.strip() for slot in doctor["available_slots"].split(",")]
+
+    assert [decode_slot(encode_slot(text)) for text in ("Monday 12:00 AM", "Sunday 12:30 PM", "Friday 9:05 PM")] == \
+        ["Monday 12:00 AM", "Sunday 12:30 PM", "Friday 9:05 PM"]
+    assert encode_slot("monday 09:00 AM") is None
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        odd = os.path.join(tmp_dir, "doctors.csv")
+        write_csv(odd, ['Dr. O,Cardiologist,Pune,H,100,,"monday 09:00 AM, Tuesday 9:00 AM"\n'] + ROWS)
+        snapshot = DoctorCatalog(odd).snapshot()
+        # Schedules in other formats are kept verbatim; missing ones come back empty
+        assert snapshot.row(0)["available_slots"] == "monday 09:00 AM, Tuesday 9:00 AM"
+        assert snapshot.row(4)["available_slots"] == "" and snapshot.row(4)["insurance"] == ()
+        assert len(snapshot.table.slots.slots(1)) == 1
+
+    report = footprint(path, scale=20)
+    assert report["rows"] == 20 * len(frame)
+    assert report["compact_bytes"] + report["index_bytes"] < report["pandas_object_bytes"] / 4
+    print(f"✅ {len(frame)} doctors round-tripped, {report['pandas_object_bytes'] // 1024} KiB of object columns "
+          f"held in {(report['compact_bytes'] + report['index_bytes']) // 1024} KiB")
+
+
+def main():
+    print("🧪 Doctor Catalog Test Suite")
+    print("=" * 50)
+    test_indexed_lookups()
+    test_reload_on_change()
+    test_concurrent_reload()
+    test_missing_database()
+    test_ranking()
+    test_insurer_bitmasks()
+    test_compact_columns()
+    print("\n🎉 All doctor catalog tests passed!")
+
+
+if __name__ == "__main__":
+    main()
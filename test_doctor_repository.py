@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Test the CSV and SQLite doctor repositories
+"""
+
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+
+from doctor_catalog import DoctorCatalog
+from doctor_repository import (
+    CSVDoctorRepository, SQLiteDoctorRepository, create_doctor_repository, import_csv
+)
+
+HEADER = "name,specialty,location,hospital,cost,insurance,available_slots\n"
+LOCATIONS = ["Pune", "Mumbai", "Delhi", "Bangalore"]
+SPECIALTIES = ["Cardiologist", "General Physician", "Dermatologist", "Neurologist"]
+INSURERS = ["Star Health", "HDFC Ergo", "ICICI Lombard", "Max Bupa"]
+
+
+def write_random_csv(path: str, rows: int, seed: int):
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        f.write(HEADER)
+        for i in range(rows):
+            names = ",".join(rng.sample(INSURERS, rng.randint(0, 3)))
+            # Delhi has no neurologists so the location stage gets exercised
+            specialty = rng.choice(SPECIALTIES[:3] if i % 2 else SPECIALTIES)
+            location = "Delhi" if specialty != "Neurologist" and rng.random() < 0.2 else rng.choice(LOCATIONS[:2] + ["Bangalore"])
+            f.write(f'Dr. {i},{specialty},{location},H{i % 7},{rng.choice([500, 800, 1200, 1500])},'
+                    f'"{names}","Monday 9:00 AM,Tuesday {rng.randint(1, 5)}:00 PM"\n')
+
+
+def test_sqlite_matches_csv():
+    """Test 1: Both repositories give the same doctors, order and acceptance for every stage"""
+    print("🧪 TEST 1: SQLite matches the CSV catalog")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, "doctors.csv")
+        db_path = os.path.join(tmp_dir, "doctors.db")
+        write_random_csv(csv_path, 2000, seed=11)
+        assert import_csv(csv_path, db_path, chunk_rows=300) == 2000
+
+        csv_repository = CSVDoctorRepository(DoctorCatalog(csv_path))
+        sqlite_repository = SQLiteDoctorRepository(db_path)
+        stages = set()
+        for location in LOCATIONS + ["chennai"]:
+            for specialty in SPECIALTIES + ["Psychiatrist"]:
+                for insurance in ["", "star health", "Max Bupa, HDFC Ergo", ["icici lombard"], "Unknown"]:
+                    expected = csv_repository.recommend(location, specialty, insurance)
+                    actual = sqlite_repository.recommend(location.upper(), specialty, insurance)
+                    assert actual == expected, (location, specialty, insurance)
+                    stages.add(actual.stage)
+        assert stages == {"location_specialty", "location", "specialty", "all"}
+        assert sqlite_repository.stats()["doctors"] == 2000
+    print(f"✅ {sqlite_repository.stats()['lookups']} lookups identical across repositories")
+
+
+def test_queries_use_indexes():
+    """Test 2: Every stage's queries are answered from an index rather than a table scan"""
+    print("🧪 TEST 2: Indexed queries")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, "doctors.csv")
+        db_path = os.path.join(tmp_dir, "doctors.db")
+        write_random_csv(csv_path, 500, seed=3)
+        import_csv(csv_path, db_path)
+
+        conn = sqlite3.connect(db_path)
+        plans = {
+            "SELECT count(*) FROM doctors WHERE location_key = 'pune' AND specialty_key = 'cardiologist'": "idx_doctors_location_specialty",
+            "SELECT id FROM doctors WHERE location_key = 'pune' ORDER BY cost, id LIMIT 5": "idx_doctors_location",
+            "SELECT id FROM doctors WHERE specialty_key = 'cardiologist' ORDER BY cost, id LIMIT 5": "idx_doctors_specialty",
+            "SELECT id FROM doctors ORDER BY cost, id LIMIT 5": "idx_doctors_cost",
+        }
+        for query, index in plans.items():
+            plan = " ".join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}"))
+            assert index in plan and "TEMP B-TREE" not in plan, plan
+        conn.close()
+    print("✅ Counts and top-5 queries walk the (cost, id) indexes")
+
+
+def test_reimport_is_picked_up():
+    """Test 3: Re-importing swaps the database under a running repository"""
+    print("🧪 TEST 3: Re-import")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, "doctors.csv")
+        db_path = os.path.join(tmp_dir, "doctors.db")
+        write_random_csv(csv_path, 100, seed=1)
+        import_csv(csv_path, db_path)
+        repository = SQLiteDoctorRepository(db_path)
+        assert repository.recommend("Pune", "Cardiologist", "").matched > 0
+        assert repository.stats()["doctors"] == 100
+
+        write_random_csv(csv_path, 300, seed=2)
+        import_csv(csv_path, db_path)
+        result = asyncio.run(repository.recommend_async("Pune", "Cardiologist", "Star Health"))
+        assert len(result.doctors) == 5
+        assert repository.stats()["doctors"] == 300 and repository.stats()["opens"] == 2
+        assert [name for name in os.listdir(tmp_dir) if name.startswith(".doctors-")] == []
+    print("✅ Running repository reopened the new database")
+
+
+def test_missing_and_factory():
+    """Test 4: Missing databases report None and DOCTOR_REPOSITORY picks the implementation"""
+    print("🧪 TEST 4: Missing database and factory")
+    missing = SQLiteDoctorRepository(os.path.join(tempfile.gettempdir(), "no_such_doctors.db"))
+    assert not missing.available() and missing.recommend("Pune", "Cardiologist", "") is None
+    assert isinstance(create_doctor_repository("sqlite"), SQLiteDoctorRepository)
+    assert isinstance(create_doctor_repository("csv"), CSVDoctorRepository)
+    assert isinstance(create_doctor_repository("bogus"), CSVDoctorRepository)
+    print("✅ Missing database handled, factory honours DOCTOR_REPOSITORY")
+
+
+def test_formatting_parity():
+    """Test 5: Spaced separators, repeated insurers and odd schedules come back identical from both repositories"""
+    print("🧪 TEST 5: Formatting parity")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, "doctors.csv")
+        db_path = os.path.join(tmp_dir, "doctors.db")
+        with open(csv_path, "w") as f:
+            f.write(HEADER)
+            f.write('Dr. A,Cardiologist,Pune,H1,500,"Star Health, HDFC Ergo, star health","Monday 9:00 AM, Tuesday 1:00 PM"\n')
+            f.write('Dr. B,Cardiologist,Pune,H2,800,"HDFC Ergo ,Max Bupa","monday 09:00 AM, Tuesday 9:00 AM"\n')
+            f.write('Dr. C,Cardiologist,Pune,H3,900,,\n')
+        import_csv(csv_path, db_path)
+
+        csv_repository = CSVDoctorRepository(DoctorCatalog(csv_path))
+        sqlite_repository = SQLiteDoctorRepository(db_path)
+        for insurance in ["", "Star Health", "max bupa, hdfc ergo"]:
+            expected = csv_repository.recommend("Pune", "Cardiologist", insurance)
+            assert sqlite_repository.recommend("Pune", "Cardiologist", insurance) == expected, insurance
+
+        doctors = expected.doctors
+        assert doctors[0]["insurance"] == ("star health", "hdfc ergo")
+        assert doctors[0]["available_slots"] == "Monday 9:00 AM,Tuesday 1:00 PM"
+        # A schedule in another format is served as written, a missing one as empty text
+        assert doctors[1]["available_slots"] == "monday 09:00 AM, Tuesday 9:00 AM"
+        assert doctors[2]["available_slots"] == "" and doctors[2]["insurance"] == ()
+    print("✅ Both repositories return the same slots and distinct insurers")
+
+
+def main():
+    print("🧪 Doctor Repository Test Suite")
+    print("=" * 50)
+    test_sqlite_matches_csv()
+    test_queries_use_indexes()
+    test_reimport_is_picked_up()
+    test_missing_and_factory()
+    test_formatting_parity()
+    print("\n🎉 All doctor repository tests passed!")
+
+
+if __name__ == "__main__":
+    main()
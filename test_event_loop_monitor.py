@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test the event loop lag monitor and blocking-call detector
+"""
+
+import asyncio
+import time
+
+from event_loop_monitor import EventLoopMonitor
+
+
+async def blocking_handler():
+    """Simulates a sync call hidden inside an async endpoint"""
+    time.sleep(0.4)
+
+
+async def polite_handler():
+    await asyncio.sleep(0.4)
+
+
+def test_stall_is_attributed():
+    """Test 1: A blocking call is recorded with its coroutine, endpoint and stack"""
+    print("🧪 TEST 1: Blocking call detection")
+
+    async def scenario():
+        monitor = EventLoopMonitor(interval=0.02, stall_threshold=0.1)
+        await monitor.start()
+        await asyncio.sleep(0.1)
+
+        async def serve():
+            with monitor.track("POST /book-appointment"):
+                await blocking_handler()
+
+        await asyncio.ensure_future(serve())
+        await asyncio.sleep(0.1)
+        stats = monitor.stats()
+        await monitor.stop()
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert stats["total_stalls"] == 1
+    stall = stats["recent_stalls"][0]
+    assert stall["endpoint"] == "POST /book-appointment"
+    assert "serve" in stall["coroutine"]
+    assert any("time.sleep(0.4)" in line for line in stall["stack"])
+    assert stall["duration_ms"] >= 300
+    assert stats["lag_ms"]["max"] >= 300
+    print(f"✅ Stall of {stall['duration_ms']:.0f}ms attributed to {stall['endpoint']}")
+
+
+def test_awaiting_does_not_stall():
+    """Test 2: Awaiting without blocking leaves the loop responsive"""
+    print("🧪 TEST 2: Non-blocking handler")
+
+    async def scenario():
+        monitor = EventLoopMonitor(interval=0.02, stall_threshold=0.1)
+        await monitor.start()
+        await polite_handler()
+        stats = monitor.stats()
+        await monitor.stop()
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert stats["total_stalls"] == 0
+    assert stats["lag_ms"]["p99"] < 100
+    print("✅ No stalls recorded")
+
+
+def main():
+    print("🧪 Event Loop Monitor Test Suite")
+    print("=" * 50)
+    test_stall_is_attributed()
+    test_awaiting_does_not_stall()
+    print("\n🎉 All event loop monitor tests passed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Test the LRU + TTL cache for deterministic LLM lookups
+"""
+
+import os
+import tempfile
+import time
+
+from llm_cache import LLMResponseCache
+from model_config import ModelPool, ModelConfig
+
+
+class CountingModel:
+    """Stand-in for genai.GenerativeModel that counts calls"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        return type("Response", (), {"text": '{"ambulance": "108"}'})()
+
+
+def test_normalized_keys_and_counters():
+    """Test 1: Trivially different inputs share an entry and hits/misses are counted"""
+    print("🧪 TEST 1: Normalized keys")
+    cache = LLMResponseCache(max_entries=10, path="")
+    assert cache.get("emergency_contacts", "Pune") is None
+    cache.set("emergency_contacts", "Pune", "108")
+    assert cache.get("emergency_contacts", "  pune. ") == "108"
+    cache.set("specialty_mapping", {"symptoms": "Fever,  headache", "severity": "Low"}, "General Physician")
+    assert cache.get("specialty_mapping", {"severity": "low", "symptoms": "fever, headache"}) == "General Physician"
+
+    stats = cache.stats()["families"]
+    assert stats["emergency_contacts"] == {"hits": 1, "misses": 1, "hit_rate": 0.5, "ttl_seconds": 7 * 24 * 3600}
+    print("✅ Normalized keys hit the same entry")
+
+
+def test_ttl_and_lru_eviction():
+    """Test 2: Entries expire per family TTL and the least recently used entry is evicted"""
+    print("🧪 TEST 2: TTL and LRU eviction")
+    cache = LLMResponseCache(max_entries=2, path="", family_ttls={"monitoring_instructions": 0.05})
+    cache.set("monitoring_instructions", "stroke", "Check breathing")
+    time.sleep(0.1)
+    assert cache.get("monitoring_instructions", "stroke") is None
+
+    cache.set("emergency_contacts", "Pune", "108")
+    cache.set("emergency_contacts", "Mumbai", "108")
+    cache.get("emergency_contacts", "Pune")  # Mumbai is now the least recently used
+    cache.set("emergency_contacts", "London", "999")
+    assert cache.get("emergency_contacts", "Mumbai") is None
+    assert cache.get("emergency_contacts", "Pune") == "108"
+    assert cache.stats()["evictions"] == 1
+    print("✅ Expired and least recently used entries dropped")
+
+
+def test_persistence_across_restarts():
+    """Test 3: Entries written to disk are reloaded by a new cache"""
+    print("🧪 TEST 3: On-disk persistence")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "llm_cache.json")
+        cache = LLMResponseCache(path=path)
+        cache.set("emergency_contacts", "Nashik", "108")
+        cache.flush()
+        assert LLMResponseCache(path=path).get("emergency_contacts", "nashik") == "108"
+    print("✅ Cache survived a restart")
+
+
+def test_router_uses_cache():
+    """Test 4: Cached prompt families skip the Gemini round trip"""
+    print("🧪 TEST 4: Cache in the model access path")
+    pool = ModelPool(ModelConfig())
+    pool.cache = LLMResponseCache(path="")
+    model = CountingModel()
+    pool.get(ModelConfig.get_model_name())._model = model
+    router = pool.router()
+
+    first = router.generate_content("contacts for Pune", cache_family="emergency_contacts", cache_key="Pune")
+    second = router.generate_content("contacts for pune", cache_family="emergency_contacts", cache_key="pune")
+    router.generate_content("uncached prompt")
+    assert first.text == second.text
+    assert getattr(second, "cached", False)
+    assert model.calls == 2
+    print("✅ Second lookup answered from the cache")
+
+
+def test_writes_are_batched_in_the_background():
+    """Test 5: Inserts never write the file themselves; a burst is saved once by the background thread"""
+    print("🧪 TEST 5: Write-behind persistence")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "llm_cache.json")
+        cache = LLMResponseCache(path=path, flush_interval=0.2)
+        saves = []
+        original_save = cache._save
+        cache._save = lambda snapshot: (original_save(snapshot), saves.append(len(snapshot)))
+
+        for city in ["Pune", "Mumbai", "Nashik", "Nagpur"]:
+            cache.set("emergency_contacts", city, "108")
+        assert saves == [] and not os.path.exists(path)
+
+        deadline = time.monotonic() + 5
+        while not saves and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert saves == [4]
+        assert LLMResponseCache(path=path).get("emergency_contacts", "nagpur") == "108"
+    print("✅ Four inserts saved in one background write")
+
+
+def main():
+    print("🧪 LLM Cache Test Suite")
+    print("=" * 50)
+    test_normalized_keys_and_counters()
+    test_ttl_and_lru_eviction()
+    test_persistence_across_restarts()
+    test_router_uses_cache()
+    test_writes_are_batched_in_the_background()
+    print("\n🎉 All LLM cache tests passed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Test recording and replaying LLM traffic with cassettes
+"""
+
+import asyncio
+import contextvars
+import os
+import tempfile
+import time
+
+from llm_cassette import Cassette, scrub, bench, compare, cassette_stats
+from model_config import ModelPool, ModelConfig
+from priority_scheduler import ConversationPriority, EMERGENCY, set_current_priority
+from rate_limiter import RateLimiter
+
+PROMPT = """
+You are an emergency medical AI.
+PATIENT INFORMATION:
+{"name": "%s", "contact": "+91 98765 43210", "location": "Pune", "symptoms": "chest pain"}
+Respond with ONLY a JSON object: {"is_emergency": true/false}
+"""
+
+SCRIPT_PROMPT = """
+Write what the AI doctor says first.
+Patient: %s
+Symptoms: chest pain
+Start with "Hello %s, I am here with you." and address %s by first name.
+"""
+
+
+class LiveModel:
+    """Stand-in for the real Gemini model being recorded"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        if "fail" in prompt:
+            raise Exception("503 The model is overloaded")
+        name = "Asha" if "Asha" in prompt else "there"
+        return type("Response", (), {"text": f'{{"is_emergency": true, "greeting": "Hello {name}"}}'})()
+
+    async def generate_content_async(self, prompt, **kwargs):
+        return self.generate_content(prompt, **kwargs)
+
+
+def recording_pool(cassette: Cassette, model: LiveModel) -> ModelPool:
+    pool = ModelPool(ModelConfig(), limiter=RateLimiter(rpm=10 ** 6, path=":memory:"))
+    for name in ModelConfig.FALLBACK_MODELS:
+        pool.get(name)._model = cassette.wrap(model, name)
+    return pool
+
+
+def test_scrubbing():
+    """Test 1: Patient identifiers are removed from prompts and from the answers that echo them"""
+    print("🧪 TEST 1: PII scrubbing")
+    scrubbed, values = scrub(PROMPT % "Asha Patel" + "- Name: Asha Patel\nEmail asha@example.com on 2025-03-01T10:30")
+    for secret in ("Asha", "98765", "Pune", "example.com", "2025-03-01"):
+        assert secret not in scrubbed, secret
+    assert '"symptoms": "chest pain"' in scrubbed
+    assert "Asha Patel" in values
+
+    # The same prompt for another patient maps to the same cassette entry
+    assert scrub(PROMPT % "Ravi Kumar")[0] == scrub(PROMPT % "Asha Patel")[0]
+    print("✅ Names, contacts, locations, emails and dates scrubbed")
+
+
+def test_record_and_replay():
+    """Test 2: Recorded calls replay with their answers, errors and compressed latencies"""
+    print("🧪 TEST 2: Record and replay")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "cassette.jsonl.gz")
+        recorder = Cassette(path, mode="record", flush_every=1)
+        router = recording_pool(recorder, LiveModel(latency=0.2)).router("gemini-1.5-flash")
+
+        def emergency_conversation():
+            set_current_priority(ConversationPriority("recorded", EMERGENCY))
+            return router.generate_content(PROMPT % "Asha Patel")
+
+        assert "Hello Asha" in contextvars.copy_context().run(emergency_conversation).text
+        try:
+            router.generate_content("please fail")
+        except Exception:
+            pass
+
+        entries = recorder.entries()
+        assert entries[0]["response"] == '{"is_emergency": true, "greeting": "Hello <redacted>"}'
+        assert entries[0]["level"] == EMERGENCY and entries[0]["family"] == "emergency_check"
+        assert entries[0]["latency_ms"] >= 200
+        assert any(entry["error"] for entry in entries)
+
+        player = Cassette(path, mode="replay", speed=0.25)
+        pool = ModelPool(ModelConfig(), limiter=RateLimiter(rpm=10 ** 6, path=":memory:"))
+        for name in ModelConfig.FALLBACK_MODELS:
+            pool.get(name)._model = player.replay_model(name)
+        replay = pool.router("gemini-1.5-flash")
+
+        started = time.monotonic()
+        # Another patient's identical intake replays the recorded answer, four times faster
+        assert replay.generate_content(PROMPT % "Ravi Kumar").text == entries[0]["response"]
+        assert 0.04 <= time.monotonic() - started < 0.15
+        # A prompt that was never recorded still gets an answer
+        assert replay.generate_content("Respond with ONLY the emergency type name").text == "General Medical Emergency"
+        stats = player.stats()
+        assert stats["replayed"] == 1 and stats["misses"] == 1
+    print("✅ Answers replayed at compressed timing, unknown prompts fell back")
+
+
+def test_recorded_errors_replay():
+    """Test 3: A call that failed while recording fails the same way on replay"""
+    print("🧪 TEST 3: Replayed errors")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "cassette.jsonl.gz")
+        recorder = Cassette(path, mode="record", flush_every=1)
+        model = recorder.wrap(LiveModel(), "gemini-1.5-flash")
+        try:
+            model.generate_content("please fail")
+        except Exception:
+            pass
+
+        replay = Cassette(path, mode="replay", speed=0).replay_model("gemini-1.5-flash")
+        try:
+            asyncio.run(replay.generate_content_async("please  fail"))
+            assert False, "expected the recorded error"
+        except Exception as e:
+            assert "503" in str(e)
+    print("✅ Recorded overload replayed")
+
+
+def test_bench_and_compare():
+    """Test 4: A cassette replays through the model layer and reports p50/p99 per family"""
+    print("🧪 TEST 4: Bench and compare")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "cassette.jsonl.gz")
+        recorder = Cassette(path, mode="record")
+        model = recorder.wrap(LiveModel(latency=0.05), "gemini-1.5-flash")
+        for i in range(10):
+            model.generate_content(PROMPT % f"Patient {i}")
+            model.generate_content(f"free text question {i}")
+        recorder.flush()
+
+        recorded = cassette_stats(path)
+        assert recorded["families"]["emergency_check"]["count"] == 10
+        assert recorded["families"]["text"]["p50_ms"] >= 50
+
+        def fresh_pool():
+            return ModelPool(ModelConfig(), limiter=RateLimiter(rpm=10 ** 6, path=":memory:"))
+
+        before = bench(path, speed=0.2, pool=fresh_pool())
+        after = bench(path, speed=0.1, pool=fresh_pool())
+        assert before["overall"]["count"] == 20 and before["overall"]["errors"] == 0
+        assert before["replay"]["misses"] == 0
+        assert 5 <= before["families"]["text"]["p50_ms"] < 50
+
+        change = compare(before, after)
+        assert change["overall"]["p50_ms_change_pct"] < 0
+    print("✅ Replayed through the pool and compared two runs")
+
+
+def test_free_text_names():
+    """Test 5: A name that appears in free text is scrubbed from the prompt and left out of the replay key"""
+    print("🧪 TEST 5: Free-text names")
+    scrubbed, values = scrub(SCRIPT_PROMPT % ("Asha Patil", "Asha Patil", "Asha"))
+    assert "Asha" not in scrubbed and "Patil" not in scrubbed, scrubbed
+    assert "Patient: <redacted>" in scrubbed and "Symptoms: chest pain" in scrubbed
+    assert values == {"Asha Patil"}
+    assert scrub(SCRIPT_PROMPT % ("Ravi Kumar", "Ravi Kumar", "Ravi"))[0] == scrubbed
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "cassette.jsonl.gz")
+        recorder = Cassette(path, mode="record", flush_every=1)
+        recorder.wrap(LiveModel(), "gemini-1.5-flash").generate_content(SCRIPT_PROMPT % ("Asha Patil", "Asha Patil", "Asha"))
+        entry = recorder.entries()[0]
+        assert "Asha" not in entry["prompt"] and "Asha" not in entry["response"]
+
+        # Another patient's identical script request replays the recorded answer
+        replay = Cassette(path, mode="replay", speed=0).replay_model("gemini-1.5-flash")
+        assert replay.generate_content(SCRIPT_PROMPT % ("Ravi Kumar", "Ravi Kumar", "Ravi")).text == entry["response"]
+    print("✅ Greeting names scrubbed and the recording matched another patient")
+
+
+def main():
+    print("🧪 LLM Cassette Test Suite")
+    print("=" * 50)
+    test_scrubbing()
+    test_record_and_replay()
+    test_recorded_errors_replay()
+    test_bench_and_compare()
+    test_free_text_names()
+    print("\n🎉 All LLM cassette tests passed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Test the cached, health-tracked model pool, its circuit breakers, hedged requests and coalescing
+"""
+
+import threading
+import time
+
+from model_config import (
+    ModelPool, ModelConfig, CircuitBreaker, ModelUnavailableError, RequestHedger,
+    get_gemini_model, get_model_with_retry
+)
+from rate_limiter import RateLimiter
+
+
+class ScriptedModel:
+    """Stand-in for genai.GenerativeModel that fails or sleeps on demand"""
+
+    def __init__(self, error: str = None, latency: float = 0.0, label: str = None):
+        self.error = error
+        self.latency = latency
+        self.label = label
+
+    def generate_content(self, prompt, **kwargs):
+        time.sleep(self.latency)
+        if self.error:
+            raise Exception(self.error)
+        if self.label:
+            return f"{self.label} answer to {prompt}"
+        return f"answer to {prompt}"
+
+
+def scripted_pool(**models) -> ModelPool:
+    pool = ModelPool(ModelConfig(), overload_cooldown=60, limiter=RateLimiter(rpm=100000, path=":memory:"))
+    for name, model in models.items():
+        pool.get(name)._model = model
+    return pool
+
+
+def test_handles_are_cached():
+    """Test 1: The same handle is returned instead of building a new model per call"""
+    print("🧪 TEST 1: Cached handles")
+    assert get_gemini_model() is get_gemini_model()
+    assert get_model_with_retry().model_name == get_gemini_model().name
+    pool = ModelPool(ModelConfig())
+    assert pool.get("gemini-1.5-pro") is pool.get("gemini-1.5-pro")
+    print("✅ Handles reused")
+
+
+def test_overloaded_model_is_skipped():
+    """Test 2: A model that just returned 503 drops behind the healthy fallbacks"""
+    print("🧪 TEST 2: Overloaded model skipped")
+    pool = scripted_pool(**{
+        "gemini-1.5-flash": ScriptedModel(error="503 The model is overloaded"),
+        "gemini-1.5-pro": ScriptedModel(),
+        "gemini-1.0-pro": ScriptedModel(),
+        "gemini-2.0-flash": ScriptedModel()
+    })
+    flash = pool.get("gemini-1.5-flash")
+    assert pool.select() is flash
+
+    try:
+        flash.generate_content("hello")
+        assert False, "overload should propagate"
+    except Exception as e:
+        assert "overloaded" in str(e)
+
+    ranked = [handle.name for handle in pool.ranked()]
+    assert ranked[0] == "gemini-1.5-pro"
+    assert ranked[-1] == "gemini-1.5-flash"
+    stats = pool.stats()["models"]["gemini-1.5-flash"]
+    assert stats["recent_error_rate"] == 1.0 and stats["last_overload_at"] and not stats["healthy"]
+    print("✅ Fallback chosen while the configured model is overloaded")
+
+
+def test_fallbacks_ordered_by_latency():
+    """Test 3: Among healthy fallbacks the faster model is preferred"""
+    print("🧪 TEST 3: Fallbacks ordered by latency")
+    pool = scripted_pool(**{
+        "gemini-1.5-flash": ScriptedModel(error="503 unavailable"),
+        "gemini-1.5-pro": ScriptedModel(latency=0.05),
+        "gemini-1.0-pro": ScriptedModel(latency=0.0)
+    })
+    for name in ["gemini-1.5-pro", "gemini-1.0-pro"]:
+        pool.get(name).generate_content("warm up")
+    try:
+        pool.get("gemini-1.5-flash").generate_content("hello")
+    except Exception:
+        pass
+
+    ranked = [handle.name for handle in pool.ranked()]
+    assert ranked.index("gemini-1.0-pro") < ranked.index("gemini-1.5-pro")
+    assert pool.get("gemini-1.5-pro").stats()["latency_ewma_ms"] >= 50
+    print("✅ Faster fallback ranked first")
+
+
+def test_breaker_opens_and_routes_around():
+    """Test 4: Consecutive failures open the breaker and calls route to a fallback"""
+    print("🧪 TEST 4: Circuit breaker routing")
+    overloaded = ScriptedModel(error="503 The model is overloaded")
+    pool = scripted_pool(**{
+        "gemini-1.5-flash": overloaded,
+        "gemini-1.5-pro": ScriptedModel(),
+        "gemini-1.0-pro": ScriptedModel(),
+        "gemini-2.0-flash": ScriptedModel()
+    })
+    flash = pool.get("gemini-1.5-flash")
+    flash.breaker = CircuitBreaker(failure_threshold=2, open_seconds=0.2)
+    router = pool.router()
+
+    # The call fails over to a healthy model; a second failure opens the breaker
+    assert router.generate_content("a") == "answer to a"
+    try:
+        flash.generate_content("b")
+    except Exception:
+        pass
+    assert flash.breaker.state == CircuitBreaker.OPEN
+    assert pool.stats()["models"]["gemini-1.5-flash"]["breaker"]["state"] == "open"
+
+    # With every other model failing too, the open model is still never called
+    fallbacks = [pool.get(name)._model for name in ["gemini-1.5-pro", "gemini-1.0-pro", "gemini-2.0-flash"]]
+    for model in fallbacks:
+        model.error = "429 quota exceeded"
+    calls_before = flash.calls
+    try:
+        router.generate_content("c")
+        assert False, "expected ModelUnavailableError"
+    except ModelUnavailableError:
+        pass
+    assert flash.calls == calls_before
+
+    # After the open period one probe is let through; success closes the breaker
+    time.sleep(0.25)
+    overloaded.error = None
+    assert flash.breaker.allow_request()
+    assert not flash.breaker.allow_request()
+    flash.breaker.record_success(0.01)
+    assert flash.breaker.state == CircuitBreaker.CLOSED
+    print("✅ Breaker opened, skipped, probed and closed")
+
+
+def test_latency_breach_and_all_open():
+    """Test 5: Slow calls count against the breaker, and no available model raises"""
+    print("🧪 TEST 5: Latency breach and exhausted pool")
+    breaker = CircuitBreaker(failure_threshold=2, latency_threshold=0.05, open_seconds=60)
+    breaker.record_success(0.1)
+    breaker.record_success(0.1)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    pool = scripted_pool(**{name: ScriptedModel(error="503 unavailable") for name in ModelConfig.FALLBACK_MODELS})
+    try:
+        pool.router().generate_content("hello")
+        assert False, "expected ModelUnavailableError"
+    except ModelUnavailableError:
+        pass
+    print("✅ Slow calls open the breaker and an exhausted pool is reported")
+
+
+def test_hedged_request_takes_faster_model():
+    """Test 6: A slow primary is hedged and the fallback's answer wins"""
+    print("🧪 TEST 6: Hedged requests")
+    pool = scripted_pool(**{
+        "gemini-1.5-flash": ScriptedModel(latency=0.5, label="primary"),
+        "gemini-1.5-pro": ScriptedModel(latency=0.02, label="hedge")
+    })
+    pool.hedger = RequestHedger(min_delay=0.05, default_delay=0.1)
+    router = pool.router(hedge=True)
+
+    started = time.monotonic()
+    assert router.generate_content("chest pain") == "hedge answer to chest pain"
+    assert time.monotonic() - started < 0.4
+
+    # A fast primary answers before the deadline and is never hedged
+    pool.get("gemini-1.5-flash")._model.latency = 0.0
+    assert router.generate_content("fever") == "primary answer to fever"
+
+    stats = pool.stats()["hedging"]
+    assert stats["calls"] == 2 and stats["hedged"] == 1 and stats["hedge_wins"] == 1
+    assert stats["hedge_rate"] == 0.5 and stats["hedge_win_rate"] == 1.0
+    print("✅ Slow primary hedged, fast primary left alone")
+
+
+def test_identical_prompts_are_coalesced():
+    """Test 7: Concurrent identical prompts share one Gemini call, errors reach every waiter"""
+    print("🧪 TEST 7: Single-flight coalescing")
+    model = ScriptedModel(latency=0.3)
+    calls = []
+    original = model.generate_content
+    model.generate_content = lambda prompt, **kwargs: calls.append(prompt) or original(prompt)
+    pool = scripted_pool(**{"gemini-1.5-flash": model})
+    router = pool.router("gemini-1.5-flash")
+
+    def run_concurrently(prompt, count=5):
+        results = []
+
+        def worker():
+            try:
+                results.append(router.generate_content(prompt))
+            except Exception as e:
+                results.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.01)
+        for thread in threads:
+            thread.join()
+        return results
+
+    assert run_concurrently("fever") == ["answer to fever"] * 5
+    assert calls == ["fever"]
+
+    # Different prompts are not merged
+    router.generate_content("cough")
+    assert calls == ["fever", "cough"]
+
+    model.error = "400 Invalid argument"
+    failures = run_concurrently("rash")
+    assert all(isinstance(result, Exception) and "Invalid argument" in str(result) for result in failures)
+    assert calls == ["fever", "cough", "rash"]
+
+    stats = pool.stats()["single_flight"]
+    assert stats["calls_made"] == 3 and stats["calls_coalesced"] == 8 and stats["in_flight"] == 0
+    print(f"✅ {stats['calls_coalesced']} duplicate calls coalesced")
+
+
+def main():
+    print("🧪 Model Pool Test Suite")
+    print("=" * 50)
+    test_handles_are_cached()
+    test_overloaded_model_is_skipped()
+    test_fallbacks_ordered_by_latency()
+    test_breaker_opens_and_routes_around()
+    test_latency_breach_and_all_open()
+    test_hedged_request_takes_faster_model()
+    test_identical_prompts_are_coalesced()
+    print("\n🎉 All model pool tests passed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Test the deterministic offline LLM backend
+"""
+
+import asyncio
+import json
+import os
+import time
+
+from model_config import ModelPool, ModelConfig
+from offline_model import OfflineGenerativeModel, OFFLINE_MODEL, prompt_family
+from rate_limiter import RateLimiter
+
+SEVERITY_PROMPT = """
+Your job is to analyze it and respond ONLY with a JSON object like:
+{{"severity": "Low | Medium | High", "urgency": "Routine | Soon | Urgent", "reasoning": "..."}}
+Patient Info:
+- Symptoms: crushing chest pain spreading to the left arm
+- Duration: 20 minutes
+"""
+
+SPECIALTY_PROMPT = """
+Based on the patient's symptoms, determine the most appropriate medical specialty.
+Symptoms: stomach ache after meals
+Severity: Medium
+- Heart/chest pain, cardiovascular issues → Cardiologist
+Return only the specialty name, nothing else.
+"""
+
+EMERGENCY_PROMPT = """
+PATIENT INFORMATION:
+{"name": "Asha", "symptoms": "mild cold and runny nose"}
+CRITICAL EMERGENCY CRITERIA: heart attack, stroke, severe bleeding
+Respond with ONLY a JSON object: {"is_emergency": true/false, "ai_virtual_doctor_needed": true/false}
+"""
+
+SCRIPT_PROMPT = """
+PATIENT DATA: {"name": "Asha", "symptoms": "chest pain"}
+Respond with ONLY this JSON format (no extra text):
+{"opening_greeting": "...", "comforting_statements": ["..."]}
+"""
+
+
+def test_prompt_families():
+    """Test 1: Each prompt family gets a schema-valid answer templated from the patient data"""
+    print("🧪 TEST 1: Prompt families")
+    model = OfflineGenerativeModel()
+
+    severity = json.loads(model.generate_content(SEVERITY_PROMPT).text)
+    assert severity["severity"] == "High" and severity["urgency"] == "Urgent"
+    # The specialty list in the instructions does not leak into the answer
+    assert model.generate_content(SPECIALTY_PROMPT).text == "Gastroenterologist"
+
+    emergency = json.loads(model.generate_content(EMERGENCY_PROMPT).text)
+    assert emergency["is_emergency"] is False and emergency["ai_virtual_doctor_needed"] is False
+
+    script = json.loads(model.generate_content(SCRIPT_PROMPT).text)
+    assert script["opening_greeting"].startswith("Hello Asha")
+    assert isinstance(script["comforting_statements"], list)
+
+    assert prompt_family("Write a reminder for the appointment")[0] == "text"
+    response = model.generate_content("hello")
+    assert response.usage_metadata.total_token_count > 0
+    assert model.stats()["calls_by_family"] == {"severity": 1, "specialty": 1, "emergency_check": 1,
+                                                "conversation_script": 1, "text": 1}
+    print("✅ Severity, specialty, emergency and script answers are valid")
+
+
+def test_selected_through_model_config():
+    """Test 2: GEMINI_MODEL=offline routes every model key to the offline backend"""
+    print("🧪 TEST 2: Selected via GEMINI_MODEL")
+    previous = os.environ.get("GEMINI_MODEL")
+    os.environ["GEMINI_MODEL"] = OFFLINE_MODEL
+    try:
+        assert ModelConfig.get_model_name("gemini-1.5-pro") == OFFLINE_MODEL
+        pool = ModelPool(ModelConfig(), limiter=RateLimiter(rpm=10 ** 6, path=":memory:"))
+        assert [handle.name for handle in pool.ranked("gemini-1.5-pro")] == [OFFLINE_MODEL]
+        router = pool.router("gemini-1.5-pro")
+        assert router.generate_content(SPECIALTY_PROMPT).text == "Gastroenterologist"
+        assert isinstance(pool.get(OFFLINE_MODEL).model, OfflineGenerativeModel)
+        assert pool.stats()["models"][OFFLINE_MODEL]["offline_backend"]["calls"] == 1
+    finally:
+        if previous is None:
+            del os.environ["GEMINI_MODEL"]
+        else:
+            os.environ["GEMINI_MODEL"] = previous
+    assert ModelConfig.get_model_name() != OFFLINE_MODEL
+    print("✅ Offline backend served the pool without touching Gemini")
+
+
+def test_injected_errors_are_repeatable():
+    """Test 3: The injected error rate holds and a seed replays the same run"""
+    print("🧪 TEST 3: Injected errors")
+
+    def run(seed):
+        model = OfflineGenerativeModel(error_rate=0.25, seed=seed)
+        outcomes = []
+        for i in range(400):
+            try:
+                model.generate_content(f"prompt {i}")
+                outcomes.append(True)
+            except Exception as e:
+                assert "503" in str(e)
+                outcomes.append(False)
+        return outcomes
+
+    first = run(seed=7)
+    assert first == run(seed=7)
+    assert 70 <= first.count(False) <= 130
+    print(f"✅ {first.count(False)} of 400 calls failed, same run replayed from the seed")
+
+
+def test_injected_latency_and_timeout():
+    """Test 4: Latency is injected on both clients and a too-short timeout gives a 504"""
+    print("🧪 TEST 4: Injected latency")
+    model = OfflineGenerativeModel(latency_ms=50, tail_ms=10, seed=1)
+    started = time.monotonic()
+    model.generate_content("fever")
+    assert time.monotonic() - started >= 0.05
+
+    async def concurrent():
+        started = time.monotonic()
+        await asyncio.gather(*(model.generate_content_async(f"fever {i}") for i in range(20)))
+        return time.monotonic() - started
+
+    assert asyncio.run(concurrent()) < 0.5
+    try:
+        model.generate_content("fever", request_options={"timeout": 0.01})
+        assert False, "expected the call to time out"
+    except Exception as e:
+        assert "504" in str(e)
+    print("✅ Latency injected and timeouts honoured")
+
+
+def main():
+    print("🧪 Offline Model Test Suite")
+    print("=" * 50)
+    test_prompt_families()
+    test_selected_through_model_config()
+    test_injected_errors_are_repeatable()
+    test_injected_latency_and_timeout()
+    print("\n🎉 All offline model tests passed!")
+
+
+if __name__ == "__main__":
+    main()
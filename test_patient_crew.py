@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Test that each session's PatientCrew keeps its own agents and tasks out of CrewAI's global cache
+"""
+
+import importlib.util
+import os
+import sys
+import types
+
+import crewai
+from crewai.project.utils import cache as crewai_memoize_cache
+
+# crew.py imports its tools as tools.*, while this checkout keeps those modules next to it
+if "tools" not in sys.modules and importlib.util.find_spec("tools") is None:
+    tools_package = types.ModuleType("tools")
+    tools_package.__path__ = [os.path.dirname(os.path.abspath(__file__))]
+    sys.modules["tools"] = tools_package
+
+from crew import PatientCrew
+from tools.custom_tool import UserInputTool
+
+
+def memoized_entries() -> int:
+    # Only read to pin the behaviour on the installed CrewAI version
+    return len(crewai_memoize_cache._cache)
+
+
+def test_components_live_on_the_crew_instance():
+    """Test 1: Agents and tasks are built once per crew and never shared between crews"""
+    print(f"🧪 TEST 1: Session-scoped components (crewai {crewai.__version__})")
+    before = memoized_entries()
+    first = PatientCrew(user_input_tool=UserInputTool())
+    second = PatientCrew(user_input_tool=UserInputTool())
+
+    assert first.patient_info_collector() is first.patient_info_collector()
+    assert first.patient_info_collector() is not second.patient_info_collector()
+    assert first.patient_info_collector().tools[0] is first.user_input_tool
+    assert second.patient_info_collector().tools[0] is second.user_input_tool
+    assert first.collect_info_task().agent is first.patient_info_collector()
+    assert first.analyze_symptoms_task().context == [first.collect_info_task()]
+    assert first.collect_info_task().name == "collect_info_task"
+    assert memoized_entries() == before
+    print("✅ Each crew built its own components and CrewAI's cache did not grow")
+
+
+def test_crew_base_still_finds_components():
+    """Test 2: CrewBase still sees every agent and task, so crew() assembles the full crew"""
+    print("🧪 TEST 2: CrewBase metadata")
+    patient_crew = PatientCrew()
+    assert len(patient_crew.__crew_metadata__["original_agents"]) == 7
+    assert len(patient_crew.__crew_metadata__["original_tasks"]) == 8
+
+    full_crew = patient_crew.crew()
+    assert len(full_crew.agents) == 7 and len(full_crew.tasks) == 8
+    assert full_crew.tasks[0] is patient_crew.collect_info_task()
+    print("✅ crew() assembled 7 agents and 8 tasks")
+
+
+def main():
+    print("🧪 Patient Crew Test Suite")
+    print("=" * 50)
+    test_components_live_on_the_crew_instance()
+    test_crew_base_still_finds_components()
+    print("\n🎉 All patient crew tests passed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Test the emergency priority lane for LLM calls and crew runs
+"""
+
+import asyncio
+import threading
+import time
+
+from priority_scheduler import (
+    ConversationPriority, PriorityGate, EMERGENCY, URGENT, ROUTINE, level_for_assessment
+)
+from crew_executor import CrewExecutor, CrewQueueFullError
+
+
+def start_waiter(gate, priority, order):
+    def call():
+        with gate.slot(priority):
+            order.append(priority.conversation_id)
+    thread = threading.Thread(target=call)
+    thread.start()
+    time.sleep(0.05)
+    return thread
+
+
+def test_gate_serves_emergencies_first():
+    """Test 1: An emergency waiting behind routine calls gets the next free slot"""
+    print("🧪 TEST 1: Emergency calls jump the LLM queue")
+    gate = PriorityGate("test", capacity=1)
+    order = []
+
+    gate.acquire(ConversationPriority("holder"))
+    threads = [start_waiter(gate, ConversationPriority(f"routine-{i}"), order) for i in range(3)]
+    threads.append(start_waiter(gate, ConversationPriority("emergency", EMERGENCY), order))
+    gate.release()
+    for thread in threads:
+        thread.join(5)
+
+    assert order == ["emergency", "routine-0", "routine-1", "routine-2"]
+    assert gate.stats()["wait_ms"]["emergency"]["count"] == 1
+    print("✅ Emergency admitted first")
+
+
+def test_reserved_slot_and_escalation():
+    """Test 2: Routine calls never take the reserved slot, and escalation reorders waiters"""
+    print("🧪 TEST 2: Reserved slot and escalation while waiting")
+    gate = PriorityGate("test", capacity=2, reserved=1)
+    order = []
+
+    gate.acquire(ConversationPriority("routine-holder"))
+    waiting = ConversationPriority("routine-waiting")
+    thread = start_waiter(gate, waiting, order)
+    assert order == []  # the second slot is kept for priority work
+
+    # Escalation takes effect at the next hand-off
+    waiting.escalate(URGENT)
+    gate.release()
+    thread.join(5)
+    assert order == ["routine-waiting"]
+
+    # An emergency arriving while routine work holds the unreserved slot starts at once
+    gate.acquire(ConversationPriority("routine-holder"))
+    started = time.monotonic()
+    with gate.slot(ConversationPriority("emergency", EMERGENCY)):
+        assert time.monotonic() - started < 0.05
+    gate.release()
+    print("✅ Reserved slot kept for escalated conversations")
+
+
+def test_assessment_levels():
+    """Test 3: Symptom assessments map to priority levels"""
+    print("🧪 TEST 3: Assessment levels")
+    assert level_for_assessment({"severity": "High", "urgency": "Soon"}) == URGENT
+    assert level_for_assessment({"severity": "Low", "urgency": "Urgent"}) == URGENT
+    assert level_for_assessment({"severity": "Mild", "urgency": "Routine"}) == ROUTINE
+    assert level_for_assessment({}) == ROUTINE
+    print("✅ Assessment levels mapped")
+
+
+def test_crew_executor_priority_lane():
+    """Test 4: Escalated crews use the reserved worker and displace routine waiters"""
+    print("🧪 TEST 4: Crew executor priority lane")
+
+    async def scenario():
+        executor = CrewExecutor(max_workers=2, max_queue=1, reserved_workers=1)
+        release = threading.Event()
+
+        routine_run = asyncio.ensure_future(executor.run(release.wait, priority=ConversationPriority("routine-1")))
+        await asyncio.sleep(0.05)
+        routine_waiting = asyncio.ensure_future(executor.run(release.wait, priority=ConversationPriority("routine-2")))
+        await asyncio.sleep(0.05)
+        assert executor.stats()["queued_by_priority"] == {"routine": 1}
+
+        # The emergency starts on the reserved worker without waiting
+        emergency_run = asyncio.ensure_future(
+            executor.run(release.wait, priority=ConversationPriority("emergency-1", EMERGENCY))
+        )
+        await asyncio.sleep(0.05)
+        assert executor.stats()["running"] == 2
+
+        # With every worker busy and the line full, another emergency displaces the routine waiter
+        second_emergency = asyncio.ensure_future(
+            executor.run(lambda: "done", priority=ConversationPriority("emergency-2", EMERGENCY))
+        )
+        try:
+            await asyncio.wait_for(routine_waiting, 1)
+            assert False, "routine waiter should have been displaced"
+        except CrewQueueFullError:
+            pass
+        assert executor.stats()["queued_by_priority"] == {"emergency": 1}
+
+        release.set()
+        await routine_run
+        await emergency_run
+        assert await second_emergency == "done"
+        stats = executor.stats()
+        assert stats["queue_wait_ms_by_priority"]["emergency"]["count"] == 2
+        assert stats["rejected"] == 1
+        executor.shutdown()
+
+    asyncio.run(scenario())
+    print("✅ Emergencies admitted ahead of routine crews")
+
+
+def main():
+    print("🧪 Priority Scheduler Test Suite")
+    print("=" * 50)
+    test_gate_serves_emergencies_first()
+    test_reserved_slot_and_escalation()
+    test_assessment_levels()
+    test_crew_executor_priority_lane()
+    print("\n🎉 All priority scheduler tests passed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Test the shared token-bucket rate limiter for the Gemini quota
+"""
+
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from model_config import ModelPool, ModelConfig
+from priority_scheduler import EMERGENCY, ROUTINE
+import rate_limiter as rate_limiter_module
+from rate_limiter import RateLimiter, RateLimitExceededError, estimate_tokens
+
+
+class UsageModel:
+    """Stand-in for genai.GenerativeModel that reports token usage"""
+
+    def __init__(self, total_tokens: int = 0):
+        self.total_tokens = total_tokens
+        self.calls = 0
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        usage = type("Usage", (), {"total_token_count": self.total_tokens})()
+        return type("Response", (), {"text": f"answer to {prompt}", "usage_metadata": usage})()
+
+
+class FakeClock:
+    """Stands in for the time module so minutes of traffic run instantly"""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+
+def test_requests_per_minute():
+    """Test 1: Calls beyond the bucket wait for it to refill"""
+    print("🧪 TEST 1: Requests per minute")
+    # 600 rpm x 0.5 headroom = a bucket of 5 requests refilling at 5 per second
+    limiter = RateLimiter(rpm=600, tpm=10 ** 9, path=":memory:", headroom=0.5, reserve=0.0, burst=1)
+    started = time.monotonic()
+    for _ in range(5):
+        limiter.acquire("gemini-1.5-flash", 10, level=ROUTINE)
+    assert time.monotonic() - started < 0.1
+
+    waited = limiter.acquire("gemini-1.5-flash", 10, level=ROUTINE)
+    assert 0.1 <= waited < 1.0
+    # Buckets are per model
+    assert limiter.acquire("gemini-1.5-pro", 10, level=ROUTINE) < 0.05
+    stats = limiter.stats()
+    assert stats["calls"] == 7 and stats["throttled_by_priority"]["routine"] == 1
+    print(f"✅ Sixth call waited {waited * 1000:.0f}ms for the bucket to refill")
+
+
+def test_tokens_per_minute_and_settle():
+    """Test 2: Large prompts draw down the token bucket and real usage corrects the estimate"""
+    print("🧪 TEST 2: Tokens per minute")
+    assert estimate_tokens(("x" * 400,), {"generation_config": {"max_output_tokens": 100}}) == 201
+
+    limiter = RateLimiter(rpm=10 ** 6, tpm=6000, path=":memory:", headroom=1.0, reserve=0.0, max_wait=0.5, burst=60)
+    limiter.acquire("gemini-1.5-flash", 5000, level=ROUTINE)
+    # 1000 tokens left, refilling at 100/s: a 3000 token call cannot make it within max_wait
+    try:
+        limiter.acquire("gemini-1.5-flash", 3000, level=ROUTINE)
+        assert False, "expected the limiter to give up"
+    except RateLimitExceededError as e:
+        assert "429" in str(e)
+
+    # The call only used 1000 tokens, so 4000 come back
+    limiter.settle("gemini-1.5-flash", 5000, 1000)
+    assert limiter.acquire("gemini-1.5-flash", 3000, level=ROUTINE) < 0.05
+    assert limiter.stats()["timeouts"] == 1
+    print("✅ Token budget enforced and corrected from reported usage")
+
+
+def test_shared_across_workers():
+    """Test 3: Two limiters on the same file (two API workers) share one budget"""
+    print("🧪 TEST 3: Shared across workers")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "rate_limit.db")
+        worker_a = RateLimiter(rpm=60, tpm=10 ** 9, path=path, headroom=0.05, reserve=0.0, max_wait=0.2, burst=60)
+        worker_b = RateLimiter(rpm=60, tpm=10 ** 9, path=path, headroom=0.05, reserve=0.0, max_wait=0.2, burst=60)
+        # A bucket of 3 requests refilling at one every 20 seconds
+        worker_a.acquire("gemini-1.5-flash", 10, level=ROUTINE)
+        worker_b.acquire("gemini-1.5-flash", 10, level=ROUTINE)
+        worker_a.acquire("gemini-1.5-flash", 10, level=ROUTINE)
+        try:
+            worker_b.acquire("gemini-1.5-flash", 10, level=ROUTINE)
+            assert False, "expected the shared bucket to be empty"
+        except RateLimitExceededError:
+            pass
+        assert worker_a.stats()["buckets"]["gemini-1.5-flash"]["requests_available"] < 1
+    print("✅ Workers drew from the same bucket")
+
+
+def test_reserve_for_emergencies():
+    """Test 4: Routine calls leave the reserve to emergencies and wait behind them"""
+    print("🧪 TEST 4: Priority-aware waiting")
+    # A bucket of 10 requests refilling at 10 per second, 2 kept back from routine calls
+    limiter = RateLimiter(rpm=600, tpm=10 ** 9, path=":memory:", headroom=1.0, reserve=0.2, burst=1)
+    for _ in range(8):
+        limiter.acquire("gemini-1.5-flash", 10, level=ROUTINE)
+    assert limiter.acquire("gemini-1.5-flash", 10, level=EMERGENCY) < 0.05
+
+    order = []
+
+    def call(name, level, delay):
+        time.sleep(delay)
+        limiter.acquire("gemini-1.5-flash", 10, level=level)
+        order.append(name)
+
+    # Drain the bucket so everyone has to wait, then queue routine calls ahead of an emergency
+    limiter.acquire("gemini-1.5-flash", 10, level=EMERGENCY)
+    threads = [threading.Thread(target=call, args=(f"routine-{i}", ROUTINE, 0)) for i in range(3)]
+    threads.append(threading.Thread(target=call, args=("emergency", EMERGENCY, 0.02)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert order[0] == "emergency", order
+    print(f"✅ Admission order under pressure: {order}")
+
+
+def test_pool_routes_on_exhausted_quota():
+    """Test 5: A model out of quota is skipped by the router without tripping its breaker"""
+    print("🧪 TEST 5: Router and limiter")
+    limiter = RateLimiter(rpm=60, tpm=10 ** 9, path=":memory:", headroom=0.05, reserve=0.0, max_wait=0.1, burst=60)
+    pool = ModelPool(ModelConfig(), limiter=limiter)
+    models = {name: UsageModel(total_tokens=50) for name in ModelConfig.FALLBACK_MODELS}
+    for name, model in models.items():
+        pool.get(name)._model = model
+    router = pool.router("gemini-1.5-flash")
+
+    for i in range(5):
+        assert router.generate_content(f"prompt {i}").text.startswith("answer")
+    assert models["gemini-1.5-flash"].calls == 3
+    assert sum(model.calls for model in models.values()) == 5
+    assert pool.get("gemini-1.5-flash").breaker.state == "closed"
+    assert pool.stats()["rate_limit"]["timeouts"] == 2
+    print("✅ Calls moved to the next model once the first ran out of quota")
+
+
+def test_default_burst_stays_under_rpm():
+    """Test 6: With the default burst no 60 second span grants more calls than the RPM limit"""
+    print("🧪 TEST 6: Grants per minute at the defaults")
+    clock = FakeClock()
+    limiter = RateLimiter(rpm=60, tpm=10 ** 9, path=":memory:", reserve=0.0)
+    grants = []
+    rate_limiter_module.time = clock
+    try:
+        # A caller that asks every 10ms for three minutes and never waits
+        while clock.now < 1_000_180.0:
+            try:
+                limiter.acquire("gemini-1.5-flash", 10, level=ROUTINE, timeout=0)
+                grants.append(clock.now)
+            except RateLimitExceededError:
+                pass
+            clock.now += 0.01
+    finally:
+        rate_limiter_module.time = time
+
+    busiest = max(sum(1 for other in grants if start <= other < start + 60) for start in grants)
+    assert busiest <= 60, busiest
+    assert len(grants) >= 150
+    print(f"✅ {len(grants)} calls in 3 minutes, at most {busiest} in any 60 seconds")
+
+
+def test_async_waits_off_the_loop():
+    """Test 7: A worker holding the database lock does not stall the event loop of an async caller"""
+    print("🧪 TEST 7: Async acquire off the loop")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "rate_limit.db")
+        limiter = RateLimiter(rpm=600, tpm=10 ** 9, path=path, reserve=0.0)
+        limiter.acquire("gemini-1.5-flash", 10, level=ROUTINE)
+
+        async def scenario():
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            ticking = asyncio.ensure_future(ticker())
+            # Another worker sits inside a write transaction for 0.5s
+            blocker = sqlite3.connect(path, isolation_level=None)
+            blocker.execute("BEGIN IMMEDIATE")
+            asyncio.get_running_loop().call_later(0.5, blocker.execute, "ROLLBACK")
+            await limiter.acquire_async("gemini-1.5-flash", 10, level=ROUTINE)
+            await limiter.settle_async("gemini-1.5-flash", 10, 4)
+            ticking.cancel()
+            blocker.close()
+            return ticks
+
+        ticks = asyncio.run(scenario())
+        assert ticks >= 20, ticks
+        assert limiter.stats()["calls"] == 2
+    print(f"✅ Event loop ticked {ticks} times while the quota table was locked")
+
+
+def main():
+    print("🧪 Rate Limiter Test Suite")
+    print("=" * 50)
+    test_requests_per_minute()
+    test_tokens_per_minute_and_settle()
+    test_shared_across_workers()
+    test_reserve_for_emergencies()
+    test_pool_routes_on_exhausted_quota()
+    test_default_burst_stays_under_rpm()
+    test_async_waits_off_the_loop()
+    print("\n🎉 All rate limiter tests passed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Test the bounded session store used by the API for conversation state
+"""
+
+import time
+from session_store import SessionStore
+
+
+def test_capacity_eviction():
+    """Test 1: The least recently used session is evicted when the store is full"""
+    print("🧪 TEST 1: Capacity eviction")
+    evicted = []
+    store = SessionStore("test", max_sessions=2, idle_ttl=60, on_evict=lambda key, value: evicted.append(key))
+
+    store["a"] = {"status": "running"}
+    store["b"] = {"status": "running"}
+    store.get("a")  # "b" is now the least recently used
+    store["c"] = {"status": "running"}
+
+    assert "a" in store and "c" in store
+    assert "b" not in store
+    assert evicted == ["b"]
+    assert store.stats()["evicted_capacity"] == 1
+    print("✅ Least recently used session evicted")
+
+
+def test_idle_ttl_eviction():
+    """Test 2: Sessions idle for longer than the TTL are swept"""
+    print("🧪 TEST 2: Idle TTL eviction")
+    store = SessionStore("test", max_sessions=10, idle_ttl=0.05)
+
+    store["old"] = "script"
+    time.sleep(0.1)
+    store["new"] = "script"
+
+    assert "old" not in store
+    assert store.get("new") == "script"
+    stats = store.stats()
+    assert stats["live_sessions"] == 1
+    assert stats["evicted_idle"] == 1
+    print("✅ Idle session evicted")
+
+
+def test_nested_state_updates():
+    """Test 3: Values are returned by reference so conversation state can be updated in place"""
+    print("🧪 TEST 3: In-place updates and most recent entry")
+    store = SessionStore("test", max_sessions=10, idle_ttl=60)
+
+    store["conv-1"] = {"status": "running"}
+    store["conv-2"] = {"status": "running"}
+    store["conv-1"]["patient_info"] = "{}"
+
+    assert store["conv-1"] == {"status": "running", "patient_info": "{}"}
+    assert store.most_recent()[0] == "conv-1"
+    assert store.pop("conv-1")["patient_info"] == "{}"
+    assert store.stats()["removed"] == 1
+    print("✅ In-place updates preserved")
+
+
+def main():
+    print("🧪 Session Store Test Suite")
+    print("=" * 50)
+    test_capacity_eviction()
+    test_idle_ttl_eviction()
+    test_nested_state_updates()
+    print("\n🎉 All session store tests passed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+Test the shared state backends used to run the API with several workers
+"""
+
+import asyncio
+import contextvars
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from state_backend import InMemoryStateBackend, SQLiteStateBackend, RedisStateBackend
+from conversation_channel import ConversationChannel, ConversationClosedError, set_current_channel, current_channel
+
+
+class LocalRedisStandIn:
+    """Minimal single-process stand-in for the Redis commands the backend uses"""
+
+    def __init__(self):
+        self.values = {}
+        self.sorted_sets = {}
+        self.lists = {}
+        self.condition = threading.Condition()
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    def delete(self, key):
+        self.values.pop(key, None)
+        self.lists.pop(key, None)
+
+    def expire(self, key, seconds):
+        pass
+
+    def zadd(self, key, mapping):
+        self.sorted_sets.setdefault(key, {}).update(mapping)
+
+    def zrem(self, key, member):
+        self.sorted_sets.get(key, {}).pop(member, None)
+
+    def _ranked(self, key):
+        return sorted(self.sorted_sets.get(key, {}).items(), key=lambda item: item[1])
+
+    def zremrangebyscore(self, key, low, high):
+        for member, score in self._ranked(key):
+            if low <= score <= high:
+                self.zrem(key, member)
+
+    def zremrangebyrank(self, key, start, stop):
+        for member, _ in self._ranked(key)[start:stop + 1]:
+            self.zrem(key, member)
+
+    def zcard(self, key):
+        return len(self.sorted_sets.get(key, {}))
+
+    def zrange(self, key, start, stop):
+        return [member for member, _ in self._ranked(key)[start:stop + 1]]
+
+    def zrevrange(self, key, start, stop):
+        return [member for member, _ in reversed(self._ranked(key))][start:stop + 1]
+
+    def rpush(self, key, value):
+        with self.condition:
+            self.lists.setdefault(key, []).append(value)
+            self.condition.notify_all()
+
+    def blpop(self, keys, timeout=0):
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while True:
+                for key in keys:
+                    if self.lists.get(key):
+                        return key, self.lists[key].pop(0)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+
+    def pipeline(self):
+        return LocalPipelineStandIn(self)
+
+
+class LocalPipelineStandIn:
+    """Transaction stand-in: holding the client's lock from WATCH to EXEC makes it atomic"""
+
+    def __init__(self, client):
+        self.client = client
+        self.queued = []
+        self.watching = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.reset()
+
+    def watch(self, key):
+        self.client.condition.acquire()
+        self.watching = True
+
+    def unwatch(self):
+        self.reset()
+
+    def reset(self):
+        if self.watching:
+            self.client.condition.release()
+            self.watching = False
+        self.queued = []
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def multi(self):
+        pass
+
+    def set(self, key, value, ex=None):
+        self.queued.append((key, value, ex))
+
+    def execute(self):
+        for key, value, ex in self.queued:
+            self.client.set(key, value, ex=ex)
+        self.reset()
+
+
+def check_backend(backend):
+    """Shared checks every backend must pass"""
+    backend.set("conversation_state", "conv-1", {"status": "running"})
+    backend.update("conversation_state", "conv-1", {"patient_info": "{\"name\": \"Asha\"}"})
+    assert backend.get("conversation_state", "conv-1") == {"status": "running", "patient_info": "{\"name\": \"Asha\"}"}
+
+    backend.set("ai_doctor_scripts", "conv-1", "Stay calm, help is on the way.")
+    backend.set("ai_doctor_scripts", "conv-2", "Drink warm fluids.")
+    assert backend.most_recent("ai_doctor_scripts") == ("conv-2", "Drink warm fluids.")
+
+    backend.delete("ai_doctor_scripts", "conv-2")
+    assert backend.get("ai_doctor_scripts", "conv-2") is None
+
+    # An answer pushed by one worker wakes the crew thread waiting on another
+    answers = []
+    waiter = threading.Thread(target=lambda: answers.append(backend.wait_for_response("conv-1", 5)))
+    waiter.start()
+    time.sleep(0.1)
+    backend.push_response("conv-1", "Pune")
+    waiter.join(5)
+    assert answers == ["Pune"]
+    assert backend.wait_for_response("conv-1", 0.1) is None
+
+    # Of several sockets racing to start a conversation exactly one claims it
+    claims = []
+    barrier = threading.Barrier(8)
+
+    def claim():
+        barrier.wait()
+        claims.append(backend.claim("conversation_state", "conv-3", "crew_started", {"status": "running"}))
+
+    threads = [threading.Thread(target=claim) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert claims.count(True) == 1
+    assert backend.get("conversation_state", "conv-3") == {"status": "running", "crew_started": True}
+
+    # Clearing the flag after a failed crew lets the conversation be started again
+    backend.update("conversation_state", "conv-3", {"status": "failed", "crew_started": False})
+    assert backend.claim("conversation_state", "conv-3", "crew_started", {"status": "running"})
+    assert backend.get("conversation_state", "conv-3") == {"status": "running", "crew_started": True}
+
+    # Concurrent read-modify-writes of one record never lose an update
+    backend.set("booking_jobs", "job-1", {"steps": {}})
+
+    def finish_step(step):
+        barrier.wait()
+        backend.modify("booking_jobs", "job-1", lambda job: {**job, "steps": {**job["steps"], step: "completed"}})
+
+    barrier = threading.Barrier(8)
+    threads = [threading.Thread(target=finish_step, args=(f"step-{i}",)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(backend.get("booking_jobs", "job-1")["steps"]) == 8
+    assert backend.modify("booking_jobs", "missing", lambda job: None) is None
+    assert backend.get("booking_jobs", "missing") is None
+
+
+def test_memory_backend():
+    """Test 1: In-memory backend"""
+    print("🧪 TEST 1: In-memory backend")
+    check_backend(InMemoryStateBackend())
+    print("✅ In-memory backend passed")
+
+
+def test_sqlite_backend():
+    """Test 2: SQLite backend shared through a database file"""
+    print("🧪 TEST 2: SQLite backend")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "state.db")
+        check_backend(SQLiteStateBackend(path))
+
+        # A second connection (another worker) sees the same state
+        writer = SQLiteStateBackend(path)
+        reader = SQLiteStateBackend(path)
+        writer.set("conversation_state", "conv-9", {"status": "completed"})
+        assert reader.get("conversation_state", "conv-9") == {"status": "completed"}
+
+        # Polling an empty answer queue never waits on another worker's write transaction
+        blocker = sqlite3.connect(path, isolation_level=None)
+        blocker.execute("BEGIN IMMEDIATE")
+        started = time.monotonic()
+        assert reader.wait_for_response("conv-9", 0.5) is None
+        assert time.monotonic() - started < 1.0
+        blocker.execute("ROLLBACK")
+        blocker.close()
+    print("✅ SQLite backend passed")
+
+
+def test_redis_backend():
+    """Test 3: Redis backend against a local stand-in"""
+    print("🧪 TEST 3: Redis backend")
+    check_backend(RedisStateBackend(client=LocalRedisStandIn()))
+
+    bounded = RedisStateBackend(client=LocalRedisStandIn(), max_sessions=2)
+    for conversation_id in ["a", "b", "c"]:
+        bounded.set("conversation_state", conversation_id, {"status": "running"})
+        time.sleep(0.01)
+    assert bounded.get("conversation_state", "a") is None
+    assert bounded.stats()["evicted_capacity"] == 1
+    print("✅ Redis backend passed")
+
+
+def test_channel_close_releases_waiter():
+    """Test 4: Closing a conversation channel releases the waiting crew thread"""
+    print("🧪 TEST 4: Channel close")
+    channel = ConversationChannel(None, None, "conv-1", backend=InMemoryStateBackend())
+    errors = []
+
+    def wait():
+        try:
+            channel.wait_for_answer()
+        except ConversationClosedError as e:
+            errors.append(e)
+
+    waiter = threading.Thread(target=wait)
+    waiter.start()
+    time.sleep(0.1)
+    channel.close()
+    waiter.join(5)
+    assert len(errors) == 1
+    print("✅ Waiting thread released")
+
+
+def test_close_marker_is_per_channel():
+    """Test 5: Stale or forged close markers never close a new channel"""
+    print("🧪 TEST 5: Per-channel close marker")
+    backend = InMemoryStateBackend()
+
+    # A channel that closed with nobody waiting leaves its marker queued behind it
+    ConversationChannel(None, None, "conv-2", backend=backend).close()
+    reopened = ConversationChannel(None, None, "conv-2", backend=backend)
+    backend.push_response("conv-2", {"__conversation_closed__": True})
+    backend.push_response("conv-2", "I have a headache")
+    assert reopened.wait_for_answer(timeout=1) == "I have a headache"
+    print("✅ Stale and forged markers ignored")
+
+
+def test_failed_send_closes_channel():
+    """Test 6: A crew thread that cannot reach the client closes the conversation it works for"""
+    print("🧪 TEST 6: Failed send")
+
+    class DisconnectedSocket:
+        async def send_text(self, text):
+            raise RuntimeError("WebSocket is not connected")
+
+    loop = asyncio.new_event_loop()
+    runner = threading.Thread(target=loop.run_forever, daemon=True)
+    runner.start()
+    try:
+        channel = ConversationChannel(DisconnectedSocket(), loop, "conv-3", backend=InMemoryStateBackend())
+        set_current_channel(channel)
+        context = contextvars.copy_context()
+        seen = []
+
+        def crew_thread():
+            seen.append(current_channel())
+            try:
+                channel.ask("Where does it hurt?")
+            except ConversationClosedError as e:
+                seen.append(e)
+
+        worker = threading.Thread(target=lambda: context.run(crew_thread))
+        worker.start()
+        worker.join(5)
+        assert seen[0] is channel and isinstance(seen[1], ConversationClosedError)
+        assert channel.closed
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        runner.join(5)
+        loop.close()
+    print("✅ Channel closed and visible to the crew thread")
+
+
+def test_namespace_async_calls_leave_the_loop():
+    """Test 7: The namespace's async variants never run backend I/O on the event loop thread"""
+    print("🧪 TEST 7: Async namespace calls")
+
+    class RecordingBackend(InMemoryStateBackend):
+        def __init__(self):
+            super().__init__()
+            self.threads = set()
+
+        def get(self, namespace, key, default=None):
+            self.threads.add(threading.get_ident())
+            return super().get(namespace, key, default)
+
+        def set(self, namespace, key, value):
+            self.threads.add(threading.get_ident())
+            super().set(namespace, key, value)
+
+    backend = RecordingBackend()
+    state = backend.namespace("conversation_state")
+
+    async def scenario():
+        assert await state.claim_async("conv-4", "crew_started", {"status": "running"})
+        assert not await state.claim_async("conv-4", "crew_started", {"status": "running"})
+        assert (await state.update_async("conv-4", {"status": "completed"}))["status"] == "completed"
+        assert await state.contains_async("conv-4")
+        assert (await state.pop_async("conv-4"))["crew_started"] is True
+        assert await state.get_async("conv-4") is None
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(scenario())
+    assert backend.threads and loop_thread not in backend.threads
+    print("✅ Backend calls ran in worker threads")
+
+
+def main():
+    print("🧪 State Backend Test Suite")
+    print("=" * 50)
+    test_memory_backend()
+    test_sqlite_backend()
+    test_redis_backend()
+    test_channel_close_releases_waiter()
+    test_close_marker_is_per_channel()
+    test_failed_send_closes_channel()
+    test_namespace_async_calls_leave_the_loop()
+    print("\n🎉 All state backend tests passed!")
+
+
+if __name__ == "__main__":
+    main()
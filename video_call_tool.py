@@ -1,3 +1,4 @@
+import asyncio
 import json
 import os
 import requests
@@ -7,7 +8,7 @@ from typing import Type
 from pydantic import BaseModel, Field
 from crewai.tools import BaseTool
 import google.generativeai as genai
-from model_config import get_model_with_retry
+from model_config import get_model_with_retry, run_coroutine
 import urllib3
 
 # Disable SSL warnings
@@ -27,11 +28,14 @@ class VideoCallTool(BaseTool):
     args_schema: Type[BaseModel] = VideoCallInput
 
     def _run(self, patient_info: dict, emergency_type: str, ai_doctor_script: str) -> str:
+        return run_coroutine(self._arun(patient_info, emergency_type, ai_doctor_script))
+
+    async def _arun(self, patient_info: dict, emergency_type: str, ai_doctor_script: str) -> str:
         try:
             print("📹 EMERGENCY VIDEO CALL TOOL ACTIVATED")
             
             # Check if this is a genuine emergency that requires AI virtual doctor
-            is_emergency = self._verify_emergency_status(patient_info, emergency_type)
+            is_emergency = await self._verify_emergency_status(patient_info, emergency_type)
             
             if not is_emergency:
                 return json.dumps({
@@ -43,20 +47,20 @@ class VideoCallTool(BaseTool):
             
             print("🚨 EMERGENCY CONFIRMED - ACTIVATING AI VIRTUAL DOCTOR")
             
-            # Generate dynamic video call setup
-            video_call_setup = self._generate_video_call_setup(patient_info, emergency_type, ai_doctor_script)
+            # Generate dynamic video call setup and the doctor briefing concurrently
+            video_call_setup, doctor_briefing = await asyncio.gather(
+                self._generate_video_call_setup(patient_info, emergency_type, ai_doctor_script),
+                self._generate_doctor_briefing(patient_info, emergency_type, ai_doctor_script)
+            )
             
             # Create video call link using free service
             video_call_link = self._create_video_call_link(patient_info, emergency_type)
             
-            # Generate doctor briefing
-            doctor_briefing = self._generate_doctor_briefing(patient_info, emergency_type, ai_doctor_script)
-            
             # Send real-time notifications to available doctors
-            doctor_notifications = self._notify_available_doctors(patient_info, emergency_type, video_call_link)
+            doctor_notifications = await self._notify_available_doctors(patient_info, emergency_type, video_call_link)
             
             # Create real-time monitoring session
-            monitoring_session = self._create_monitoring_session(patient_info, emergency_type)
+            monitoring_session = await asyncio.to_thread(self._create_monitoring_session, patient_info, emergency_type)
             
             result = {
                 "video_call_created": True,
@@ -83,7 +87,7 @@ class VideoCallTool(BaseTool):
                 "message": "Video call setup failed. Please use phone consultation."
             })
 
-    def _generate_video_call_setup(self, patient_info: dict, emergency_type: str, ai_doctor_script: str) -> dict:
+    async def _generate_video_call_setup(self, patient_info: dict, emergency_type: str, ai_doctor_script: str) -> dict:
         """Generate dynamic video call setup instructions"""
         try:
             model = get_model_with_retry()
@@ -112,7 +116,7 @@ class VideoCallTool(BaseTool):
             }}
             """
             
-            response = model.generate_content(prompt)
+            response = await model.generate_content_async(prompt)
             result_text = response.text.strip()
             
             try:
@@ -163,7 +167,7 @@ class VideoCallTool(BaseTool):
                 "error": str(e)
             }
 
-    def _generate_doctor_briefing(self, patient_info: dict, emergency_type: str, ai_doctor_script: str) -> str:
+    async def _generate_doctor_briefing(self, patient_info: dict, emergency_type: str, ai_doctor_script: str) -> str:
         """Generate briefing for the doctor joining the video call"""
         try:
             model = get_model_with_retry()
@@ -189,7 +193,7 @@ class VideoCallTool(BaseTool):
             Format as a professional medical briefing.
             """
             
-            response = model.generate_content(prompt)
+            response = await model.generate_content_async(prompt)
             return response.text.strip()
             
         except Exception as e:
@@ -205,7 +209,7 @@ class VideoCallTool(BaseTool):
             Please assess patient immediately upon joining video call.
             """
 
-    def _verify_emergency_status(self, patient_info: dict, emergency_type: str) -> bool:
+    async def _verify_emergency_status(self, patient_info: dict, emergency_type: str) -> bool:
         """Verify if this is a genuine emergency that requires AI virtual doctor"""
         try:
             model = get_model_with_retry()
@@ -253,7 +257,7 @@ class VideoCallTool(BaseTool):
             CRITICAL: Be very strict. Only activate AI Virtual Doctor for genuine life-threatening emergencies that require immediate medical intervention.
             """
             
-            response = model.generate_content(prompt)
+            response = await model.generate_content_async(prompt)
             result_text = response.text.strip()
             
             try:
@@ -308,7 +312,7 @@ class VideoCallTool(BaseTool):
             ]
         } 
 
-    def _notify_available_doctors(self, patient_info: dict, emergency_type: str, video_call_link: dict) -> dict:
+    async def _notify_available_doctors(self, patient_info: dict, emergency_type: str, video_call_link: dict) -> dict:
         """Setup AI virtual doctor for video call"""
         try:
             # Import AI virtual doctor tool
@@ -322,7 +326,7 @@ class VideoCallTool(BaseTool):
             severity_level = patient_info.get('severity_level', 'Medium')
             
             # Generate AI doctor setup
-            ai_doctor_result = ai_doctor_tool._run(
+            ai_doctor_result = await ai_doctor_tool._arun(
                 patient_info=patient_info,
                 emergency_type=emergency_type,
                 symptoms=symptoms,